@@ -1,56 +1,193 @@
 import streamlit as st
 import uuid
-from datetime import datetime, time
-import requests
-from bs4 import BeautifulSoup
+from datetime import datetime
 from urllib.parse import urljoin, urlparse
 import re
 import tempfile
 import os
 import asyncio
-import PyPDF2
-import fitz  # PyMuPDF
-from mongodb_client import AtlasClient
+import logging
+from collections import Counter
+from mongodb_client import AtlasClient, read_preference
 from s3_file_manager import S3FileManager
+from content_store import ContentStore
+from content_index import ContentIndex, INDEXABLE_EXTENSIONS, read_pdf_pages
+from previews import PreviewGenerator
+from usage_stats import UsageStats
+from tag_index import TagVocabulary
+from cache_invalidation import InvalidationBus, InvalidatingCache, ChangeWatcher
+from search import SORT_OPTIONS, SORT_SPECS, build_search_query, sort_documents, build_bulk_edit, document_summary
+from metrics import REGISTRY, instrument, start_metrics_server, summary_rows
+from profiling import RerunProfiler, changed_keys
+from export import EXPORT_FORMATS, export_for_download
+from near_duplicates import NearDuplicateIndex, canonical_url, simhash
+from crawl_pack import PACK_FILENAME, PACK_CONTENT_TYPE, pack_pages, read_page
+from config import (COLLECTION_NAME, FLAGS_COLLECTION, COUNTERS_COLLECTION, S3_FOLDER, DEFAULT_FLAGS, CONTENT_ADDRESSED_STORAGE,
+                    METRICS_PORT, DEBUG_METRICS, PROFILE_RERUNS, PROFILE_DUMP, PROFILE_DIR, TAG_VOCABULARY_MAX_AGE,
+                    CACHE_INVALIDATION, CACHE_POLL_INTERVAL, CACHE_RESUME_TOKEN_PATH,
+                    SEARCH_READ_PREFERENCE, SEARCH_MAX_STALENESS, SEARCH_READ_CONCERN, EXPORT_INLINE_LIMIT,
+                    MONGO_OPERATION_TIMEOUT)
 
 # Initialize clients
 @st.cache_resource
-def get_clients():
-    mongo_client = AtlasClient()
-    s3_client = S3FileManager()
-    return mongo_client, s3_client
+def get_mongo_client():
+    # Interactive calls give up (with retries) after MONGO_OPERATION_TIMEOUT instead of hanging the page
+    return AtlasClient(operation_timeout=MONGO_OPERATION_TIMEOUT or None)
 
-mongo_client, s3_client = get_clients()
+@st.cache_resource
+def get_s3_client():
+    # Built apart from Mongo: importing boto3 is a large share of cold start
+    return S3FileManager()
+
+@st.cache_resource
+def get_content_index():
+    index = ContentIndex(get_mongo_client())
+    try:
+        index.ensure_indexes()
+    except Exception as e:
+        logging.error(f"Could not create content indexes: {e}")
+    return index
+
+@st.cache_resource
+def get_content_services():
+    s3_client = get_s3_client()
+    return ContentStore(get_mongo_client(), s3_client), PreviewGenerator(s3_client)
+
+class LazyResource:
+    """Stand-in for a cached resource that is only built on first attribute access"""
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+
+    def __getattr__(self, name):
+        if self._instance is None:
+            self._instance = self._factory()
+        return getattr(self._instance, name)
+
+# Clients and index setup are deferred until a page actually talks to Mongo or S3
+mongo_client = LazyResource(get_mongo_client)
+s3_client = LazyResource(get_s3_client)
+content_store = LazyResource(lambda: get_content_services()[0])
+content_index = LazyResource(get_content_index)
+preview_generator = LazyResource(lambda: get_content_services()[1])
+usage_stats = UsageStats(mongo_client, on_change=lambda: get_invalidation_bus().publish(COUNTERS_COLLECTION))
+
+@st.cache_resource
+def get_metrics_server():
+    """Start the Prometheus endpoint once per process when METRICS_PORT is set"""
+    if METRICS_PORT:
+        return start_metrics_server(int(METRICS_PORT))
+    return None
+
+get_metrics_server()
+
+SEARCH_READ = read_preference(SEARCH_READ_PREFERENCE, SEARCH_MAX_STALENESS)
 
-# Configuration
-COLLECTION_NAME = "documents"
-FLAGS_COLLECTION = "document_flags"
-S3_FOLDER = "qu-agents/documents/"
+def causal_session():
+    """Mongo session that continues this browser session's earlier writes, so reads see them"""
+    return mongo_client.start_causal_session(st.session_state.get("_causal_token"))
 
-# Initialize default flags
-DEFAULT_FLAGS = ["Review", "Convert", "Use", "Ignore"]
+def remember_session(session):
+    """Keep the session's position for the next rerun's causal_session()"""
+    token = mongo_client.causal_token(session)
+    if token:
+        st.session_state["_causal_token"] = token
+
+def search_reads(session):
+    """Read options for search and browse queries: secondaries, but causally after our writes"""
+    return {"read_preference": SEARCH_READ, "read_concern": SEARCH_READ_CONCERN, "session": session}
+
+def render_metrics_panel():
+    """Debug sidebar panel with per-method call counts, latency and bytes"""
+    with st.sidebar.expander("📈 Metrics", expanded=False):
+        rows = summary_rows()
+        if rows:
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No calls recorded yet.")
+        if st.button("Reset metrics", key="reset_metrics"):
+            REGISTRY.reset()
+            st.rerun()
+
+def file_url(file_info, key_field="s3_key", url_field="s3_url"):
+    """Presigned URL for a stored file, falling back to its stored public URL"""
+    if file_info.get(key_field):
+        url = s3_client.generate_presigned_url(
+            file_info[key_field], filename=file_info.get("filename") if key_field == "s3_key" else None)
+        if url:
+            return url
+    return file_info.get(url_field)
+
+def _thumbnail_url(doc):
+    """URL of the first thumbnail of a list row, or None"""
+    for f in doc.get("files") or []:
+        if f.get("preview_key"):
+            return file_url(f, "preview_key", "preview_url")
+    return None
+
+@st.cache_resource
+def get_invalidation_bus():
+    """Change events from every replica's writes, followed by one watcher per process"""
+    bus = InvalidationBus()
+    if CACHE_INVALIDATION != "off":
+        # Only Mongo is needed here, so the first cached query doesn't build the S3 client
+        ChangeWatcher(get_mongo_client(), bus, [COLLECTION_NAME, FLAGS_COLLECTION, COUNTERS_COLLECTION],
+                      token_path=CACHE_RESUME_TOKEN_PATH, poll_interval=CACHE_POLL_INTERVAL,
+                      mode=CACHE_INVALIDATION).start()
+    return bus
+
+@st.cache_resource
+def get_query_caches():
+    """Per-process caches of small, frequently read collections"""
+    bus = get_invalidation_bus()
+    enabled = CACHE_INVALIDATION != "off"
+    return {
+        "flags": InvalidatingCache(bus, [FLAGS_COLLECTION], "flags", enabled),
+        "usage": InvalidatingCache(bus, [COUNTERS_COLLECTION], "usage", enabled),
+    }
+
+def _flag_names():
+    return get_query_caches()["flags"].get(
+        "names", lambda: [flag["flag_name"] for flag in mongo_client.find(FLAGS_COLLECTION)])
 
 def initialize_flags():
     """Initialize default flags in database if they don't exist"""
     try:
-        existing_flags = mongo_client.find(FLAGS_COLLECTION)
-        if not existing_flags:
+        if not _flag_names():
             for flag in DEFAULT_FLAGS:
                 mongo_client.insert(FLAGS_COLLECTION, {
                     "flag_name": flag,
                     "created_at": datetime.utcnow()
                 })
+            get_invalidation_bus().publish(FLAGS_COLLECTION)
     except Exception as e:
         st.error(f"Error initializing flags: {str(e)}")
 
 def get_available_flags():
     """Get all available flags from database"""
     try:
-        flags = mongo_client.find(FLAGS_COLLECTION)
-        return [flag["flag_name"] for flag in flags]
+        return _flag_names()
     except Exception:
         return DEFAULT_FLAGS
 
+def get_usage_counts(kind):
+    """Document count per flag or tag, from the usage counters"""
+    try:
+        return get_query_caches()["usage"].get(kind, lambda: usage_stats.counts(kind))
+    except Exception:
+        return {}
+
+@st.cache_resource
+def get_tag_vocabulary():
+    """Tag suggestion index shared by every session"""
+    return TagVocabulary(max_age=TAG_VOCABULARY_MAX_AGE)
+
+def tag_suggestions(prefix, exclude=(), limit=8):
+    """Most used tags starting with prefix, reloaded from the usage counters when stale"""
+    vocabulary = get_tag_vocabulary()
+    vocabulary.refresh_if_stale(lambda: get_usage_counts("tag"))
+    return [t for t in vocabulary.suggest(prefix, limit + len(exclude)) if t not in exclude][:limit]
+
 def add_new_flag(flag_name):
     try:
         existing_flags = get_available_flags()
@@ -60,6 +197,8 @@ def add_new_flag(flag_name):
                 "flag_name": flag_name,
                 "created_at": datetime.utcnow()
             })
+            # Other replicas hear about it from the change stream
+            get_invalidation_bus().publish(FLAGS_COLLECTION)
             return True
         return False
     except Exception as e:
@@ -95,6 +234,22 @@ def _consume_tag_input_if_complete():
         st.session_state["tag_input"] = ""
         st.rerun()
 
+def _pick_search_tag_suggestion():
+    tag = st.session_state.get("tag_suggestion_search")
+    if tag and tag not in st.session_state["tags_list_search"]:
+        st.session_state["tags_list_search"].append(tag)
+    st.session_state["tag_input_search"] = ""
+    st.session_state["tag_suggestion_search"] = None
+
+def _pick_insert_tag_suggestion():
+    """Replace the tag being typed in the insert form with the picked suggestion"""
+    tag = st.session_state.get("tag_suggestion_insert")
+    if tag:
+        done = st.session_state.get("insert_tags", "").rpartition(",")[0]
+        tags = [t.strip().lower() for t in done.split(",") if t.strip()]
+        st.session_state["insert_tags"] = ", ".join(dict.fromkeys(tags + [tag])) + ", "
+    st.session_state["tag_suggestion_insert"] = None
+
 def main():
     st.set_page_config(
         page_title="Document Management System",
@@ -110,9 +265,13 @@ def main():
     # Sidebar navigation
     page = st.sidebar.selectbox(
         "Choose a page",
-        ["Insert Document", "Search Documents"]
+        ["Insert Document", "Search Documents"],
+        key="nav_page"
     )
     
+    if DEBUG_METRICS or st.query_params.get("debug") == "1":
+        render_metrics_panel()
+
     if page == "Insert Document":
         insert_page()
     elif page == "Search Documents":
@@ -129,8 +288,14 @@ def insert_page():
         name = st.text_input("Document Name*", placeholder="Enter document name", help="A short, unique title.")
         description = st.text_area("Description*", placeholder="Enter description", help="What this document is about.")
     with c2:
-        tags_input = st.text_input("Tags", placeholder="e.g. invoice, 2025, onboarding")
-        tags = [t.strip() for t in tags_input.split(",") if t.strip()]
+        tags_input = st.text_input("Tags", placeholder="e.g. invoice, 2025, onboarding", key="insert_tags")
+        # Lower-cased and de-duplicated so the same tag isn't stored in several spellings
+        tags = list(dict.fromkeys(t.strip().lower() for t in tags_input.split(",") if t.strip()))
+        typing = tags_input.rpartition(",")[2].strip()
+        suggestions = tag_suggestions(typing, exclude=tags[:-1]) if typing else []
+        if suggestions and suggestions != [typing.lower()]:
+            st.pills("Suggested tags", suggestions, key="tag_suggestion_insert",
+                     on_change=_pick_insert_tag_suggestion, label_visibility="collapsed")
         notes = st.text_area("Notes", placeholder="Any additional notes", help="Optional context.")
 
     # --- Flags (selector + contextual new-flag UI directly beneath) ---
@@ -180,25 +345,40 @@ def insert_page():
 
                 # Upload files to S3
                 s3_files = []
+                to_index = []  # (temp path, filename) of files whose text gets indexed
                 for file in uploaded_files:
                     file_key = f"{S3_FOLDER}{doc_id}/{file.name}"
+                    file_info, deduplicated = None, False
                     with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
                         tmp_file.write(file.getvalue())
                         tmp_file.flush()
-                        success = asyncio.run(s3_client.upload_file(tmp_file.name, file_key))
+                        if CONTENT_ADDRESSED_STORAGE:
+                            # Identical bytes are stored once and shared across documents
+                            file_info, deduplicated = content_store.store_file(tmp_file.name, file.name, file.type)
+                        elif asyncio.run(s3_client.upload_file(tmp_file.name, file_key, file.type)):
+                            file_info = {
+                                "filename": file.name,
+                                "s3_key": file_key,
+                                "s3_url": f"https://{s3_client.bucket_name}.s3.amazonaws.com/{file_key}",
+                                "size": file.size,
+                                "type": file.type
+                            }
+                    if file_info:
+                        preview_generator.add_preview(tmp_file.name, doc_id, file_info)
+                    if file_info and file.name.lower().endswith(INDEXABLE_EXTENSIONS):
+                        to_index.append((tmp_file.name, file.name))
+                    else:
                         os.unlink(tmp_file.name)
-                    if success:
-                        s3_url = f"https://{s3_client.bucket_name}.s3.amazonaws.com/{file_key}"
-                        s3_files.append({
-                            "filename": file.name,
-                            "s3_key": file_key,
-                            "s3_url": s3_url,
-                            "size": file.size,
-                            "type": file.type
-                        })
-                        st.write(f"Uploaded: `{file.name}`")
+                    if file_info:
+                        s3_files.append(file_info)
+                        if deduplicated:
+                            st.write(f"Already stored, linked: `{file.name}`")
+                        else:
+                            st.write(f"Uploaded: `{file.name}`")
 
                 if not s3_files:
+                    for tmp_path, _ in to_index:
+                        os.unlink(tmp_path)
                     status.update(label="Failed", state="error")
                     st.error("Failed to upload files to S3!")
                     return
@@ -215,9 +395,27 @@ def insert_page():
                     "created_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow()
                 }
+                document["summary"] = document_summary(document)
 
                 # Insert into MongoDB
-                result_id = mongo_client.insert(COLLECTION_NAME, document)
+                with causal_session() as session:
+                    result_id = mongo_client.insert(COLLECTION_NAME, document, session=session)
+                    remember_session(session)
+                if result_id:
+                    usage_stats.record_insert([document])
+                    for tag in tags:
+                        get_tag_vocabulary().add(tag)
+
+                # Extract and index file text (runs in a process pool)
+                if result_id and to_index:
+                    try:
+                        chunk_count = content_index.index_document(doc_id, to_index)
+                        st.write(f"Indexed {chunk_count} text chunk(s)")
+                    except Exception as e:
+                        st.warning(f"Content indexing failed: {str(e)}")
+                    finally:
+                        for tmp_path, _ in to_index:
+                            os.unlink(tmp_path)
 
                 if result_id:
                     status.update(label="Done", state="complete")
@@ -234,6 +432,211 @@ def insert_page():
             st.error(f"Error uploading document: {str(e)}")
             
     
+def _format_timestamp(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if hasattr(value, "strftime") else str(value)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_crawl_page(key, offset, length):
+    """One page of a crawl pack, fetched with a ranged GET; packs never change once written"""
+    return read_page(s3_client, key, {"offset": offset, "length": length})
+
+@st.fragment
+def render_document_detail(doc):
+    """Full view and flag editor of one search result; its widgets rerun on their own"""
+    st.subheader(f"📄 {doc.get('name', 'Untitled')}")
+    st.caption(f"Created: {_format_timestamp(doc.get('created_at'))} • "
+               f"Updated: {_format_timestamp(doc.get('updated_at'))}")
+    with st.container(border=True):
+        left, right = st.columns([1.2, 1])
+
+        with left:
+            st.markdown("**Description**")
+            st.write(doc.get("description", "—"))
+            st.markdown("**Notes**")
+            st.write(doc.get("notes", "—"))
+
+            # Tags as chips using multiselect
+            st.markdown("**Tags**")
+            existing_tags = doc.get("tags", []) or []
+            # Show only (not editing tags here); looks like chips
+            st.multiselect(
+                "Document tags",
+                options=existing_tags,
+                default=existing_tags,
+                key=f"tags_view_{doc['doc_id']}",
+                disabled=True,
+                help=None
+            )
+
+            st.markdown("**Files**")
+            files = doc.get("files", []) or []
+            if files:
+                for f in files:
+                    cfa, cfb = st.columns([4, 1])
+                    with cfa:
+                        if f.get("preview_key"):
+                            st.image(file_url(f, "preview_key", "preview_url"), width=160)
+                        st.write(f"📎 {f.get('filename','file')} ({f.get('size','?')} bytes)")
+                    with cfb:
+                        download_url = file_url(f)
+                        if download_url:
+                            st.link_button("Download", download_url)
+            else:
+                st.caption("No files.")
+
+            pack = doc.get("crawl_pack")
+            if pack and pack.get("pages"):
+                st.markdown("**Crawled pages**")
+                entry = st.selectbox(
+                    "Crawled page",
+                    pack["pages"],
+                    format_func=lambda e: f"Level {e.get('depth')}: {e.get('title') or e.get('url')}",
+                    key=f"crawl_page_{doc['doc_id']}",
+                    label_visibility="collapsed",
+                )
+                page = load_crawl_page(pack["s3_key"], entry["offset"], entry["length"])
+                if page:
+                    st.write(f"**URL:** {page['url']}")
+                    if page.get('duplicates'):
+                        st.caption(f"Near-duplicates collapsed: {', '.join(page['duplicates'])}")
+                    st.text(page.get("content") or "")
+                else:
+                    st.caption("Page could not be loaded.")
+
+        with right:
+            # Flags view
+            st.markdown("**Current Flags**")
+            current_flags = doc.get("flags", []) or []
+            st.multiselect(
+                "Flags",
+                options=current_flags,
+                default=current_flags,
+                key=f"flags_view_{doc['doc_id']}",
+                disabled=True
+            )
+
+            st.divider()
+            st.markdown("**🏷️ Modify Flags**")
+            avail_flags = get_available_flags() or []
+            new_flags = st.multiselect(
+                "Update flags",
+                avail_flags,
+                default=current_flags,
+                key=f"flags_edit_{doc['doc_id']}"
+            )
+
+            # Contextual new-flag creator under the editor
+            with st.popover("➕ Create a new flag", use_container_width=True):
+                nf = st.text_input("New flag name", key=f"nf_{doc['doc_id']}")
+                if st.button("Add Flag", key=f"nf_btn_{doc['doc_id']}"):
+                    if not nf:
+                        st.warning("Please enter a flag name.")
+                    else:
+                        if add_new_flag(nf):
+                            st.success(f"Flag '{nf}' added.")
+                            st.toast(f"Flag '{nf}' added")
+                            st.rerun()
+                        else:
+                            st.info(f"Flag '{nf}' already exists.")
+
+            if st.button("Update Flags", key=f"update_{doc['doc_id']}"):
+                try:
+                    # The rerun below reads from a secondary; the causal session makes it see this update
+                    with causal_session() as session:
+                        update_result = mongo_client.update(
+                            COLLECTION_NAME,
+                            {"doc_id": doc["doc_id"]},
+                            {"$set": {"flags": new_flags, "updated_at": datetime.utcnow()}},
+                            session=session,
+                        )
+                        remember_session(session)
+                    if update_result:
+                        usage_stats.record_change({"flags": current_flags}, {"flags": new_flags})
+                        st.success("Flags updated.")
+                        st.rerun()
+                    else:
+                        st.error("Failed to update flags.")
+                except Exception as e:
+                    st.error(f"Error updating flags: {str(e)}")
+
+        # Footer quick info
+        st.caption(f"Document ID: `{doc.get('doc_id','')}`")
+
+def _split_tags(raw):
+    return [t.strip().lower() for t in re.split(r"[,\s]+", raw or "") if t.strip()]
+
+def render_bulk_editor(query, selected_docs, total):
+    """Add or remove flags and tags on the selected results, or on everything matching the query"""
+    with st.expander("🗂️ Bulk edit flags and tags", expanded=len(selected_docs) > 1):
+        target = st.radio(
+            "Apply to",
+            [f"Selected documents ({len(selected_docs)})", f"All {total} matching the search"],
+            horizontal=True,
+            key="bulk_target",
+        )
+        all_matching = target.startswith("All")
+        available_flags = get_available_flags() or []
+        b1, b2 = st.columns(2)
+        with b1:
+            add_flags = st.multiselect("Add flags", available_flags, key="bulk_add_flags")
+            add_tags = st.text_input("Add tags", placeholder="comma or space separated", key="bulk_add_tags")
+        with b2:
+            remove_flags = st.multiselect("Remove flags", available_flags, key="bulk_remove_flags")
+            remove_tags = st.text_input("Remove tags", placeholder="comma or space separated", key="bulk_remove_tags")
+
+        if st.button("Apply to documents", key="bulk_apply", disabled=not (all_matching or selected_docs)):
+            target_filter = query if all_matching else {"doc_id": {"$in": [d["doc_id"] for d in selected_docs]}}
+            operations = build_bulk_edit(target_filter, add_flags, remove_flags,
+                                         _split_tags(add_tags), _split_tags(remove_tags))
+            if not operations:
+                st.warning("Choose flags or tags to add or remove.")
+                return
+            try:
+                with causal_session() as session:
+                    deltas = usage_stats.bulk_edit_deltas(target_filter, add_flags, remove_flags,
+                                                          _split_tags(add_tags), _split_tags(remove_tags),
+                                                          session=session)
+                    # One round trip for every document, additions then removals
+                    mongo_client.bulk_write(COLLECTION_NAME, operations, session=session)
+                    remember_session(session)
+                # Only counted once the write went through
+                usage_stats.apply(deltas)
+                for tag in _split_tags(add_tags):
+                    get_tag_vocabulary().add(tag, 0)
+                # matched_count adds up every operation; the target size was already counted
+                st.toast(f"Updated {total if all_matching else len(selected_docs)} document(s)")
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error applying bulk edit: {str(e)}")
+
+def render_export(query, sort_by, total):
+    """Export everything matching the search, as a direct download or, when large, through S3"""
+    with st.expander("⬇️ Export results", expanded=False):
+        e1, e2 = st.columns([1, 3])
+        with e1:
+            fmt = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+        with e2:
+            st.caption(f"{total} document(s). Exports over {EXPORT_INLINE_LIMIT} documents are "
+                       "written to S3 and offered as a link.")
+        if not st.button("Export", key="export_btn"):
+            return
+        try:
+            # Streams the cursor batch by batch instead of reusing the in-memory result list
+            with st.spinner("Exporting…"), causal_session() as session:
+                options = {"sort": SORT_SPECS.get(sort_by), **search_reads(session)}
+                data, key, count = export_for_download(mongo_client, s3_client, query, fmt, total, **options)
+                if data is not None:
+                    content_type, extension = EXPORT_FORMATS[fmt]
+                    st.download_button(f"Download {extension.upper()}", data,
+                                       file_name=f"documents.{extension}", mime=content_type, key="export_download")
+                    return
+            url = s3_client.generate_presigned_url(key, filename=key.rsplit("/", 1)[-1])
+            st.success(f"Exported {count} document(s).")
+            if url:
+                st.markdown(f"[Download export]({url})")
+        except Exception as e:
+            st.error(f"Error exporting documents: {str(e)}")
+
 def search_page():
     st.header("🔍 Search Documents")
 
@@ -272,10 +675,15 @@ def search_page():
                 help="Case-insensitive search across name, description, and notes.",
                 key="search_text",
             )
+            search_content = st.checkbox(
+                "Also search file contents",
+                key="search_content",
+                help="Match words inside uploaded PDFs and text files.",
+            )
         with c2:
             sort_by = st.selectbox(
                 "Sort by",
-                options=["Newest created", "Last updated", "Name (A→Z)"],
+                options=SORT_OPTIONS,
                 index=0,
                 help="Change result ordering.",
                 key="sort_by",
@@ -290,6 +698,11 @@ def search_page():
         placeholder="Type a tag and press space (or comma)",
     )
     _consume_tag_input_if_complete_search()
+    typed = st.session_state.get("tag_input_search", "").strip()
+    suggestions = tag_suggestions(typed, exclude=st.session_state["tags_list_search"]) if typed else []
+    if suggestions:
+        st.pills("Suggested tags", suggestions, key="tag_suggestion_search",
+                 on_change=_pick_search_tag_suggestion, label_visibility="collapsed")
 
     # Show tags as removable chips via multiselect
     current_tags = st.multiselect(
@@ -304,9 +717,11 @@ def search_page():
 
     # Flag filter
     available_flags = get_available_flags()
+    flag_counts = get_usage_counts("flag")
     flag_filter = st.multiselect(
         "Flag filter",
         options=available_flags,
+        format_func=lambda flag: f"{flag} ({flag_counts.get(flag, 0)})",
         help="Filter results that have any of the selected flags.",
         key="flag_filter",
     )
@@ -337,47 +752,25 @@ def search_page():
     if search_clicked or has_filters:
         try:
             # ---------- Build MongoDB query ----------
-            query = {}
-
-            # text query across fields
-            if search_query:
-                search_regex = {"$regex": search_query, "$options": "i"}
-                query["$or"] = [
-                    {"name": search_regex},
-                    {"description": search_regex},
-                    {"notes": search_regex},
-                ]
-
-            # tags (any of)
-            tags = st.session_state["tags_list_search"]
-            if tags:
-                query["tags"] = {"$in": tags}
-
-            # flags (any of)
-            if flag_filter:
-                query["flags"] = {"$in": flag_filter}
-
-            # created_at date range
-            if use_dates and (start_date or end_date):
-                date_filter = {}
-                # Convert to naive datetime at bounds
-                if start_date:
-                    date_filter["$gte"] = datetime.combine(start_date, time.min)
-                if end_date:
-                    date_filter["$lte"] = datetime.combine(end_date, time.max)
-                if date_filter:
-                    query["created_at"] = date_filter
-
-            # Search
-            documents = mongo_client.find(COLLECTION_NAME, query) or []
+            with causal_session() as session:
+                content_doc_ids = (content_index.search(search_query, **search_reads(session))
+                                   if search_query and search_content else None)
+                query = build_search_query(
+                    search_query,
+                    tags=st.session_state["tags_list_search"],
+                    flags=flag_filter,
+                    start_date=start_date if use_dates else None,
+                    end_date=end_date if use_dates else None,
+                    content_doc_ids=content_doc_ids,
+                )
+
+                # Search
+                # List rows only need names, dates, flags, tags and the summary
+                documents = mongo_client.find(COLLECTION_NAME, query, projection="list",
+                                              **search_reads(session)) or []
 
             # Sorting in Python (adjust if your driver supports sort server-side)
-            if sort_by == "Newest created":
-                documents.sort(key=lambda d: d.get("created_at") or d.get("updated_at") or datetime.min, reverse=True)
-            elif sort_by == "Last updated":
-                documents.sort(key=lambda d: d.get("updated_at") or d.get("created_at") or datetime.min, reverse=True)
-            else:
-                documents.sort(key=lambda d: (d.get("name") or "").lower())
+            sort_documents(documents, sort_by)
 
             total = len(documents)
             if total == 0:
@@ -385,6 +778,7 @@ def search_page():
                 return
 
             st.success(f"Found {total} document(s)")
+            render_export(query, sort_by, total)
 
             # ---------- Pagination ----------
             key_page = "search_page_idx"
@@ -407,103 +801,37 @@ def search_page():
             end = min(start + per_page, total)
             page_docs = documents[start:end]
 
-            # ---------- Results (card-style expanders) ----------
-            for doc in page_docs:
-                doc_name = doc.get("name", "Untitled")
-                created = doc.get("created_at")
-                updated = doc.get("updated_at")
-                created_str = created.strftime("%Y-%m-%d %H:%M:%S") if hasattr(created, "strftime") else str(created)
-                updated_str = updated.strftime("%Y-%m-%d %H:%M:%S") if hasattr(updated, "strftime") else str(updated)
-
-                header = f"📄 {doc_name}  \nCreated: {created_str} • Updated: {updated_str}"
-                with st.expander(header, expanded=False):
-                    left, right = st.columns([1.2, 1])
-
-                    with left:
-                        st.markdown("**Description**")
-                        st.write(doc.get("description", "—"))
-                        st.markdown("**Notes**")
-                        st.write(doc.get("notes", "—"))
-
-                        # Tags as chips using multiselect
-                        st.markdown("**Tags**")
-                        existing_tags = doc.get("tags", []) or []
-                        # Show only (not editing tags here); looks like chips
-                        st.multiselect(
-                            "Document tags",
-                            options=existing_tags,
-                            default=existing_tags,
-                            key=f"tags_view_{doc['doc_id']}",
-                            disabled=True,
-                            help=None
-                        )
-
-                        st.markdown("**Files**")
-                        files = doc.get("files", []) or []
-                        if files:
-                            for f in files:
-                                cfa, cfb = st.columns([4, 1])
-                                with cfa:
-                                    st.write(f"📎 {f.get('filename','file')} ({f.get('size','?')} bytes)")
-                                with cfb:
-                                    if f.get("s3_url"):
-                                        st.link_button("Download", f["s3_url"])
-                        else:
-                            st.caption("No files.")
-
-                    with right:
-                        # Flags view
-                        st.markdown("**Current Flags**")
-                        current_flags = doc.get("flags", []) or []
-                        st.multiselect(
-                            "Flags",
-                            options=current_flags,
-                            default=current_flags,
-                            key=f"flags_view_{doc['doc_id']}",
-                            disabled=True
-                        )
-
-                        st.divider()
-                        st.markdown("**🏷️ Modify Flags**")
-                        avail_flags = get_available_flags() or []
-                        new_flags = st.multiselect(
-                            "Update flags",
-                            avail_flags,
-                            default=current_flags,
-                            key=f"flags_edit_{doc['doc_id']}"
-                        )
-
-                        # Contextual new-flag creator under the editor
-                        with st.popover("➕ Create a new flag", use_container_width=True):
-                            nf = st.text_input("New flag name", key=f"nf_{doc['doc_id']}")
-                            if st.button("Add Flag", key=f"nf_btn_{doc['doc_id']}"):
-                                if not nf:
-                                    st.warning("Please enter a flag name.")
-                                else:
-                                    if add_new_flag(nf):
-                                        st.success(f"Flag '{nf}' added.")
-                                        st.toast(f"Flag '{nf}' added")
-                                        st.rerun()
-                                    else:
-                                        st.info(f"Flag '{nf}' already exists.")
-
-                        if st.button("Update Flags", key=f"update_{doc['doc_id']}"):
-                            try:
-                                update_result = mongo_client.update(
-                                    COLLECTION_NAME,
-                                    {"doc_id": doc["doc_id"]},
-                                    {"$set": {"flags": new_flags, "updated_at": datetime.utcnow()}}
-                                )
-                                if update_result:
-                                    st.success("Flags updated.")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to update flags.")
-                            except Exception as e:
-                                st.error(f"Error updating flags: {str(e)}")
-
-                    # Footer quick info
-                    st.caption(f"Document ID: `{doc.get('doc_id','')}`")
+            # ---------- Results: one compact table, details only for the selected row ----------
+            st.caption("Select one row to open the document, or several to edit them together.")
+            selection = st.dataframe(
+                [
+                    {
+                        "Name": doc.get("name", "Untitled"),
+                        "Created": _format_timestamp(doc.get("created_at")),
+                        "Updated": _format_timestamp(doc.get("updated_at")),
+                        "Tags": ", ".join(doc.get("tags", []) or []),
+                        "Flags": ", ".join(doc.get("flags", []) or []),
+                        "Files": (doc.get("summary") or {}).get("file_count", 0),
+                        "Preview": _thumbnail_url(doc),
+                    }
+                    for doc in page_docs
+                ],
+                column_config={"Preview": st.column_config.ImageColumn("Preview", width="small")},
+                hide_index=True,
+                use_container_width=True,
+                on_select="rerun",
+                selection_mode="multi-row",
+                # A new page or result set starts with nothing selected
+                key=f"search_results_{st.session_state[key_page]}_{total}",
+            )
+            selected_docs = [page_docs[i] for i in selection.selection.rows]
+            render_bulk_editor(query, selected_docs, total)
+            if len(selected_docs) == 1:
+                with causal_session() as session:
+                    detail = mongo_client.find(COLLECTION_NAME, {"doc_id": selected_docs[0]["doc_id"]}, limit=1,
+                                               projection="detail", **search_reads(session))
+                if detail:
+                    render_document_detail(detail[0])
 
         except Exception as e:
             st.error(f"Error searching documents: {str(e)}")
@@ -513,7 +841,8 @@ def dive_deeper_page():
     
     # Document selection
     try:
-        documents = mongo_client.find(COLLECTION_NAME)
+        with causal_session() as session:
+            documents = mongo_client.find(COLLECTION_NAME, projection="detail", **search_reads(session))
         if not documents:
             st.warning("No documents found. Please add some documents first.")
             return
@@ -550,7 +879,7 @@ def dive_deeper_page():
                         # Extract links from all PDF files
                         for pdf_file in pdf_files:
                             st.info(f"Processing PDF: {pdf_file['filename']}")
-                            links = extract_links_from_pdf(pdf_file['s3_url'])
+                            links = extract_links_from_pdf(file_url(pdf_file))
                             all_links.extend(links)
                         
                         if not all_links:
@@ -561,13 +890,17 @@ def dive_deeper_page():
                         
                         # Start crawling from extracted links
                         all_results = []
+                        # Shared across start links, so mirrors reached from different links collapse too
+                        dedup, crawl_stats = NearDuplicateIndex(), Counter()
                         for link in all_links[:max_links]:  # Limit starting links
                             st.info(f"Crawling from: {link}")
-                            results = crawl_links([link], depth, max_links)
+                            results = crawl_links([link], depth, max_links, dedup=dedup, stats=crawl_stats)
                             all_results.extend(results)
                         
                         if all_results:
                             st.success(f"Crawled {len(all_results)} pages total")
+                            st.caption(f"Fetched {crawl_stats['fetched']} pages; collapsed {crawl_stats['duplicates']} "
+                                       f"near-duplicate(s), skipping {crawl_stats['links_skipped']} of their links")
                             
                             # Store crawled content in S3 and database
                             crawl_doc_id = str(uuid.uuid4())
@@ -579,44 +912,40 @@ def dive_deeper_page():
                                 "notes": f"Original document: {selected_doc['doc_id']}. Crawled at depth {depth}",
                                 "flags": selected_doc['flags'],
                                 "original_doc_id": selected_doc['doc_id'],
-                                "crawl_results": all_results,
+                                "crawl_stats": dict(crawl_stats),
                                 "files": [],
                                 "created_at": datetime.utcnow(),
                                 "updated_at": datetime.utcnow()
                             }
                             
-                            # Save crawled content to text files and upload to S3
+                            # Pack every page into one object; the viewer reads pages back with ranged GETs
+                            pack, pack_index = pack_pages(all_results)
+                            pack_key = f"{S3_FOLDER}{crawl_doc_id}/{PACK_FILENAME}"
                             s3_files = []
-                            for i, result in enumerate(all_results):
-                                content = f"URL: {result['url']}\nTitle: {result['title']}\nDepth: {result['depth']}\n\n{result['content']}"
-                                
-                                with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as tmp_file:
-                                    tmp_file.write(content)
-                                    tmp_file.flush()
-                                    
-                                    # Upload to S3
-                                    file_key = f"{S3_FOLDER}{crawl_doc_id}/crawled_page_{i+1}_{urlparse(result['url']).netloc}.txt"
-                                    success = asyncio.run(s3_client.upload_file(tmp_file.name, file_key))
-                                    
-                                    if success:
-                                        s3_url = f"https://{s3_client.bucket_name}.s3.amazonaws.com/{file_key}"
-                                        s3_files.append({
-                                            "filename": f"crawled_page_{i+1}_{urlparse(result['url']).netloc}.txt",
-                                            "s3_key": file_key,
-                                            "s3_url": s3_url,
-                                            "size": len(content),
-                                            "type": "text/plain",
-                                            "source_url": result['url']
-                                        })
-                                    
-                                    os.unlink(tmp_file.name)
-                            
+                            if s3_client.upload_file_from_bytes(pack, pack_key, content_type=PACK_CONTENT_TYPE):
+                                s3_files.append({
+                                    "filename": PACK_FILENAME,
+                                    "s3_key": pack_key,
+                                    "s3_url": f"https://{s3_client.bucket_name}.s3.amazonaws.com/{pack_key}",
+                                    "size": len(pack),
+                                    "type": PACK_CONTENT_TYPE,
+                                })
+                                # Only per-page url/title/depth and pack offsets stay in Mongo
+                                crawl_document["crawl_pack"] = {"s3_key": pack_key, "pages": pack_index}
+                            else:
+                                # Without the pack, keep the pages in the document rather than lose them
+                                crawl_document["crawl_results"] = all_results
+
                             crawl_document["files"] = s3_files
+                            crawl_document["summary"] = document_summary(crawl_document)
                             
                             # Insert crawled document into MongoDB
-                            result_id = mongo_client.insert(COLLECTION_NAME, crawl_document)
+                            with causal_session() as session:
+                                result_id = mongo_client.insert(COLLECTION_NAME, crawl_document, session=session)
+                                remember_session(session)
                             
                             if result_id:
+                                usage_stats.record_insert([crawl_document])
                                 st.success(f"Crawled content saved as new document! Document ID: {crawl_doc_id}")
                             
                             # Display results
@@ -626,6 +955,8 @@ def dive_deeper_page():
                                     st.write(f"**URL:** {result['url']}")
                                     st.write(f"**Title:** {result['title']}")
                                     st.write(f"**Depth:** {result['depth']}")
+                                    if result.get('duplicates'):
+                                        st.write(f"**Near-duplicates collapsed:** {len(result['duplicates'])}")
                                     
                                     if result['content']:
                                         st.write("**Content Preview:**")
@@ -644,57 +975,32 @@ def dive_deeper_page():
     except Exception as e:
         st.error(f"Error loading documents: {str(e)}")
 
+@instrument("app")
 def extract_links_from_pdf(pdf_url):
     """Extract URLs from a PDF file"""
+    import requests  # only the Dive Deeper page needs it
+
     links = []
     try:
         # Download PDF content
         response = requests.get(pdf_url, timeout=30)
         response.raise_for_status()
+        REGISTRY.inc("dms_bytes_total", len(response.content), layer="app",
+                     method="extract_links_from_pdf", direction="received")
         
         # Save to temporary file
         with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
             tmp_file.write(response.content)
             tmp_file.flush()
             
-            # Method 1: Using PyMuPDF (more reliable for links)
+            # PyMuPDF link annotations and text, with a PyPDF2 fallback for the text
+            url_pattern = r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:#(?:\w*))?)?'
             try:
-                doc = fitz.open(tmp_file.name)
-                for page_num in range(doc.page_count):
-                    page = doc[page_num]
-                    page_links = page.get_links()
-                    
-                    for link in page_links:
-                        if link.get('uri'):  # External link
-                            links.append(link['uri'])
-                    
-                    # Also extract text and look for URLs
-                    text = page.get_text()
-                    url_pattern = r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:#(?:\w*))?)?'
-                    found_urls = re.findall(url_pattern, text)
-                    links.extend(found_urls)
-                
-                doc.close()
-                
+                for text, page_links in read_pdf_pages(tmp_file.name):
+                    links.extend(page_links)
+                    links.extend(re.findall(url_pattern, text))
             except Exception as e:
-                st.warning(f"PyMuPDF extraction failed: {str(e)}")
-                
-                # Fallback: Method 2: Using PyPDF2
-                try:
-                    with open(tmp_file.name, 'rb') as file:
-                        pdf_reader = PyPDF2.PdfReader(file)
-                        
-                        for page_num in range(len(pdf_reader.pages)):
-                            page = pdf_reader.pages[page_num]
-                            text = page.extract_text()
-                            
-                            # Extract URLs using regex
-                            url_pattern = r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:#(?:\w*))?)?'
-                            found_urls = re.findall(url_pattern, text)
-                            links.extend(found_urls)
-                            
-                except Exception as e2:
-                    st.error(f"PyPDF2 extraction also failed: {str(e2)}")
+                st.error(f"PDF extraction failed: {str(e)}")
             
             # Clean up temp file
             os.unlink(tmp_file.name)
@@ -720,13 +1026,22 @@ def extract_links_from_pdf(pdf_url):
     
     return valid_links
 
-def crawl_links(start_urls, max_depth, max_links_per_page):
+@instrument("app")
+def crawl_links(start_urls, max_depth, max_links_per_page, dedup=None, stats=None):
     """
-    Crawl links starting from a list of URLs up to specified depth
+    Crawl links starting from a list of URLs up to specified depth.
+    Pages whose text is a near-duplicate of one already crawled (per the shared
+    `dedup` index) are recorded on that page and their links are not followed;
+    `stats` counts fetched pages, collapsed duplicates and skipped links.
     """
+    import requests
+    from bs4 import BeautifulSoup
+
+    dedup = dedup if dedup is not None else NearDuplicateIndex()
+    stats = stats if stats is not None else Counter()
     visited = set()
     results = []
-    to_visit = [(url, 0) for url in start_urls]  # (url, depth)
+    to_visit = [(canonical_url(url), 0) for url in start_urls]  # (url, depth)
     
     while to_visit and len(results) < 100:  # Limit total results
         current_url, current_depth = to_visit.pop(0)
@@ -744,6 +1059,9 @@ def crawl_links(start_urls, max_depth, max_links_per_page):
             
             response = requests.get(current_url, headers=headers, timeout=10)
             response.raise_for_status()
+            REGISTRY.inc("dms_bytes_total", len(response.content), layer="app",
+                         method="crawl_links", direction="received")
+            stats["fetched"] += 1
             
             soup = BeautifulSoup(response.content, 'html.parser')
             
@@ -771,30 +1089,92 @@ def crawl_links(start_urls, max_depth, max_links_per_page):
                     
                     # Only follow http/https links
                     if full_url.startswith(('http://', 'https://')):
-                        parsed = urlparse(full_url)
-                        # Remove fragments
-                        clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-                        if parsed.query:
-                            clean_url += f"?{parsed.query}"
+                        # Drop fragments and tracking parameters
+                        clean_url = canonical_url(full_url)
                         
-                        if clean_url not in visited and len(links) < max_links_per_page:
+                        if clean_url not in visited and clean_url not in links and len(links) < max_links_per_page:
                             links.append(clean_url)
-                            to_visit.append((clean_url, current_depth + 1))
             
-            # Add to results
-            results.append({
+            result = {
                 'url': current_url,
                 'title': title_text,
                 'content': text_content[:1000],  # Limit content length
                 'links': links,
                 'depth': current_depth
-            })
+            }
+
+            # Collapse near-duplicates (pagination, mirrors) before storing them or expanding their links
+            original = dedup.add(simhash(text_content), result)
+            if original is not None:
+                original.setdefault('duplicates', []).append(current_url)
+                stats["duplicates"] += 1
+                stats["links_skipped"] += len(links)
+                REGISTRY.inc("dms_crawl_duplicates_total")
+                continue
+
+            to_visit.extend((url, current_depth + 1) for url in links)
+            results.append(result)
             
         except Exception as e:
+            REGISTRY.inc("dms_errors_total", layer="app", method="crawl_page")
             st.warning(f"Failed to crawl {current_url}: {str(e)}")
             continue
     
     return results
 
+def _session_values():
+    """Plain session values, compared across reruns to find what triggered one"""
+    values = {}
+    for k, v in st.session_state.items():
+        if str(k).startswith("_profile"):
+            continue
+        if isinstance(v, (str, int, float, bool, type(None))):
+            values[k] = v
+        elif isinstance(v, (list, tuple)):
+            values[k] = [str(x) for x in v]
+    return values
+
+def render_profile_panel(history):
+    """Sidebar panel with the cost of recent reruns"""
+    with st.sidebar.expander("⏱️ Rerun profile", expanded=True):
+        latest = history[-1]
+        st.metric("Last rerun", f"{latest['wall_s'] * 1000:.0f} ms")
+        st.caption(f"Triggered by: {', '.join(latest['trigger']) or 'initial load'}")
+        st.dataframe([
+            {
+                "trigger": ", ".join(r["trigger"]) or "—",
+                "wall_ms": round(r["wall_s"] * 1000),
+                "db_ms": round(r["phases_s"]["db"] * 1000),
+                "s3_ms": round(r["phases_s"]["s3"] * 1000),
+                "render_ms": round(r["phases_s"]["render"] * 1000),
+                "mongo_cmds": r["mongo_commands"],
+                "s3_calls": r["s3_calls"],
+            }
+            for r in reversed(history)
+        ], hide_index=True, use_container_width=True)
+
+def run_app():
+    """Run main(), measured by the rerun profiler when profiling is on"""
+    if not (PROFILE_RERUNS or st.query_params.get("profile") == "1"):
+        main()
+        return
+    previous = st.session_state.get("_profile_last_values", {})
+    profiler = RerunProfiler(
+        dump=st.query_params.get("profile_dump") or PROFILE_DUMP,
+        out_dir=PROFILE_DIR,
+        trigger=changed_keys(previous, _session_values()),
+        label=st.session_state.get("nav_page"),
+    )
+    try:
+        with profiler:
+            main()
+    finally:
+        # Also runs when st.rerun() ends the rerun early
+        st.session_state["_profile_last_values"] = _session_values()
+        history = st.session_state.setdefault("_profile_history", [])
+        history.append(profiler.result)
+        del history[:-20]
+    render_profile_panel(history)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_app()
\ No newline at end of file
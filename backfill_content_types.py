@@ -0,0 +1,144 @@
+"""
+Fix the Content-Type and Content-Disposition of objects uploaded before types
+were detected at upload time.
+
+Lists the prefixes in parallel, HEADs each object and compares its stored type
+with the one detect_content_type picks from the key's extension (and, with
+--sniff, the object's first bytes via a ranged GET). Only mismatching objects are
+rewritten, with one in-place copy that reuses the HEAD's metadata, size and
+encoding.
+
+With --manifest-dir, each prefix's listing is cached in a PrefixManifest, and a
+rerun only checks the objects directly under the prefix and the sub-prefixes
+that are new, held a failed object, or are older than --manifest-max-age.
+
+Usage (from the repository root):
+    python backfill_content_types.py --dry-run
+    python backfill_content_types.py qu-agents/documents/ --sniff --workers 32
+    python backfill_content_types.py --manifest-dir .backfill-manifests
+"""
+# External imports
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from s3_file_manager import S3FileManager, head_value
+from s3_listing import PrefixManifest
+from content_types import detect_content_type, disposition_for, SNIFF_BYTES
+from config import S3_FOLDER
+
+
+def expected_headers(s3_client, obj, sniff=False):
+    """Content-Type and Content-Disposition an object should have."""
+    key = obj["Key"]
+    filename = key.rsplit("/", 1)[-1]
+    head = s3_client.download_range(key, 0, SNIFF_BYTES - 1) if sniff and obj.get("Size") else None
+    content_type = detect_content_type(filename, head)
+    return content_type, disposition_for(content_type, filename)
+
+
+def backfill_object(s3_client, obj, sniff=False, dry_run=False):
+    """
+    Rewrite one object's headers if they differ from the detected ones.
+
+    Returns:
+    str: "fixed", "ok" or "failed"
+    """
+    key = obj["Key"]
+    head = s3_client.get_object_metadata(key)
+    if head is None:
+        return "failed"
+    content_type, disposition = expected_headers(s3_client, obj, sniff)
+    if head_value(head, "ContentType") == content_type and head_value(head, "ContentDisposition") == disposition:
+        return "ok"
+    logging.info("%s: %s -> %s", key, head_value(head, "ContentType"), content_type)
+    if dry_run:
+        return "fixed"
+    # change_content_type derives the same disposition from the type and logs failures
+    if s3_client.change_content_type(key, content_type, metadata=head.get("Metadata", {}),
+                                     size=head["ContentLength"],
+                                     content_encoding=head.get("ContentEncoding") or ""):
+        return "fixed"
+    return "failed"
+
+
+def manifest_path(manifest_dir, prefix):
+    """JSON file caching a prefix's listing."""
+    return os.path.join(manifest_dir, prefix.strip("/").replace("/", "_") + ".json")
+
+
+def iter_objects(s3_client, prefixes, workers, manifests=None):
+    """
+    Every object under the prefixes, as one stream; sub-prefixes are listed in parallel.
+
+    With manifests (prefix -> PrefixManifest), only the objects directly under each
+    prefix and in the sub-prefixes its refresh relisted are yielded. The manifests
+    are refreshed without saving, so an interrupted run is redone in full.
+    """
+    for prefix in prefixes:
+        if manifests:
+            manifest = manifests[prefix]
+            manifest.refresh(save=False)
+            yield from manifest.root_objects
+            for sub_prefix in manifest.relisted:
+                yield from manifest.iter_objects(sub_prefix)
+            continue
+        for _, objects in s3_client.iter_files_parallel(prefix, max_workers=workers):
+            yield from objects
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prefixes", nargs="*",
+                        default=[S3_FOLDER, S3FileManager.CONTENT_ADDRESSED_PREFIX],
+                        help="Prefixes to scan (default: documents and content-addressed blobs).")
+    parser.add_argument("--sniff", action="store_true", help="Also check each object's magic bytes.")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent HEAD/copy requests.")
+    parser.add_argument("--dry-run", action="store_true", help="Report mismatches without rewriting.")
+    parser.add_argument("--manifest-dir", help="Cache listings here and skip unchanged sub-prefixes on reruns.")
+    parser.add_argument("--manifest-max-age", type=float,
+                        help="Seconds after which a cached sub-prefix is checked again (default: never).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    s3_client = S3FileManager()
+    manifests = None
+    if args.manifest_dir:
+        os.makedirs(args.manifest_dir, exist_ok=True)
+        manifests = {prefix: PrefixManifest(s3_client, prefix, manifest_path(args.manifest_dir, prefix),
+                                            args.manifest_max_age, max_workers=args.workers)
+                     for prefix in args.prefixes}
+    counts = {"ok": 0, "fixed": 0, "failed": 0}
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            key = pending.pop(future)
+            result = future.result()
+            counts[result] += 1
+            if result == "failed" and manifests:
+                # Checked again on the next run
+                for manifest in manifests.values():
+                    manifest.invalidate(key)
+
+    # One window across every prefix, so a small sub-prefix never leaves workers idle
+    # while a large one finishes, and huge listings stay in constant memory
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for obj in iter_objects(s3_client, args.prefixes, args.workers, manifests):
+            pending[executor.submit(backfill_object, s3_client, obj, args.sniff, args.dry_run)] = obj["Key"]
+            if len(pending) >= args.workers * 4:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(list(pending))
+    if manifests and not args.dry_run:
+        for manifest in manifests.values():
+            manifest.save()
+    logging.info("%s objects already correct, %s %s, %s failed", counts["ok"], counts["fixed"],
+                 "to fix" if args.dry_run else "fixed", counts["failed"])
+    return 0 if not counts["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
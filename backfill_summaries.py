@@ -0,0 +1,34 @@
+"""
+Add the `summary` subdocument to documents written before it existed.
+
+The summary (file count, total size, short description) is computed
+server-side with a pipeline update, so no document is read by this script.
+
+Usage (from the repository root):
+    python backfill_summaries.py          # documents without a summary
+    python backfill_summaries.py --all    # recompute every summary
+"""
+# External imports
+import argparse
+import logging
+import sys
+
+from mongodb_client import AtlasClient
+from search import SUMMARY_PIPELINE
+from config import COLLECTION_NAME
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="Recompute summaries that already exist.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    filter = {} if args.all else {"summary": {"$exists": False}}
+    modified = AtlasClient().update_many(COLLECTION_NAME, filter, SUMMARY_PIPELINE)
+    logging.info(f"Updated the summary of {modified} document(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Benchmark the search_page query patterns on synthetic `documents` corpora.
+
+Generates corpora of realistic documents (tags, flags, dates, files and, for a
+share of them, crawl_results) in a local mongod and replays the filters built by
+`search.build_search_query`: regex `$or`, tags `$in`, flags `$in`, date ranges and
+combinations, under every sort option. Each case is measured two ways:
+
+- materialize: what search_page does today, fetch every match, sort in Python, slice a page
+- server: sort and limit in MongoDB, fetch one page
+- list: like server, with the "list" projection profile the search page uses
+
+and reports latency (p50/p99), documents and keys examined (from explain), and
+documents and bytes returned. Results are written as one JSON object per line.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_mongo --sizes 1000,100000,1000000
+    python -m benchmarks.bench_mongo --uri mongodb://localhost:27017 --with-indexes --output mongo.jsonl
+"""
+# External imports
+import argparse
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import bson
+from pymongo import MongoClient
+
+from config import DEFAULT_FLAGS
+from mongodb_client import AtlasClient
+from search import SORT_OPTIONS, SORT_SPECS, build_search_query, sort_documents, document_summary
+
+WORDS = (
+    "annual report invoice contract policy onboarding research summary draft final review "
+    "budget forecast market analysis strategy roadmap meeting notes minutes proposal audit "
+    "compliance security design architecture quarterly customer product release training"
+).split()
+EXTRA_FLAGS = ["Archive", "Urgent", "Legal", "Finance"]
+TAG_VOCABULARY = [f"tag{i}" for i in range(500)]
+PER_PAGE = 10
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def zipf_choice(rng, items, s=1.1):
+    """Pick from items with a Zipf-like skew, so a few tags are very common."""
+    weights = getattr(zipf_choice, "_weights", None)
+    if weights is None or len(weights) != len(items):
+        weights = [1 / (rank ** s) for rank in range(1, len(items) + 1)]
+        zipf_choice._weights = weights
+    return rng.choices(items, weights=weights, k=1)[0]
+
+
+def make_document(rng, now):
+    """Build one synthetic document shaped like the records insert_page writes."""
+    doc_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    created = now - timedelta(seconds=rng.randint(0, 3 * 365 * 24 * 3600))
+    name = " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title()
+    files = [
+        {
+            "filename": f"file_{i}.pdf",
+            "s3_key": f"qu-agents/documents/{doc_id}/file_{i}.pdf",
+            "s3_url": f"https://bucket.s3.amazonaws.com/qu-agents/documents/{doc_id}/file_{i}.pdf",
+            "size": rng.randint(10_000, 50_000_000),
+            "type": "application/pdf",
+        }
+        for i in range(rng.randint(1, 3))
+    ]
+    document = {
+        "doc_id": doc_id,
+        "name": name,
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(15, 60))),
+        "tags": list(dict.fromkeys(zipf_choice(rng, TAG_VOCABULARY) for _ in range(rng.randint(1, 6)))),
+        "notes": " ".join(rng.choices(WORDS, k=rng.randint(0, 30))),
+        "flags": rng.sample(DEFAULT_FLAGS + EXTRA_FLAGS, k=rng.choice([0, 1, 1, 1, 2])),
+        "files": files,
+        "created_at": created,
+        "updated_at": created + timedelta(seconds=rng.randint(0, 90 * 24 * 3600)),
+    }
+    # Deep-dive documents carry large crawl_results arrays
+    if rng.random() < 0.05:
+        document["crawl_results"] = [
+            {
+                "url": f"https://example.com/{doc_id}/{i}",
+                "title": name,
+                "content": " ".join(rng.choices(WORDS, k=150))[:1000],
+                "links": [f"https://example.com/{doc_id}/{i}/{j}" for j in range(10)],
+                "depth": rng.randint(0, 2),
+            }
+            for i in range(rng.randint(5, 40))
+        ]
+    document["summary"] = document_summary(document)
+    return document
+
+
+def ensure_corpus(database, size, seed=42, batch_size=5000):
+    """Create (or reuse) the collection holding a corpus of `size` documents."""
+    collection = database[f"documents_{size}"]
+    if collection.estimated_document_count() == size:
+        return collection
+    collection.drop()
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    batch = []
+    for _ in range(size):
+        batch.append(make_document(rng, now))
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    return collection
+
+
+def query_shapes():
+    """The filters search_page builds for each kind of user input."""
+    today = datetime(2025, 1, 1).date()
+    return {
+        "text_regex": build_search_query("report"),
+        "text_regex_rare": build_search_query("roadmap audit"),
+        "tags_popular": build_search_query(tags=["tag0"]),
+        "tags_rare": build_search_query(tags=["tag400", "tag450"]),
+        "flags": build_search_query(flags=["Review", "Ignore"]),
+        "date_30d": build_search_query(start_date=today - timedelta(days=30), end_date=today),
+        "combined": build_search_query("report", tags=["tag0", "tag1"], flags=["Review"],
+                                       start_date=today - timedelta(days=365)),
+        "no_filter": build_search_query(),
+    }
+
+
+def explain_stats(collection, query, sort=None, limit=0):
+    """Docs/keys examined and server time for a find, from explain executionStats."""
+    command = {"find": collection.name, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    if limit:
+        command["limit"] = limit
+    stats = collection.database.command("explain", command, verbosity="executionStats")["executionStats"]
+    return {
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "server_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def run_case(collection, query, sort_by, mode, repeat):
+    """Time one query shape under one sort option and one fetch mode."""
+    latencies = []
+    returned = 0
+    returned_bytes = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        if mode == "materialize":
+            documents = list(collection.find(query))
+            sort_documents(documents, sort_by)
+            page = documents[:PER_PAGE]
+        else:
+            projection = AtlasClient.PROJECTIONS["list"] if mode == "list" else None
+            documents = list(collection.find(query, projection).sort(SORT_SPECS[sort_by]).limit(PER_PAGE))
+            page = documents
+        latencies.append(time.perf_counter() - started)
+        returned = len(documents)
+        returned_bytes = sum(len(bson.encode(doc)) for doc in documents)
+        del page, documents
+
+    sort = SORT_SPECS[sort_by] if mode != "materialize" else None
+    result = explain_stats(collection, query, sort, PER_PAGE if mode != "materialize" else 0)
+    result.update(
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        docs_returned=returned,
+        bytes_returned=returned_bytes,
+    )
+    return result
+
+
+def create_indexes(collection):
+    collection.create_index("tags")
+    collection.create_index("flags")
+    collection.create_index([("created_at", -1)])
+    collection.create_index([("updated_at", -1)])
+    collection.create_index("name")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="dms_bench")
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modes", default="materialize,server,list")
+    parser.add_argument("--with-indexes", action="store_true", help="Index tags, flags, dates and name first.")
+    parser.add_argument("--output", help="JSONL file for results (stdout if omitted).")
+    args = parser.parse_args(argv)
+
+    database = MongoClient(args.uri)[args.db]
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            started = time.perf_counter()
+            collection = ensure_corpus(database, size)
+            print(f"corpus {size}: ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            if args.with_indexes:
+                create_indexes(collection)
+            for shape, query in query_shapes().items():
+                for sort_by in SORT_OPTIONS:
+                    for mode in args.modes.split(","):
+                        result = run_case(collection, query, sort_by, mode, args.repeat)
+                        result.update(corpus_size=size, shape=shape, sort=sort_by, mode=mode,
+                                      indexed=args.with_indexes, timestamp=time.time())
+                        output.write(json.dumps(result) + "\n")
+                        output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Benchmark S3FileManager transfer paths against a local S3-compatible server.
+
+Runs upload_file, upload_file_from_bytes, download_file_to_bytes, list_files and
+download_directory across object sizes and concurrency levels. Each case runs in
+a fresh subprocess so peak RSS is measured per case. Results are written as one
+JSON object per line.
+
+Usage (from the repository root):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bench_s3                                  # in-process moto server
+    python -m benchmarks.bench_s3 --endpoint-url http://localhost:9000 \\
+        --access-key minioadmin --secret-key minioadmin             # MinIO
+    python -m benchmarks.bench_s3 --sizes 1KB,1MB --concurrency 1,8 --output s3.jsonl
+"""
+# External imports
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+OPERATIONS = ["upload_file", "upload_file_from_bytes", "download_file_to_bytes", "list_files", "download_directory"]
+DEFAULT_SIZES = "1KB,64KB,1MB,16MB,128MB,1GB"
+DEFAULT_CONCURRENCY = "1,4,16"
+BENCH_PREFIX = "bench/"
+UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse sizes such as 1KB, 16MB or 1GB into bytes."""
+    text = text.strip().upper()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if platform.system() == "Darwin" else peak / 1024
+
+
+def write_random_file(path, size, chunk_size=8 * 1024 * 1024):
+    """Write `size` incompressible bytes to `path` without holding them in memory."""
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            n = min(chunk_size, remaining)
+            f.write(os.urandom(n))
+            remaining -= n
+
+
+def ops_for(size, concurrency, budget_bytes=512 * 1024 ** 2):
+    """Number of operations in a case: enough for stable percentiles, bounded in bytes moved."""
+    return max(concurrency, min(100, budget_bytes // max(size, 1)))
+
+
+def run_case(case):
+    """
+    Run one benchmark case in the current process and return its result.
+
+    Args:
+    case: dict - operation, size, concurrency and ops
+
+    Returns:
+    dict: the case with timings, throughput and peak RSS added
+    """
+    from s3_file_manager import S3FileManager
+
+    s3 = S3FileManager()
+    operation, size, concurrency, ops = case["operation"], case["size"], case["concurrency"], case["ops"]
+    run_prefix = f"{BENCH_PREFIX}{uuid.uuid4()}/"
+    workdir = tempfile.mkdtemp(prefix="bench_s3_")
+    source = os.path.join(workdir, "source.bin")
+    write_random_file(source, size)
+
+    def key(i):
+        return f"{run_prefix}obj_{i}.bin"
+
+    # Objects the read paths need, created outside the timed section
+    if operation in ("download_file_to_bytes", "list_files", "download_directory"):
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda i: asyncio.run(s3.upload_file(source, key(i))), range(ops)))
+
+    if operation == "upload_file":
+        def op(i):
+            assert asyncio.run(s3.upload_file(source, key(i)))
+            return size
+    elif operation == "upload_file_from_bytes":
+        with open(source, "rb") as f:
+            payload = f.read()
+
+        def op(i):
+            assert s3.upload_file_from_bytes(payload, key(i))
+            return size
+    elif operation == "download_file_to_bytes":
+        def op(i):
+            return len(s3.download_file_to_bytes(key(i)))
+    elif operation == "list_files":
+        def op(i):
+            return len(s3.list_files(run_prefix))
+    elif operation == "download_directory":
+        def op(i):
+            target = os.path.join(workdir, f"dir_{i}")
+            os.makedirs(target)
+            assert s3.download_directory(run_prefix, target + "/")
+            return sum(os.path.getsize(os.path.join(target, name)) for name in os.listdir(target))
+    else:
+        raise ValueError(f"Unknown operation {operation}")
+
+    # list_files and download_directory touch the whole prefix per call, so fewer calls
+    calls = ops if operation not in ("list_files", "download_directory") else max(concurrency, 5)
+    latencies = []
+
+    def timed(i):
+        started = time.perf_counter()
+        moved = op(i)
+        latencies.append(time.perf_counter() - started)
+        return moved
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        moved = sum(executor.map(timed, range(calls)))
+    elapsed = time.perf_counter() - started
+
+    # Clean up the bucket and the local files
+    for obj in s3.list_files(run_prefix) or []:
+        s3.delete_file(obj["Key"])
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return dict(
+        case,
+        calls=calls,
+        bytes=moved,
+        seconds=round(elapsed, 6),
+        ops_per_s=round(calls / elapsed, 3),
+        throughput_mb_s=round(moved / 1024 ** 2 / elapsed, 3),
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        peak_rss_mb=round(peak_rss_mb(), 1),
+    )
+
+
+def start_moto_server():
+    """Start an in-process moto S3 server on a free port and return (server, endpoint)."""
+    from moto.server import ThreadedMotoServer
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint; an in-process moto server is started if omitted.")
+    parser.add_argument("--access-key", default="testing")
+    parser.add_argument("--secret-key", default="testing")
+    parser.add_argument("--bucket", default="dms-bench")
+    parser.add_argument("--operations", default=",".join(OPERATIONS))
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--output", help="JSONL file for results (stdout if omitted).")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    server = None
+    endpoint = args.endpoint_url
+    if not endpoint:
+        server, endpoint = start_moto_server()
+
+    env = dict(
+        os.environ,
+        AWS_ENDPOINT_URL=endpoint,
+        AWS_ACCESS_KEY=args.access_key,
+        AWS_SECRET_KEY=args.secret_key,
+        AWS_ACCESS_KEY_ID=args.access_key,
+        AWS_SECRET_ACCESS_KEY=args.secret_key,
+        AWS_BUCKET_NAME=args.bucket,
+        AWS_REGION=os.getenv("AWS_REGION", "us-east-1"),
+    )
+    import boto3
+    bootstrap = boto3.client("s3", endpoint_url=endpoint, region_name=env["AWS_REGION"],
+                             aws_access_key_id=args.access_key, aws_secret_access_key=args.secret_key)
+    try:
+        bootstrap.create_bucket(Bucket=args.bucket)
+    except bootstrap.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    revision = git_revision()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for operation in args.operations.split(","):
+            for size in (parse_size(s) for s in args.sizes.split(",")):
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    case = {"operation": operation, "size": size, "concurrency": concurrency,
+                            "ops": ops_for(size, concurrency)}
+                    completed = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.bench_s3", "--case", json.dumps(case)],
+                        cwd=root, env=env, capture_output=True, text=True,
+                    )
+                    if completed.returncode != 0:
+                        result = dict(case, error=completed.stderr.strip().splitlines()[-1:])
+                    else:
+                        result = json.loads(completed.stdout.strip().splitlines()[-1])
+                    result.update(endpoint=endpoint, revision=revision, timestamp=time.time())
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if server:
+            server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
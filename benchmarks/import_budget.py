@@ -0,0 +1,98 @@
+"""
+Check the cold-start import cost of app.py against a budget.
+
+Imports app.py in fresh interpreters with `python -X importtime`, takes the
+median over several runs and reports the slowest top-level imports. Fails when
+app.py's own share of the import time (everything except Streamlit itself) is
+over budget, or when a dependency that should load lazily (crawler, PDF,
+imaging, Arrow and AWS SDK modules) is imported at start-up.
+
+Usage (from the repository root):
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 400 --runs 7 --output imports.jsonl
+"""
+# External imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules only the Dive Deeper page, previews, text extraction, exports or the first S3 call need
+LAZY_MODULES = ("requests", "bs4", "PyPDF2", "fitz", "PIL", "boto3", "pyarrow")
+# Import cost outside this repository's control
+EXCLUDED_MODULES = ("streamlit",)
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+    dict: top-level module -> cumulative microseconds, and the set of every imported module
+    """
+    top_level, imported = {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        module = name.rstrip()
+        nested = len(module) - len(module.lstrip())
+        module = module.strip()
+        imported.add(module)
+        if nested == 1:
+            top_level[module] = top_level.get(module, 0) + int(cumulative)
+    return top_level, imported
+
+
+def measure(module, repo_root):
+    """Import `module` once in a fresh interpreter and return its parsed import times."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=repo_root, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500.0,
+                        help="Budget for the import time not spent in Streamlit itself.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to report.")
+    parser.add_argument("--output", help="JSONL file to append the result to.")
+    args = parser.parse_args(argv)
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # Warm the OS file cache so the runs measure import work, not disk reads
+    measure(args.module, repo_root)
+    runs = [measure(args.module, repo_root) for _ in range(args.runs)]
+
+    modules = set().union(*(top for top, _ in runs))
+    median_us = {m: statistics.median(top.get(m, 0) for top, _ in runs) for m in modules}
+    total_ms = sum(median_us.values()) / 1000
+    excluded_ms = sum(median_us.get(m, 0) for m in EXCLUDED_MODULES) / 1000
+    own_ms = total_ms - excluded_ms
+    eager = sorted(m for m in LAZY_MODULES if any(m in imported for _, imported in runs))
+
+    print(f"import {args.module}: {total_ms:.0f} ms total, {excluded_ms:.0f} ms in "
+          f"{', '.join(EXCLUDED_MODULES)}, {own_ms:.0f} ms budgeted (limit {args.budget_ms:.0f} ms)")
+    for module, us in sorted(median_us.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {module}")
+    if eager:
+        print(f"Imported eagerly but should load lazily: {', '.join(eager)}")
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({"module": args.module, "total_ms": round(total_ms, 1), "own_ms": round(own_ms, 1),
+                                "budget_ms": args.budget_ms, "eager": eager, "timestamp": time.time()}) + "\n")
+    return 0 if own_ms <= args.budget_ms and not eager else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
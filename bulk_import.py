@@ -0,0 +1,351 @@
+# External imports
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from mongodb_client import AtlasClient
+from s3_file_manager import S3FileManager
+from content_store import ContentStore
+from content_index import ContentIndex, INDEXABLE_EXTENSIONS
+from previews import PreviewGenerator
+from usage_stats import UsageStats
+from search import document_summary
+from content_types import detect_content_type, read_head
+from config import COLLECTION_NAME, S3_FOLDER, CONTENT_ADDRESSED_STORAGE
+
+# Namespace for deterministic doc ids, so a resumed run reuses the same S3 keys
+IMPORT_NAMESPACE = uuid.UUID("6f1c1f0e-5b7a-4f43-9d7c-2f4b1f1d9a61")
+
+
+def _split_list(value):
+    """Accept either a list or a comma/semicolon separated string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).replace(";", ",").split(",") if v.strip()]
+
+
+def items_from_directory(root, tags=None, flags=None, dir_tags=False):
+    """
+    Walk a directory tree and yield one import item per file.
+
+    Args:
+    root: str - directory to import
+    tags: list - tags added to every document
+    flags: list - flags added to every document
+    dir_tags: bool - also tag each document with its parent folder names
+
+    Returns:
+    generator: import items
+    """
+    root = os.path.abspath(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, root)
+        folder_tags = [] if rel_dir == "." else [p.lower() for p in rel_dir.split(os.sep)]
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, root)
+            yield {
+                "source": path,
+                "paths": [path],
+                "name": os.path.splitext(filename)[0],
+                "description": f"Imported from {rel_path}",
+                "tags": list(tags or []) + (folder_tags if dir_tags else []),
+                "notes": "",
+                "flags": list(flags or []),
+            }
+
+
+def items_from_manifest(manifest_path, tags=None, flags=None):
+    """
+    Read a CSV or JSONL manifest and yield one import item per row.
+
+    Each row needs `path` (several paths may be separated by `;`) and may set
+    `name`, `description`, `tags`, `notes`, `flags` and `id`. Relative paths are
+    resolved against the manifest's directory.
+
+    Args:
+    manifest_path: str - path to a .csv or .jsonl file
+    tags: list - tags added to every document
+    flags: list - flags added to every document
+
+    Returns:
+    generator: import items
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if manifest_path.lower().endswith((".jsonl", ".ndjson")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for line_no, row in enumerate(rows, start=1):
+            raw_paths = row.get("path") or row.get("paths") or []
+            if isinstance(raw_paths, str):
+                raw_paths = [p.strip() for p in raw_paths.split(";") if p.strip()]
+            paths = [os.path.normpath(os.path.join(base_dir, p)) for p in raw_paths]
+            if not paths:
+                logging.error(f"Manifest row {line_no} has no path, skipping")
+                continue
+            name = row.get("name") or os.path.splitext(os.path.basename(paths[0]))[0]
+            yield {
+                "source": row.get("id") or "|".join(paths),
+                "paths": paths,
+                "name": name,
+                "description": row.get("description") or f"Imported from {os.path.basename(paths[0])}",
+                "tags": list(tags or []) + _split_list(row.get("tags")),
+                "notes": row.get("notes") or "",
+                "flags": list(flags or []) + _split_list(row.get("flags")),
+            }
+
+
+def load_checkpoint(checkpoint_path):
+    """Return the set of sources already imported by a previous run."""
+    done = set()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)["source"])
+    return done
+
+
+class BulkImporter:
+    """
+    Uploads import items to S3 concurrently and writes their `documents`
+    records in batches.
+
+    Attributes:
+    -----------
+    mongo_client: AtlasClient
+        Client used for the bulk metadata inserts.
+    s3_client: S3FileManager
+        Client used for the uploads.
+    workers: int
+        Number of concurrent upload threads.
+    batch_size: int
+        Number of documents written per `insert_many`.
+    checkpoint_path: str
+        JSONL file recording every imported source, used to resume.
+    content_store: ContentStore
+        Content-addressed store used instead of per-document keys, if set.
+    content_index: ContentIndex
+        Full-text index fed with the text of PDFs and text files, if set.
+    preview_generator: PreviewGenerator
+        Thumbnail renderer for PDFs and images, if set.
+    """
+
+    def __init__(self, mongo_client, s3_client, workers=8, batch_size=200,
+                 checkpoint_path=None, report_every=5.0, content_store=None,
+                 content_index=None, preview_generator=None):
+        self.mongo_client = mongo_client
+        self.s3_client = s3_client
+        self.content_store = content_store
+        self.content_index = content_index
+        self.preview_generator = preview_generator
+        self.usage_stats = UsageStats(mongo_client)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.report_every = report_every
+        self.files = 0
+        self.bytes = 0
+        self.documents = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = None
+        self._last_report = 0.0
+
+    def _upload_item(self, item):
+        """
+        Upload every file of an item and return (source, document record), or None.
+        The record is None when a previous run already wrote the document.
+        """
+        doc_id = str(uuid.uuid5(IMPORT_NAMESPACE, item["source"]))
+        # A run that crashed between insert and checkpoint wrote the document already;
+        # storing its files again would add a second reference to each blob
+        if self.content_store and self.mongo_client.find(
+                COLLECTION_NAME, {"doc_id": doc_id}, limit=1, projection={"doc_id": 1, "_id": 0}):
+            return item["source"], None
+        s3_files = []
+        for path in item["paths"]:
+            filename = os.path.basename(path)
+            file_type = detect_content_type(filename, read_head(path))
+            if self.content_store:
+                file_info, _ = self.content_store.store_file(path, filename, file_type)
+            else:
+                file_key = f"{S3_FOLDER}{doc_id}/{filename}"
+                file_info = None
+                if asyncio.run(self.s3_client.upload_file(path, file_key, file_type)):
+                    file_info = {
+                        "filename": filename,
+                        "s3_key": file_key,
+                        "s3_url": f"https://{self.s3_client.bucket_name}.s3.amazonaws.com/{file_key}",
+                        "size": os.path.getsize(path),
+                        "type": file_type,
+                    }
+            if not file_info:
+                logging.error(f"Failed to upload {path}")
+                return None
+            if self.preview_generator:
+                self.preview_generator.add_preview(path, doc_id, file_info)
+            s3_files.append(file_info)
+        if self.content_index:
+            to_index = [(path, os.path.basename(path)) for path in item["paths"]
+                        if path.lower().endswith(INDEXABLE_EXTENSIONS)]
+            if to_index:
+                self.content_index.index_document(doc_id, to_index)
+        now = datetime.utcnow()
+        document = {
+            "doc_id": doc_id,
+            "name": item["name"],
+            "description": item["description"],
+            "tags": item["tags"],
+            "notes": item["notes"],
+            "flags": item["flags"],
+            "files": s3_files,
+            "created_at": now,
+            "updated_at": now,
+        }
+        document["summary"] = document_summary(document)
+        return item["source"], document
+
+    def _flush(self, batch, checkpoint):
+        """Insert a batch of documents, skipping ids a crashed run already wrote."""
+        if not batch:
+            return
+        ids = [doc["doc_id"] for _, doc in batch if doc]
+        existing = {
+            doc["doc_id"] for doc in
+            self.mongo_client.find(COLLECTION_NAME, {"doc_id": {"$in": ids}}, projection={"doc_id": 1, "_id": 0})
+        }
+        new_docs = [doc for _, doc in batch if doc and doc["doc_id"] not in existing]
+        self.mongo_client.insert_many(COLLECTION_NAME, new_docs)
+        self.usage_stats.record_insert(new_docs)
+        self.documents += len(new_docs)
+        if checkpoint:
+            for source, _ in batch:
+                checkpoint.write(json.dumps({"source": source}) + "\n")
+            checkpoint.flush()
+        batch.clear()
+
+    def _report(self, final=False):
+        now = time.monotonic()
+        if not final and now - self._last_report < self.report_every:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        print(
+            f"{'Done' if final else 'Progress'}: {self.documents} documents, {self.files} files, "
+            f"{self.bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({self.files / elapsed:.1f} files/s, {self.bytes / 1e6 / elapsed:.2f} MB/s), "
+            f"{self.skipped} skipped, {self.failed} failed",
+            file=sys.stderr,
+        )
+
+    def run(self, items):
+        """
+        Import items, resuming from the checkpoint if one exists.
+
+        Args:
+        items: iterable - import items from `items_from_directory` or `items_from_manifest`
+
+        Returns:
+        bool: True if every item was imported, False otherwise
+        """
+        done = load_checkpoint(self.checkpoint_path)
+        checkpoint = open(self.checkpoint_path, "a", encoding="utf-8") if self.checkpoint_path else None
+        self.started = time.monotonic()
+        batch = []
+        pending = {}
+        max_pending = self.workers * 4
+
+        def collect(futures):
+            for future in futures:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to import {item['source']}: {e}")
+                    result = None
+                if result is None:
+                    self.failed += 1
+                    continue
+                if result[1] is None:
+                    self.skipped += 1
+                else:
+                    self.files += len(item["paths"])
+                    self.bytes += sum(f["size"] for f in result[1]["files"])
+                # Checkpointed with the batch either way
+                batch.append(result)
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, checkpoint)
+                self._report()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for item in items:
+                    if item["source"] in done:
+                        self.skipped += 1
+                        continue
+                    pending[executor.submit(self._upload_item, item)] = item
+                    # Bound the number of in-flight items so huge trees stay in constant memory
+                    if len(pending) >= max_pending:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(finished)
+                collect(list(pending))
+            self._flush(batch, checkpoint)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        self._report(final=True)
+        return self.failed == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk import a directory tree or a CSV/JSONL manifest as documents.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="Directory to import, one document per file.")
+    source.add_argument("--manifest", help="CSV or JSONL manifest with path, name, description, tags, notes, flags.")
+    parser.add_argument("--tag", action="append", default=[], help="Tag added to every document (repeatable).")
+    parser.add_argument("--flag", action="append", default=[], help="Flag added to every document (repeatable).")
+    parser.add_argument("--dir-tags", action="store_true", help="Tag documents with their folder names.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent uploads.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Documents per bulk insert.")
+    parser.add_argument("--checkpoint", default=".bulk_import_checkpoint.jsonl",
+                        help="Checkpoint file used to resume an interrupted import.")
+    parser.add_argument("--no-index", action="store_true", help="Skip text extraction and content indexing.")
+    parser.add_argument("--no-previews", action="store_true", help="Skip thumbnail generation.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.manifest:
+        items = items_from_manifest(args.manifest, args.tag, args.flag)
+    else:
+        items = items_from_directory(args.directory, args.tag, args.flag, args.dir_tags)
+
+    mongo_client, s3_client = AtlasClient(), S3FileManager()
+    importer = BulkImporter(
+        mongo_client, s3_client,
+        workers=args.workers, batch_size=args.batch_size, checkpoint_path=args.checkpoint,
+        content_store=ContentStore(mongo_client, s3_client) if CONTENT_ADDRESSED_STORAGE else None,
+        content_index=None if args.no_index else ContentIndex(mongo_client),
+        preview_generator=None if args.no_previews else PreviewGenerator(s3_client),
+    )
+    if importer.content_index:
+        importer.content_index.ensure_indexes()
+    return 0 if importer.run(items) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Cross-replica cache invalidation driven by MongoDB change streams.
+
+Every app replica runs one ChangeWatcher that follows writes to the watched
+collections (from any replica or tool) and publishes them on an in-process
+InvalidationBus. InvalidatingCache instances subscribe to the collections their
+values are derived from and drop everything when one of them changes.
+
+Change streams need a replica set. On a standalone mongod (local development,
+tests) the watcher falls back to polling a cheap per-collection signature.
+"""
+# External imports
+import json
+import logging
+import os
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import REGISTRY
+
+# Server error codes meaning change streams are unavailable (standalone mongod) or the
+# resume token is no longer in the oplog
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40324)
+CHANGE_STREAM_HISTORY_LOST = (280, 286)
+
+
+class InvalidationBus:
+    """
+    In-process publish/subscribe of collection change events.
+
+    Methods:
+    --------
+    subscribe(collection, callback)
+        Call callback(event) for every change to a collection.
+    publish(collection, event)
+        Deliver a change event to the collection's subscribers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, collection, callback):
+        with self._lock:
+            self._subscribers.setdefault(collection, []).append(callback)
+
+    def publish(self, collection, event=None):
+        """
+        Deliver a change event to the collection's subscribers.
+
+        Args:
+        collection: str - the collection that changed
+        event: dict - operation and document key, or None when the change is unknown
+        """
+        REGISTRY.inc("dms_cache_invalidations_total", collection=collection)
+        with self._lock:
+            callbacks = list(self._subscribers.get(collection, []))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Cache invalidation callback failed for {collection}: {e}")
+
+    def publish_all(self):
+        """Invalidate every subscriber, e.g. after missing changes."""
+        with self._lock:
+            collections = list(self._subscribers)
+        for collection in collections:
+            self.publish(collection)
+
+
+class InvalidatingCache:
+    """
+    Dict-like cache of values derived from some collections, cleared whenever
+    one of them changes.
+
+    Attributes:
+    -----------
+    name: str
+        Label used in the hit/miss metrics.
+    enabled: bool
+        When False every get() loads, e.g. when nothing publishes invalidations.
+    """
+
+    def __init__(self, bus, collections, name="cache", enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._values = {}
+        self._generation = 0
+        for collection in collections:
+            bus.subscribe(collection, lambda event: self.invalidate())
+
+    def get(self, key, loader):
+        """
+        Return the cached value for key, loading it with loader() on a miss.
+        A value loaded while an invalidation arrived is returned but not cached.
+        """
+        if not self.enabled:
+            return loader()
+        with self._lock:
+            if key in self._values:
+                REGISTRY.inc("dms_cache_requests_total", cache=self.name, result="hit")
+                return self._values[key]
+            generation = self._generation
+        REGISTRY.inc("dms_cache_requests_total", cache=self.name, result="miss")
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._values[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
+
+
+class ChangeWatcher:
+    """
+    Background thread publishing changes of some collections to an InvalidationBus.
+
+    Follows a change stream on the database, persisting the resume token so a
+    reconnect or restart continues where it stopped. If the server can't run
+    change streams, polls each collection's document count and newest
+    timestamps instead, over descending indexes it creates on the timestamps.
+
+    Attributes:
+    -----------
+    mongo_client: AtlasClient
+        Client whose database is watched.
+    bus: InvalidationBus
+        Where changes are published.
+    collections: list
+        Names of the watched collections.
+    token_path: str
+        JSON file holding the last resume token, optional.
+    poll_interval: float
+        Seconds between polls in fallback mode.
+    mode: str
+        "auto", "watch" or "poll".
+    """
+
+    POLL_FIELDS = ("updated_at", "created_at")
+
+    def __init__(self, mongo_client, bus, collections, token_path=None, poll_interval=5.0, mode="auto"):
+        self.mongo_client = mongo_client
+        self.bus = bus
+        self.collections = list(collections)
+        self.token_path = token_path
+        self.poll_interval = poll_interval
+        self.mode = mode
+        self.active_mode = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._saved_at = 0.0
+        self._saved_token = None
+
+    def ensure_indexes(self):
+        """Create the descending timestamp indexes polling sorts on, if they don't exist."""
+        for name in self.collections:
+            collection = self.mongo_client.get_collection(name)
+            for field in self.POLL_FIELDS:
+                collection.create_index([(field, -1)])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if self.mode == "poll":
+                    self._poll()
+                else:
+                    self._watch()
+                backoff = 1.0
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED and self.mode == "auto":
+                    logging.info("Change streams unavailable, polling for cache invalidation")
+                    self.mode = "poll"
+                elif e.code in CHANGE_STREAM_HISTORY_LOST:
+                    logging.warning("Change stream resume token expired, invalidating all caches")
+                    self._clear_token()
+                    self.bus.publish_all()
+                else:
+                    logging.error(f"Change stream failed: {e}")
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, 30.0)
+            except PyMongoError as e:
+                # Changes may have been missed while disconnected
+                logging.error(f"Change stream disconnected: {e}")
+                self.bus.publish_all()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        with self.mongo_client.database.watch(pipeline, resume_after=self._load_token(),
+                                              max_await_time_ms=1000) as stream:
+            self.active_mode = "watch"
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.bus.publish(change["ns"]["coll"], {
+                        "operation": change["operationType"],
+                        "key": change.get("documentKey"),
+                    })
+                # The token also advances past events filtered out by the pipeline
+                self._save_token(stream.resume_token)
+            self._save_token(stream.resume_token, force=True)
+
+    def _signature(self, collection_name):
+        """Count and newest timestamps of a collection; changes when it is written."""
+        collection = self.mongo_client.get_collection(collection_name)
+        signature = [collection.estimated_document_count()]
+        for field in self.POLL_FIELDS:
+            newest = collection.find_one({field: {"$exists": True}}, {field: 1}, sort=[(field, -1)])
+            signature.append(newest.get(field) if newest else None)
+        return signature
+
+    def _poll(self):
+        self.active_mode = "poll"
+        try:
+            self.ensure_indexes()
+        except PyMongoError as e:
+            # Polling still works without them, as collection scans
+            logging.error(f"Could not create polling indexes: {e}")
+        signatures = {name: self._signature(name) for name in self.collections}
+        while not self._stop.wait(self.poll_interval):
+            for name in self.collections:
+                signature = self._signature(name)
+                if signature != signatures[name]:
+                    signatures[name] = signature
+                    self.bus.publish(name, None)
+
+    def _load_token(self):
+        if not self.token_path or not os.path.exists(self.token_path):
+            return None
+        try:
+            with open(self.token_path) as f:
+                return json.load(f).get("resume_token")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable resume token {self.token_path}: {e}")
+            return None
+
+    def _clear_token(self):
+        self._saved_token = None
+        if self.token_path and os.path.exists(self.token_path):
+            os.remove(self.token_path)
+
+    def _save_token(self, token, force=False):
+        """Persist the resume token, at most once a second unless forced."""
+        if not self.token_path or token == self._saved_token:
+            return
+        if not force and time.monotonic() - self._saved_at < 1.0:
+            return
+        self._saved_at, self._saved_token = time.monotonic(), token
+        try:
+            tmp_path = f"{self.token_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"resume_token": token, "saved_at": time.time()}, f)
+            os.replace(tmp_path, self.token_path)
+        except OSError as e:
+            logging.warning(f"Could not save resume token: {e}")
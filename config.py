@@ -0,0 +1,55 @@
+# Shared configuration for the Streamlit app and the command-line tools
+import os
+
+# MongoDB collections
+COLLECTION_NAME = "documents"
+FLAGS_COLLECTION = "document_flags"
+HASH_COLLECTION = "file_hashes"
+CHUNKS_COLLECTION = "document_chunks"
+COUNTERS_COLLECTION = "usage_counters"
+
+# S3 prefix under which every document's files are stored
+S3_FOLDER = "qu-agents/documents/"
+
+# S3 prefix for rendered thumbnails
+PREVIEW_FOLDER = "qu-agents/previews/"
+
+# Flags created on first start
+DEFAULT_FLAGS = ["Review", "Convert", "Use", "Ignore"]
+
+# Store uploads once per SHA-256 digest and reference them from every document (opt-in:
+# documents then share blobs, and deleting or moving them goes through ref counts)
+CONTENT_ADDRESSED_STORAGE = os.getenv("CONTENT_ADDRESSED_STORAGE", "false").lower() in ("1", "true", "yes")
+
+# Serve Prometheus metrics on this port (disabled when unset)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Show the metrics panel in the sidebar (also enabled by ?debug=1)
+DEBUG_METRICS = os.getenv("DEBUG_METRICS", "false").lower() in ("1", "true", "yes")
+
+# Per-rerun profiling (also enabled by ?profile=1); dump is "cprofile" or "pyinstrument"
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "false").lower() in ("1", "true", "yes")
+PROFILE_DUMP = os.getenv("PROFILE_DUMP") or None
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Seconds between reloads of the tag suggestion vocabulary from the usage counters
+TAG_VOCABULARY_MAX_AGE = float(os.getenv("TAG_VOCABULARY_MAX_AGE", "300"))
+
+# Cross-replica cache invalidation: "auto" (change streams, polling on a standalone mongod), "watch", "poll" or "off"
+CACHE_INVALIDATION = os.getenv("CACHE_INVALIDATION", "auto").lower()
+CACHE_POLL_INTERVAL = float(os.getenv("CACHE_POLL_INTERVAL", "5"))
+CACHE_RESUME_TOKEN_PATH = os.getenv("CACHE_RESUME_TOKEN_PATH") or None
+
+# Search and browse reads go to secondaries when possible; writes and read-after-write stay causal
+SEARCH_READ_PREFERENCE = os.getenv("SEARCH_READ_PREFERENCE", "secondaryPreferred")
+SEARCH_MAX_STALENESS = int(os.getenv("SEARCH_MAX_STALENESS", "90"))  # seconds, -1 for no limit (min 90)
+SEARCH_READ_CONCERN = os.getenv("SEARCH_READ_CONCERN", "majority")
+
+# Search exports: up to EXPORT_INLINE_LIMIT results are downloaded directly, larger ones go to S3
+EXPORT_FOLDER = "qu-agents/exports/"
+EXPORT_INLINE_LIMIT = int(os.getenv("EXPORT_INLINE_LIMIT", "10000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# Retries of transient Mongo errors (attempts per call) and the app's per-call deadline in seconds, 0 for none
+MONGO_MAX_ATTEMPTS = int(os.getenv("MONGO_MAX_ATTEMPTS", "4"))
+MONGO_OPERATION_TIMEOUT = float(os.getenv("MONGO_OPERATION_TIMEOUT", "20"))
@@ -0,0 +1,154 @@
+# Opt-in Content-Encoding compression of text-like S3 objects, streamed in both directions
+import gzip
+import logging
+import zlib
+
+ENCODINGS = ("gzip", "zstd")
+
+# User metadata recording the encoding and original size, so copies that replace
+# the metadata can restate Content-Encoding
+ENCODING_METADATA_KEY = "content-encoding"
+SIZE_METADATA_KEY = "uncompressed-size"
+
+# Types worth compressing; images, video, PDFs and archives are compressed already
+COMPRESSIBLE_PREFIXES = ("text/",)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/xml", "application/javascript",
+                      "application/x-yaml", "image/svg+xml")
+
+# Bytes read from the source per step when compressing a stream
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_compressible(content_type):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_PREFIXES) or content_type in COMPRESSIBLE_TYPES
+
+
+def resolve_encoding(setting):
+    """
+    Validate an S3_COMPRESSION setting.
+
+    Args:
+    setting: str - "off", "gzip" or "zstd"
+
+    Returns:
+    str: the encoding to use, or None when compression is off. zstd falls back
+    to gzip when the zstandard package is not installed.
+    """
+    setting = (setting or "off").strip().lower()
+    if setting in ("", "off", "none", "false", "0"):
+        return None
+    if setting not in ENCODINGS:
+        logging.warning(f"Unknown S3_COMPRESSION {setting!r}, uploads are not compressed")
+        return None
+    if setting == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logging.warning("zstandard is not installed, falling back to gzip")
+            return "gzip"
+    return setting
+
+
+def _compressobj(encoding):
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def compress_bytes(data, encoding):
+    compressor = _compressobj(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressingReader:
+    """
+    Readable, non-seekable file object returning the compressed form of
+    another one, for upload_fileobj. Holds about one CHUNK_SIZE of output.
+    """
+
+    def __init__(self, source, encoding):
+        self.source = source
+        self._compressor = _compressobj(encoding)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self.source.read(CHUNK_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def decompressing_reader(body, encoding):
+    """Readable file object decompressing a streamed body (e.g. get_object's Body) as it is read."""
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+    return gzip.GzipFile(fileobj=body, mode="rb")
+
+
+class CompressingWriter:
+    """
+    Writable file object compressing into another one (e.g. a MultipartUploadWriter).
+    close() finishes the compressed stream and closes the target; leaving a
+    `with` block with an exception aborts the target instead, if it can.
+    """
+
+    def __init__(self, target, encoding):
+        self.target = target
+        self.closed = False
+        self._compressor = _compressobj(encoding)
+        self._written = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self._written += len(data)
+        compressed = self._compressor.compress(bytes(data))
+        if compressed:
+            self.target.write(compressed)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.target.write(self._compressor.flush())
+            self.target.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type and hasattr(self.target, "abort"):
+            self.closed = True
+            self.target.abort()
+        else:
+            self.close()
+        return False
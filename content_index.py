@@ -0,0 +1,225 @@
+# External imports
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from config import CHUNKS_COLLECTION
+
+# File types whose text is extracted at ingest time
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv')
+INDEXABLE_EXTENSIONS = ('.pdf',) + TEXT_EXTENSIONS
+
+# Pages handed to one worker; large PDFs are split so extraction runs in parallel
+PAGES_PER_TASK = 16
+
+_executor = None
+
+
+def get_executor():
+    """Return the shared extraction process pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        # Forking copies the parent's threads' locks (Streamlit, Mongo monitors, S3 pools) in
+        # whatever state they are in, which can deadlock the workers; start them clean instead
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _executor = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1),
+                                        mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def read_pdf_pages(file_path, start=0, stop=None):
+    """
+    Read the text and link URIs of a range of PDF pages.
+
+    Uses PyMuPDF and falls back to PyPDF2 (text only) if PyMuPDF fails.
+
+    Args:
+    file_path: str - path to the PDF
+    start: int - first page to read
+    stop: int - page to stop before, defaults to the last page
+
+    Returns:
+    list: (text, links) tuple per page
+    """
+    # PDF libraries are imported on first use to keep app start-up fast
+    import fitz  # PyMuPDF
+
+    pages = []
+    try:
+        doc = fitz.open(file_path)
+        for page_num in range(start, doc.page_count if stop is None else min(stop, doc.page_count)):
+            page = doc[page_num]
+            links = [link['uri'] for link in page.get_links() if link.get('uri')]
+            pages.append((page.get_text(), links))
+        doc.close()
+        return pages
+    except Exception as e:
+        logging.warning(f"PyMuPDF extraction failed for {file_path}: {e}")
+
+    import PyPDF2
+
+    pages = []
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        for page_num in range(start, page_count if stop is None else min(stop, page_count)):
+            pages.append((pdf_reader.pages[page_num].extract_text() or "", []))
+    return pages
+
+
+def pdf_page_count(file_path):
+    """Return the number of pages in a PDF."""
+    import fitz  # PyMuPDF
+
+    try:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception:
+        import PyPDF2
+
+        with open(file_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+
+def _extract_pdf_text(file_path, start, stop):
+    """Process pool task: text of a page range joined into one string."""
+    return "\n".join(text for text, _ in read_pdf_pages(file_path, start, stop))
+
+
+def _extract_plain_text(file_path):
+    """Process pool task: contents of a text file."""
+    with open(file_path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def chunk_text(text, chunk_words=200, overlap_words=20):
+    """
+    Split text into overlapping chunks of words.
+
+    Args:
+    text: str - text to split
+    chunk_words: int - words per chunk
+    overlap_words: int - words repeated at the start of the next chunk
+
+    Returns:
+    list: chunks of text
+    """
+    words = text.split()
+    step = max(1, chunk_words - overlap_words)
+    return [" ".join(words[i:i + chunk_words]) for i in range(0, len(words), step)]
+
+
+def submit_extraction(file_path, filename=None):
+    """
+    Start extracting the text of a file in the process pool.
+
+    Args:
+    file_path: str - local path of the file; it must exist until the futures finish
+    filename: str - original file name, used to pick the extractor
+
+    Returns:
+    list: futures, each resolving to a piece of text in page order; empty if the
+          file type is not indexable
+    """
+    extension = os.path.splitext(filename or file_path)[1].lower()
+    executor = get_executor()
+    if extension == '.pdf':
+        page_count = pdf_page_count(file_path)
+        return [
+            executor.submit(_extract_pdf_text, file_path, start, start + PAGES_PER_TASK)
+            for start in range(0, page_count, PAGES_PER_TASK)
+        ]
+    if extension in TEXT_EXTENSIONS:
+        return [executor.submit(_extract_plain_text, file_path)]
+    return []
+
+
+class ContentIndex:
+    """
+    Full-text index over the content of uploaded files.
+
+    Each indexed file is stored as chunks in `document_chunks` with a MongoDB
+    text index, so a document's content can be searched without reading it from S3.
+
+    Attributes:
+    -----------
+    mongo_client: AtlasClient
+        Client holding the chunk collection.
+    collection_name: str
+        The chunk collection.
+
+    Methods:
+    --------
+    ensure_indexes()
+        Create the text and doc_id indexes.
+    index_document(doc_id, files)
+        Extract, chunk and store the text of a document's files.
+    search(query, limit)
+        Return doc_ids whose content matches a query, best match first.
+    """
+
+    def __init__(self, mongo_client, collection_name=CHUNKS_COLLECTION):
+        self.mongo_client = mongo_client
+        self.collection_name = collection_name
+
+    def ensure_indexes(self):
+        """Create the text and doc_id indexes if they don't exist."""
+        collection = self.mongo_client.get_collection(self.collection_name)
+        collection.create_index([("text", "text")], name="text_search")
+        collection.create_index("doc_id")
+
+    def index_document(self, doc_id, files):
+        """
+        Extract, chunk and store the text of a document's files, replacing any
+        chunks previously stored for the document.
+
+        Args:
+        doc_id: str - id of the document
+        files: list - (local_path, filename) tuples
+
+        Returns:
+        int: the number of chunks stored
+        """
+        # Submit everything first so all files and page ranges extract in parallel
+        pending = [(filename, submit_extraction(path, filename)) for path, filename in files]
+        chunks = []
+        for filename, futures in pending:
+            try:
+                text = "\n".join(future.result() for future in futures)
+            except Exception as e:
+                logging.error(f"Text extraction failed for {filename}: {e}")
+                continue
+            now = datetime.utcnow()
+            for i, chunk in enumerate(chunk_text(text)):
+                chunks.append({
+                    "doc_id": doc_id,
+                    "filename": filename,
+                    "chunk": i,
+                    "text": chunk,
+                    "created_at": now,
+                })
+        self.mongo_client.delete_many(self.collection_name, {"doc_id": doc_id})
+        self.mongo_client.insert_many(self.collection_name, chunks)
+        return len(chunks)
+
+    def search(self, query, limit=500, **read_options):
+        """
+        Return doc_ids whose content matches a query, best match first.
+
+        Args:
+        query: str - words or "quoted phrases" to search for
+        limit: int - maximum number of doc_ids to return
+        read_options: read_preference, read_concern and session, see AtlasClient.aggregate
+
+        Returns:
+        list: matching doc_ids
+        """
+        pipeline = [
+            {"$match": {"$text": {"$search": query}}},
+            {"$group": {"_id": "$doc_id", "score": {"$max": {"$meta": "textScore"}}}},
+            {"$sort": {"score": -1}},
+            {"$limit": limit},
+        ]
+        return [row["_id"] for row in self.mongo_client.aggregate(self.collection_name, pipeline, **read_options)]
@@ -0,0 +1,103 @@
+# External imports
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from config import HASH_COLLECTION
+
+
+class ContentStore:
+    """
+    Content-addressed file storage backed by S3 and a SHA-256 hash index in MongoDB.
+
+    Identical bytes are stored once under `S3FileManager.CONTENT_ADDRESSED_PREFIX`
+    and referenced from every `files` entry that uploads them. The hash index
+    records where each digest lives and how many entries reference it.
+
+    Attributes:
+    -----------
+    mongo_client: AtlasClient
+        Client holding the hash index.
+    s3_client: S3FileManager
+        Client used for the uploads.
+    collection_name: str
+        The hash index collection, keyed by digest.
+
+    Methods:
+    --------
+    store_file(file_path, filename, content_type)
+        Store a file and return its `files` entry and whether it was already stored.
+    release(digest)
+        Drop one reference to stored content.
+    """
+
+    def __init__(self, mongo_client, s3_client, collection_name=HASH_COLLECTION):
+        self.mongo_client = mongo_client
+        self.s3_client = s3_client
+        self.collection_name = collection_name
+
+    def lookup(self, digest):
+        """Return the hash index entry for a digest, or None."""
+        entries = self.mongo_client.find(self.collection_name, {"_id": digest}, limit=1)
+        return entries[0] if entries else None
+
+    def store_file(self, file_path, filename=None, content_type=None):
+        """
+        Store a file, uploading it only if its content is not already known.
+
+        Args:
+        file_path: str - path to the file to store
+        filename: str - original file name, defaults to the basename of file_path
+        content_type: str - optional Content-Type of the object
+
+        Returns:
+        tuple: (`files` entry with filename, s3_key, s3_url, size, type and sha256,
+               or None if the upload failed; True if the content was already stored)
+        """
+        filename = filename or os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        digest = self.s3_client.sha256_file(file_path)
+
+        entry = self.lookup(digest)
+        if entry:
+            key, deduplicated = entry["s3_key"], True
+        else:
+            key, digest, uploaded = asyncio.run(self.s3_client.upload_file_content_addressed(
+                file_path, filename, content_type, digest))
+            if not key:
+                logging.error(f"Failed to store {filename}")
+                return None, False
+            deduplicated = not uploaded
+
+        self.mongo_client.update(
+            self.collection_name,
+            {"_id": digest},
+            {
+                "$setOnInsert": {"s3_key": key, "size": size, "created_at": datetime.utcnow()},
+                "$inc": {"ref_count": 1},
+            },
+            upsert=True,
+        )
+        file_info = {
+            "filename": filename,
+            "s3_key": key,
+            "s3_url": f"https://{self.s3_client.bucket_name}.s3.amazonaws.com/{key}",
+            "size": size,
+            "type": content_type,
+            "sha256": digest,
+        }
+        return file_info, deduplicated
+
+    def release(self, digest):
+        """
+        Drop one reference to stored content. The object itself is kept; orphaned
+        digests (ref_count <= 0) can be garbage-collected separately.
+
+        Args:
+        digest: str - SHA-256 hex digest of the content
+
+        Returns:
+        bool: True if successful, False otherwise
+        """
+        return self.mongo_client.update(self.collection_name, {"_id": digest}, {"$inc": {"ref_count": -1}})
@@ -0,0 +1,122 @@
+# Content-Type and Content-Disposition detection for uploads
+import mimetypes
+import os
+from urllib.parse import quote
+
+GENERIC_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+
+# Types browsers render inline; everything else is served as an attachment
+INLINE_PREFIXES = ("image/", "video/", "audio/", "text/")
+INLINE_TYPES = ("application/pdf", "application/json")
+
+# Number of leading bytes needed by sniff_content_type
+SNIFF_BYTES = 64
+
+# Extensions the mimetypes table may not know on slim images
+EXTRA_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".mp4": "video/mp4",
+    ".mp3": "audio/mpeg",
+    ".md": "text/markdown",
+}
+
+# Container formats: the magic bytes only say "zip" or "OLE", the extension says which document
+CONTAINER_TYPES = ("application/zip", "application/x-ole-storage")
+
+
+def sniff_content_type(head):
+    """
+    Identify common formats from their leading bytes.
+
+    Args:
+    head: bytes - at least SNIFF_BYTES leading bytes of the content
+
+    Returns:
+    str: the detected type, or None
+    """
+    if not head:
+        return None
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:10] == b"qt" else "video/mp4"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    if head.startswith(b"PK\x03\x04"):
+        return "application/zip"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "application/x-ole-storage"
+    return None
+
+
+def type_from_extension(filename):
+    """Content-Type implied by a file name's extension, or None."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    return EXTRA_TYPES.get(extension) or mimetypes.guess_type(filename or "")[0]
+
+
+def detect_content_type(filename=None, head=None, declared=None):
+    """
+    Decide the Content-Type of an upload.
+
+    A specific declared type (e.g. Streamlit's `UploadedFile.type`) wins, then
+    magic bytes, then the extension. Zip/OLE containers defer to the extension
+    so .docx/.doc keep their document types.
+
+    Args:
+    filename: str - original file name
+    head: bytes - leading bytes of the content, if available
+    declared: str - type reported by the client
+
+    Returns:
+    str: the Content-Type
+    """
+    if declared and declared.lower() not in GENERIC_TYPES:
+        return declared
+    sniffed = sniff_content_type(head)
+    if sniffed and sniffed not in CONTAINER_TYPES:
+        return sniffed
+    return type_from_extension(filename) or sniffed or "application/octet-stream"
+
+
+def disposition_for(content_type, filename=None):
+    """
+    Content-Disposition for a type: inline for types browsers render, attachment
+    otherwise, with an ASCII filename plus an RFC 5987 UTF-8 filename*.
+
+    Args:
+    content_type: str - the object's Content-Type
+    filename: str - download name, optional
+
+    Returns:
+    str: the header value
+    """
+    base_type = (content_type or "").split(";")[0].strip().lower()
+    inline = base_type.startswith(INLINE_PREFIXES) or base_type in INLINE_TYPES
+    disposition = "inline" if inline else "attachment"
+    if not filename:
+        return disposition
+    ascii_name = filename.encode("ascii", "ignore").decode().replace('"', "").replace("\\", "") or "download"
+    header = f'{disposition}; filename="{ascii_name}"'
+    if ascii_name != filename:
+        header += f"; filename*=UTF-8''{quote(filename)}"
+    return header
+
+
+def read_head(file_path):
+    """Leading bytes of a local file, or None if it can't be read."""
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(SNIFF_BYTES)
+    except OSError:
+        return None
@@ -0,0 +1,59 @@
+# Packing of deep-dive crawl pages into one S3 object, read back page by page with ranged GETs
+import gzip
+import json
+
+PACK_FILENAME = "crawl_pages.jsonl.gz"
+PACK_CONTENT_TYPE = "application/gzip"
+
+# Page fields repeated in the offset index, so pages can be listed without reading the pack
+INDEX_FIELDS = ("url", "title", "depth")
+
+
+def pack_pages(pages):
+    """
+    Serialize crawl results as gzip-compressed JSONL, one gzip member per page.
+
+    Concatenated gzip members are themselves a valid gzip file, so the whole
+    pack still decompresses to plain JSONL, while each page can also be read
+    alone by fetching and decompressing only its member.
+
+    Args:
+    pages: list - crawl results (url, title, content, links, depth, ...)
+
+    Returns:
+    tuple: (pack bytes, offset index: one dict per page with INDEX_FIELDS, offset and length)
+    """
+    members, index, offset = [], [], 0
+    for page in pages:
+        line = json.dumps(page, ensure_ascii=False, default=str) + "\n"
+        # mtime=0 keeps the pack identical for identical pages
+        member = gzip.compress(line.encode("utf-8"), mtime=0)
+        entry = {field: page.get(field) for field in INDEX_FIELDS}
+        entry.update(offset=offset, length=len(member))
+        index.append(entry)
+        members.append(member)
+        offset += len(member)
+    return b"".join(members), index
+
+
+def unpack_pages(data):
+    """All pages of a pack, in order."""
+    return [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines() if line]
+
+
+def read_page(s3_client, key, entry):
+    """
+    Read one page of a pack with a single ranged GET.
+
+    Args:
+    s3_client: S3FileManager - client holding the pack
+    key: str - key of the pack object
+    entry: dict - the page's entry in the offset index
+
+    Returns:
+    dict: the crawl result, or None if the range could not be read
+    """
+    member = s3_client.download_range(key, entry["offset"], entry["offset"] + entry["length"] - 1)
+    if not member:
+        return None
+    return json.loads(gzip.decompress(member).decode("utf-8"))
@@ -0,0 +1,249 @@
+"""
+Streaming export of search results to CSV, JSONL or Parquet.
+
+Documents are read from a Mongo cursor in batches and each batch is written
+before the next one is fetched, so memory use depends on the batch size, not
+on the number of results. Large exports are streamed to S3 with a multipart
+upload instead of a local file.
+
+Usage (from the repository root):
+    python export.py --format csv --output documents.csv
+    python export.py --query '{"flags": "Review"}' --format parquet --s3
+"""
+# External imports
+import argparse
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+
+from metrics import REGISTRY
+from config import COLLECTION_NAME, EXPORT_FOLDER, EXPORT_BATCH_SIZE, EXPORT_INLINE_LIMIT
+
+# Format -> (content type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Separator of list values (tags, flags, filenames) in CSV cells
+CSV_LIST_SEPARATOR = "; "
+
+
+def _timestamp(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def flatten(document):
+    """One export row of a document fetched with the "export" projection."""
+    files = document.get("files") or []
+    return {
+        "doc_id": document.get("doc_id"),
+        "name": document.get("name"),
+        "description": document.get("description"),
+        "notes": document.get("notes"),
+        "tags": list(document.get("tags") or []),
+        "flags": list(document.get("flags") or []),
+        "created_at": _timestamp(document.get("created_at")),
+        "updated_at": _timestamp(document.get("updated_at")),
+        "file_count": len(files),
+        "total_size": sum(f.get("size") or 0 for f in files),
+        "filenames": [f.get("filename") for f in files if f.get("filename")],
+    }
+
+
+def export_schema(flat_lists=False):
+    """Arrow schema of the flattened rows; list columns become strings when flat_lists is set (CSV)."""
+    import pyarrow as pa  # only exports need it
+
+    text_list = pa.string() if flat_lists else pa.list_(pa.string())
+    return pa.schema([
+        ("doc_id", pa.string()),
+        ("name", pa.string()),
+        ("description", pa.string()),
+        ("notes", pa.string()),
+        ("tags", text_list),
+        ("flags", text_list),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+        ("file_count", pa.int64()),
+        ("total_size", pa.int64()),
+        ("filenames", text_list),
+    ])
+
+
+def batch_table(documents, schema, flat_lists=False):
+    """Convert one batch of documents to an Arrow table with a fixed schema."""
+    import pyarrow as pa
+
+    rows = [flatten(document) for document in documents]
+    columns = {name: [row[name] for row in rows] for name in schema.names}
+    if flat_lists:
+        for name in ("tags", "flags", "filenames"):
+            columns[name] = [CSV_LIST_SEPARATOR.join(str(v) for v in values) for values in columns[name]]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class _JsonlWriter:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def write_batch(self, documents):
+        # Keep the nested document (files with their keys and hashes) rather than the flattened row
+        self.sink.write("".join(json.dumps(d, default=_json_default, ensure_ascii=False) + "\n"
+                                for d in documents).encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+class _ArrowWriter:
+    def __init__(self, sink, fmt):
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        self.flat_lists = fmt == "csv"
+        self.schema = export_schema(self.flat_lists)
+        if self.flat_lists:
+            self.writer = pyarrow.csv.CSVWriter(sink, self.schema)
+        else:
+            self.writer = pyarrow.parquet.ParquetWriter(sink, self.schema, compression="zstd")
+
+    def write_batch(self, documents):
+        # One Parquet row group per batch
+        self.writer.write_table(batch_table(documents, self.schema, self.flat_lists))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_documents(mongo_client, query, fmt, sink, sort=None, batch_size=EXPORT_BATCH_SIZE, **read_options):
+    """
+    Stream the documents matching a query to a binary file object.
+
+    Args:
+    mongo_client: AtlasClient - client to read from
+    query: dict - filter, e.g. from search.build_search_query
+    fmt: str - one of EXPORT_FORMATS
+    sink: file object - opened for binary writing; not closed here
+    sort: list - (field, direction) pairs, e.g. search.SORT_SPECS[sort_by]
+    batch_size: int - documents fetched and written at a time
+    read_options: read_preference, read_concern and session for the cursor
+
+    Returns:
+    int: number of documents written
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    writer = _JsonlWriter(sink) if fmt == "jsonl" else _ArrowWriter(sink, fmt)
+    count = 0
+    for documents in mongo_client.iter_find(COLLECTION_NAME, query, projection="export", sort=sort,
+                                            batch_size=batch_size, **read_options):
+        writer.write_batch(documents)
+        count += len(documents)
+    # Writes the CSV header or Parquet footer even for an empty result
+    writer.close()
+    REGISTRY.inc("dms_exported_documents_total", count, format=fmt)
+    return count
+
+
+def export_key(fmt, now=None):
+    """S3 key for a new export."""
+    now = now or datetime.utcnow()
+    return f"{EXPORT_FOLDER}documents-{now:%Y%m%d-%H%M%S}.{EXPORT_FORMATS[fmt][1]}"
+
+
+def export_to_s3(mongo_client, s3_client, query, fmt, key=None, **options):
+    """
+    Stream an export straight into S3 with a multipart upload.
+
+    Args:
+    mongo_client: AtlasClient - client to read from
+    s3_client: S3FileManager - where the export is written
+    query: dict - filter of the exported documents
+    fmt: str - one of EXPORT_FORMATS
+    key: str - destination key, defaults to export_key(fmt)
+    options: sort, batch_size and read options, as for export_documents
+
+    Returns:
+    tuple: (key, number of documents written)
+    """
+    key = key or export_key(fmt)
+    content_type = EXPORT_FORMATS[fmt][0]
+    filename = key.rsplit("/", 1)[-1]
+    with s3_client.open_upload_stream(key, content_type=content_type, filename=filename) as stream:
+        count = export_documents(mongo_client, query, fmt, stream, **options)
+    return key, count
+
+
+def export_for_download(mongo_client, s3_client, query, fmt, total, inline_limit=EXPORT_INLINE_LIMIT, **options):
+    """
+    Export search results for a user to download: up to inline_limit documents
+    are built in memory, larger exports are streamed to S3.
+
+    Args:
+    mongo_client: AtlasClient - client to read from
+    s3_client: S3FileManager - where large exports are written; unused otherwise
+    query: dict - filter of the exported documents
+    fmt: str - one of EXPORT_FORMATS
+    total: int - number of matching documents, e.g. from the search count
+    inline_limit: int - largest total exported in memory
+    options: sort, batch_size and read options, as for export_documents
+
+    Returns:
+    tuple: (data, key, count) - the export's bytes with key None, or data None and
+           the S3 key of the export
+    """
+    if total <= inline_limit:
+        buffer = io.BytesIO()
+        count = export_documents(mongo_client, query, fmt, buffer, **options)
+        return buffer.getvalue(), None, count
+    key, count = export_to_s3(mongo_client, s3_client, query, fmt, **options)
+    return None, key, count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--query", default="{}", help="Mongo filter as (extended) JSON.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output", help="Local file to write.")
+    destination.add_argument("--s3", action="store_true", help=f"Upload under {EXPORT_FOLDER}.")
+    destination.add_argument("--s3-key", help="Upload to this key.")
+    args = parser.parse_args(argv)
+
+    from bson import json_util
+    from mongodb_client import AtlasClient
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    query = json_util.loads(args.query)
+    mongo_client = AtlasClient()
+    if args.output:
+        with open(args.output, "wb") as f:
+            count = export_documents(mongo_client, query, args.format, f, batch_size=args.batch_size)
+        logging.info(f"Exported {count} documents to {args.output}")
+    else:
+        from s3_file_manager import S3FileManager
+
+        key, count = export_to_s3(mongo_client, S3FileManager(), query, args.format, key=args.s3_key,
+                                  batch_size=args.batch_size)
+        logging.info(f"Exported {count} documents to s3://{key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+# External imports
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+# Histogram buckets for call latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters and latency histograms.
+
+    Metrics are keyed by name and a set of labels and can be rendered in the
+    Prometheus text exposition format.
+
+    Methods:
+    --------
+    inc(name, value, **labels)
+        Add to a counter.
+    observe(name, seconds, **labels)
+        Record a latency.
+    snapshot()
+        Copy of every counter and histogram sum/count.
+    render_prometheus()
+        Text exposition of every metric.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add `value` to the counter `name`."""
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        """Record one latency observation in the histogram `name`."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self):
+        """
+        Copy the current values, e.g. to compute per-request deltas.
+
+        Returns:
+        dict: {"counters": {(name, labels): value}, "histograms": {(name, labels): (sum, count)}}
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {k: (h["sum"], h["count"]) for k, h in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, dict(h, buckets=list(h["buckets"]))) for k, h in self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{fmt(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{fmt(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class CallTotals:
+    """
+    Layer time and outermost call counts, plus Mongo command totals, of the calls
+    made while it is active, e.g. during one Streamlit rerun. Use as a context
+    manager. Unlike deltas of REGISTRY, it leaves out what other sessions and
+    background threads do meanwhile.
+
+    Attributes:
+    -----------
+    layer_seconds: dict
+        layer -> time spent in outermost calls of the layer.
+    layer_calls: dict
+        layer -> number of outermost calls.
+    mongo_commands: int
+        Commands sent to the Mongo server.
+    mongo_seconds: float
+        Server round-trip time of those commands.
+    """
+
+    def __init__(self):
+        self.layer_seconds = defaultdict(float)
+        self.layer_calls = defaultdict(int)
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self._token = None
+
+    def __enter__(self):
+        self._token = _call_totals.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _call_totals.reset(self._token)
+        return False
+
+
+# The active CallTotals of the current context, if any
+_call_totals = contextvars.ContextVar("call_totals", default=None)
+
+
+def _observe_layer(layer, seconds):
+    """Record the time of an outermost call of a layer."""
+    REGISTRY.observe("dms_layer_seconds", seconds, layer=layer)
+    totals = _call_totals.get()
+    if totals is not None:
+        totals.layer_seconds[layer] += seconds
+        totals.layer_calls[layer] += 1
+
+# Per-thread call depth per layer, so nested calls (e.g. upload_file inside
+# upload_file_content_addressed) are counted once in the layer totals
+_depth = threading.local()
+
+
+def _enter(layer):
+    depths = getattr(_depth, "layers", None)
+    if depths is None:
+        depths = _depth.layers = defaultdict(int)
+    depths[layer] += 1
+
+
+def _exit(layer):
+    """Leave a call; returns True if it was the outermost call of its layer."""
+    _depth.layers[layer] -= 1
+    return _depth.layers[layer] == 0
+
+
+def _record(layer, method, started, failed, result, args, kwargs, byte_counter, false_is_error, elapsed=None):
+    if elapsed is None:
+        elapsed = time.perf_counter() - started
+        if _exit(layer):
+            _observe_layer(layer, elapsed)
+    REGISTRY.inc("dms_calls_total", layer=layer, method=method)
+    REGISTRY.observe("dms_call_seconds", elapsed, layer=layer, method=method)
+    # S3FileManager swallows errors and returns False, so count that as a failure too
+    if failed or (false_is_error and result is False):
+        REGISTRY.inc("dms_errors_total", layer=layer, method=method)
+        return
+    if byte_counter:
+        try:
+            direction, count = byte_counter(args, kwargs, result)
+            if count:
+                REGISTRY.inc("dms_bytes_total", count, layer=layer, method=method, direction=direction)
+        except Exception as e:
+            logging.debug(f"Byte counting failed for {layer}.{method}: {e}")
+    if isinstance(result, list):
+        REGISTRY.inc("dms_items_total", len(result), layer=layer, method=method)
+
+
+def instrument(layer, name=None, byte_counter=None, false_is_error=True):
+    """
+    Decorator recording calls, errors, latency and optionally bytes of a function.
+
+    Args:
+    layer: str - label for the subsystem, e.g. "s3", "mongo" or "app"
+    name: str - method label, defaults to the function name
+    byte_counter: callable - (args, kwargs, result) -> (direction, bytes)
+    false_is_error: bool - count a False return value as an error
+
+    Returns:
+    callable: the decorator
+    """
+    def decorator(func):
+        method = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                _enter(layer)
+                started, failed, result = time.perf_counter(), False, None
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    _record(layer, method, started, failed, result, args, kwargs, byte_counter, false_is_error)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                # Only time spent producing items counts, not the consumer's work between them
+                generator = func(*args, **kwargs)
+                elapsed, outer, failed, items = 0.0, 0.0, False, 0
+                try:
+                    while True:
+                        _enter(layer)
+                        started = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        except BaseException:
+                            failed = True
+                            raise
+                        finally:
+                            step = time.perf_counter() - started
+                            elapsed += step
+                            if _exit(layer):
+                                outer += step
+                        items += 1
+                        yield item
+                finally:
+                    generator.close()
+                    if outer:
+                        _observe_layer(layer, outer)
+                    REGISTRY.inc("dms_items_total", items, layer=layer, method=method)
+                    _record(layer, method, None, failed, None, args, kwargs, None, false_is_error, elapsed)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _enter(layer)
+            started, failed, result = time.perf_counter(), False, None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                _record(layer, method, started, failed, result, args, kwargs, byte_counter, false_is_error)
+        return wrapper
+    return decorator
+
+
+def instrument_class(layer, byte_counters=None, skip=(), predicates=()):
+    """
+    Class decorator applying `instrument` to every public method defined on the class.
+
+    Args:
+    layer: str - label for the subsystem
+    byte_counters: dict - method name -> byte counter, see `instrument`
+    skip: tuple - methods left unwrapped, e.g. cheap pure helpers
+    predicates: tuple - methods whose False return value is an answer, not an error
+
+    Returns:
+    callable: the class decorator
+    """
+    byte_counters = byte_counters or {}
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or attr in skip or not inspect.isfunction(value):
+                continue
+            wrapped = instrument(layer, attr, byte_counters.get(attr), false_is_error=attr not in predicates)
+            setattr(cls, attr, wrapped(value))
+        return cls
+    return decorator
+
+
+def argument(args, kwargs, index, name):
+    """Look up a call argument passed either positionally (at `index`, counting self) or by name."""
+    if name in kwargs:
+        return kwargs[name]
+    return args[index] if len(args) > index else None
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    pymongo command listener timing every command sent to the server. Listeners
+    run in the thread that sent the command, so the CallTotals active there see it.
+    """
+
+    @staticmethod
+    def _observe(event):
+        seconds = event.duration_micros / 1e6
+        REGISTRY.observe("dms_mongo_command_seconds", seconds, command=event.command_name)
+        totals = _call_totals.get()
+        if totals is not None:
+            totals.mongo_commands += 1
+            totals.mongo_seconds += seconds
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+        REGISTRY.inc("dms_mongo_command_failures_total", command=event.command_name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """
+    Serve /metrics in the Prometheus text format from a daemon thread.
+
+    Args:
+    port: int - port to listen on
+    host: str - interface to bind
+
+    Returns:
+    ThreadingHTTPServer: the running server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return server
+
+
+def summary_rows():
+    """
+    Per-method totals for display, one row per (layer, method).
+
+    Returns:
+    list: dicts with layer, method, calls, errors, total_s, avg_ms and bytes
+    """
+    snapshot = REGISTRY.snapshot()
+    rows = {}
+    for (name, labels), (total, count) in snapshot["histograms"].items():
+        if name != "dms_call_seconds":
+            continue
+        labels = dict(labels)
+        rows[(labels["layer"], labels["method"])] = {
+            "layer": labels["layer"], "method": labels["method"], "calls": count, "errors": 0,
+            "total_s": round(total, 3), "avg_ms": round(total / count * 1000, 1) if count else 0.0, "bytes": 0,
+        }
+    for (name, labels), value in snapshot["counters"].items():
+        labels = dict(labels)
+        row = rows.get((labels.get("layer"), labels.get("method")))
+        if row is None:
+            continue
+        if name == "dms_errors_total":
+            row["errors"] = int(value)
+        elif name == "dms_bytes_total":
+            row["bytes"] += int(value)
+    return sorted(rows.values(), key=lambda r: r["total_s"], reverse=True)
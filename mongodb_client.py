@@ -1,12 +1,89 @@
 # External imports
-from pymongo import MongoClient
+from pymongo import MongoClient, timeout
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError, ServerSelectionTimeoutError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 from dotenv import load_dotenv
 import os
 
+from metrics import instrument_class, MongoCommandTimer
+from resilience import (AdaptiveRateLimiter, CircuitBreaker, RetryPolicy, resilient_class, THROTTLED,
+                        TRANSIENT)
+from config import MONGO_MAX_ATTEMPTS
+
 # Load the environment variables
 load_dotenv()
 
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+# Server error codes of requests rejected by a request rate limit
+THROTTLE_CODES = (16500,)
+
+# Writes that may have reached the server are never repeated by the retry layer
+WRITE_METHODS = ("update", "update_many", "bulk_write", "insert", "insert_many", "delete", "delete_many")
+BULK_METHODS = ("update_many", "bulk_write", "insert_many", "delete_many")
+
+
+def mongo_error_kind(exc):
+    """
+    Classify an error for the retry layer.
+
+    Parameters:
+    -----------
+    exc: Exception
+        The error raised by a driver call.
+
+    Returns:
+    --------
+    str: resilience.THROTTLED, resilience.TRANSIENT, or None if retrying can't help.
+    """
+    if not isinstance(exc, PyMongoError):
+        return None
+    if (isinstance(exc, OperationFailure) and exc.code in THROTTLE_CODES) \
+            or exc.has_error_label("SystemOverloadedError"):
+        return THROTTLED
+    # Network errors, failovers and server selection timeouts
+    if isinstance(exc, ConnectionFailure) or exc.has_error_label("RetryableWriteError") \
+            or exc.has_error_label("TransientTransactionError"):
+        return TRANSIENT
+    return None
 
+
+def mongo_write_not_applied(exc):
+    """True for errors raised before a write reached the server (or that it rejected), so repeating it is safe."""
+    return isinstance(exc, ServerSelectionTimeoutError) or mongo_error_kind(exc) == THROTTLED
+
+
+def read_preference(mode, max_staleness=-1):
+    """
+    Build a pymongo read preference from its mode name.
+
+    Parameters:
+    -----------
+    mode: str
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred" or "nearest".
+    max_staleness: int
+        Skip secondaries lagging more than this many seconds (at least 90); -1 for no limit.
+
+    Returns:
+    --------
+    ServerMode: The read preference.
+    """
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+@instrument_class("mongo")
+@resilient_class(unsafe=WRITE_METHODS, bulk=BULK_METHODS,
+                 skip=("get_collection", "start_causal_session", "causal_token"))
 class AtlasClient:
     """
     A class to interact with MongoDB Atlas.
@@ -21,6 +98,9 @@ class AtlasClient:
         The MongoDB client.
     database: Database
         The MongoDB database.
+    retry_policy: RetryPolicy
+        Retries, throttling, deadline and bulk circuit breaker applied to every
+        method; writes are only repeated when they can't have been applied.
 
     Methods:
     --------
@@ -28,19 +108,45 @@ class AtlasClient:
         Pings the MongoDB Atlas.
     get_collection(collection_name)
         Gets a collection from the database.
-    find(collection_name, filter={}, limit=0)
-        Finds documents in a collection.
-    update(collection_name, filter, update)
+    find(collection_name, filter={}, limit=0, read_preference=None, read_concern=None, session=None, projection=None)
+        Finds documents in a collection, optionally with a named projection profile.
+    iter_find(collection_name, filter={}, projection=None, batch_size=1000, sort=None, ...)
+        Finds documents in a collection, yielding them in batches.
+    update(collection_name, filter, update, upsert=False, session=None)
         Updates documents in a collection.
-    insert(collection_name, data)
+    update_many(collection_name, filter, update)
+        Updates every document matching a filter.
+    bulk_write(collection_name, operations, ordered=True, session=None)
+        Runs several write operations in one request.
+    insert(collection_name, data, session=None)
         Inserts a document in a collection.
+    insert_many(collection_name, data, ordered=False)
+        Inserts several documents in a collection with one bulk write.
     delete(collection_name, filter)
         Deletes a document in a collection.
-    aggregate(collection_name, pipeline)
+    delete_many(collection_name, filter)
+        Deletes every document matching a filter.
+    aggregate(collection_name, pipeline, read_preference=None, read_concern=None, session=None)
         Aggregates documents in a collection.
+    count_documents(collection_name, filter={}, read_preference=None, read_concern=None, session=None)
+        Counts the documents matching a filter.
+    start_causal_session(token=None)
+        Starts a causally consistent session, optionally after earlier operations.
+    causal_token(session)
+        Cluster and operation time of a session, to continue it in a later session.
     """
 
-    def __init__(self, altas_uri=os.getenv("MONGO_URI"), dbname=os.getenv("MONGO_DB")):
+    # Named projections for `documents`: list rows, the single-document view and exports
+    PROJECTIONS = {
+        "list": {"_id": 0, "doc_id": 1, "name": 1, "created_at": 1, "updated_at": 1,
+                 "flags": 1, "tags": 1, "summary": 1, "files.preview_key": 1},
+        "detail": {"crawl_results": 0},
+        "export": {"_id": 0, "doc_id": 1, "name": 1, "description": 1, "tags": 1, "notes": 1, "flags": 1,
+                   "created_at": 1, "updated_at": 1, "files.filename": 1, "files.s3_key": 1,
+                   "files.size": 1, "files.type": 1, "files.sha256": 1},
+    }
+
+    def __init__(self, altas_uri=os.getenv("MONGO_URI"), dbname=os.getenv("MONGO_DB"), operation_timeout=None):
         """
         Constructor for the AtlasClient class.
 
@@ -50,9 +156,18 @@ class AtlasClient:
             The URI for the MongoDB Atlas.
         dbname: str
             The name of the database.    
+        operation_timeout: float
+            Seconds each call may take, retries included; None for no deadline.
         """
-        self.mongodb_client = MongoClient(altas_uri)
+        self.mongodb_client = MongoClient(altas_uri, event_listeners=[MongoCommandTimer()])
         self.database = self.mongodb_client[dbname]
+        # Transient errors are retried with backoff; throttling slows every call down;
+        # bulk writes stop early while the server keeps failing
+        self.retry_policy = RetryPolicy(
+            "mongo", mongo_error_kind, max_attempts=MONGO_MAX_ATTEMPTS, timeout=operation_timeout,
+            limiter=AdaptiveRateLimiter("mongo"), breaker=CircuitBreaker("mongo-bulk"), scope=timeout,
+        )
+        self.retry_unsafe_if = mongo_write_not_applied
 
     def ping(self):
         """
@@ -76,7 +191,8 @@ class AtlasClient:
         collection = self.database[collection_name]
         return collection
 
-    def find(self, collection_name, filter={}, limit=0):
+    def find(self, collection_name, filter={}, limit=0, read_preference=None, read_concern=None, session=None,
+             projection=None):
         """
         Finds documents in a collection.
 
@@ -88,17 +204,74 @@ class AtlasClient:
             The filter to apply.
         limit: int
             The limit of documents to return.
+        read_preference: ServerMode or str
+            Read preference for this call, e.g. read_preference("secondaryPreferred", 120).
+        read_concern: str
+            Read concern level for this call, e.g. "majority".
+        session: ClientSession
+            Session to run in, for causally consistent reads.
+        projection: str or dict
+            Name of one of PROJECTIONS, or a projection document.
 
         Returns:
         --------
         items: list
             The list of documents.
         """
-        collection = self.database[collection_name]
-        items = list(collection.find(filter=filter, limit=limit))
+        if isinstance(projection, str):
+            projection = self.PROJECTIONS[projection]
+        collection = self._collection(collection_name, read_preference, read_concern)
+        items = list(collection.find(filter=filter, projection=projection, limit=limit, session=session))
         return items
 
-    def update(self, collection_name, filter, update):
+    def iter_find(self, collection_name, filter={}, projection=None, batch_size=1000, sort=None,
+                  read_preference=None, read_concern=None, session=None):
+        """
+        Finds documents in a collection, yielding them in batches so a large
+        result never has to be held in memory at once.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        filter: dict
+            The filter to apply.
+        projection: str or dict
+            Name of one of PROJECTIONS, or a projection document.
+        batch_size: int
+            Documents per yielded batch, and per cursor round trip.
+        sort: list
+            (field, direction) pairs, e.g. [("created_at", -1)].
+        read_preference: ServerMode or str
+            Read preference for this call.
+        read_concern: str
+            Read concern level for this call.
+        session: ClientSession
+            Session to run in, for causally consistent reads.
+
+        Yields:
+        -------
+        batch: list
+            Up to batch_size documents.
+        """
+        if isinstance(projection, str):
+            projection = self.PROJECTIONS[projection]
+        collection = self._collection(collection_name, read_preference, read_concern)
+        cursor = collection.find(filter=filter, projection=projection, sort=sort, batch_size=batch_size,
+                                 session=session)
+        try:
+            batch = []
+            for document in cursor:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            cursor.close()
+
+    def update(self, collection_name, filter, update, upsert=False, session=None):
         """
         Updates documents in a collection.
 
@@ -110,16 +283,62 @@ class AtlasClient:
             The filter to apply.
         update: dict
             The update to apply.
+        upsert: bool
+            Insert a new document if none matches the filter.
+        session: ClientSession
+            Session to run in, so later reads in the session see the write.
 
         Returns:
         --------
         bool: True if successful, False otherwise.
             """
         collection = self.database[collection_name]
-        collection.update_one(filter, update)
+        collection.update_one(filter, update, upsert=upsert, session=session)
         return True
 
-    def insert(self, collection_name, data):
+    def update_many(self, collection_name, filter, update):
+        """
+        Updates every document matching a filter.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        filter: dict
+            The filter to apply.
+        update: dict
+            The update to apply.
+
+        Returns:
+        --------
+        int: The number of documents modified.
+        """
+        collection = self.database[collection_name]
+        return collection.update_many(filter, update).modified_count
+
+    def bulk_write(self, collection_name, operations, ordered=True, session=None):
+        """
+        Runs several write operations (UpdateMany, UpdateOne, ...) in one request.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        operations: list
+            pymongo write operations.
+        ordered: bool
+            Apply the operations in order and stop at the first error.
+        session: ClientSession
+            Session to run in, so later reads in the session see the writes.
+
+        Returns:
+        --------
+        BulkWriteResult: The result, with matched_count and modified_count.
+        """
+        collection = self.database[collection_name]
+        return collection.bulk_write(operations, ordered=ordered, session=session)
+
+    def insert(self, collection_name, data, session=None):
         """
         Inserts a document in a collection.
 
@@ -129,6 +348,8 @@ class AtlasClient:
             The name of the collection.
         data: dict
             The data to insert.
+        session: ClientSession
+            Session to run in, so later reads in the session see the write.
 
         Returns:
         --------
@@ -137,9 +358,33 @@ class AtlasClient:
         """
 
         collection = self.database[collection_name]
-        id = collection.insert_one(data).inserted_id
+        id = collection.insert_one(data, session=session).inserted_id
         return id
 
+    def insert_many(self, collection_name, data, ordered=False):
+        """
+        Inserts several documents in a collection with one bulk write.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        data: list
+            The documents to insert.
+        ordered: bool
+            Stop at the first failed insert instead of attempting the rest.
+
+        Returns:
+        --------
+        ids: list
+            The ids of the inserted documents.
+        """
+        if not data:
+            return []
+        collection = self.database[collection_name]
+        ids = collection.insert_many(data, ordered=ordered).inserted_ids
+        return ids
+
     def delete(self, collection_name, filter):
         """
         Deletes a document in a collection.
@@ -159,7 +404,25 @@ class AtlasClient:
         collection.delete_one(filter)
         return True
 
-    def aggregate(self, collection_name, pipeline):
+    def delete_many(self, collection_name, filter):
+        """
+        Deletes every document matching a filter.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        filter: dict
+            The filter to apply.
+
+        Returns:
+        --------
+        int: The number of deleted documents.
+        """
+        collection = self.database[collection_name]
+        return collection.delete_many(filter).deleted_count
+
+    def aggregate(self, collection_name, pipeline, read_preference=None, read_concern=None, session=None):
         """
         Aggregates documents in a collection.
 
@@ -169,10 +432,90 @@ class AtlasClient:
             The name of the collection.
         pipeline: list
             The aggregation pipeline.
+        read_preference: ServerMode or str
+            Read preference for this call, e.g. read_preference("secondaryPreferred", 120).
+        read_concern: str
+            Read concern level for this call, e.g. "majority".
+        session: ClientSession
+            Session to run in, for causally consistent reads.
 
         Returns:
         --------
         list: The list of documents.
         """
+        collection = self._collection(collection_name, read_preference, read_concern)
+        return list(collection.aggregate(pipeline, session=session))
+
+    def count_documents(self, collection_name, filter={}, read_preference=None, read_concern=None, session=None):
+        """
+        Counts the documents matching a filter.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        filter: dict
+            The filter to apply.
+        read_preference: ServerMode or str
+            Read preference for this call, e.g. read_preference("secondaryPreferred", 120).
+        read_concern: str
+            Read concern level for this call, e.g. "majority".
+        session: ClientSession
+            Session to run in, for causally consistent reads.
+
+        Returns:
+        --------
+        int: The number of matching documents.
+        """
+        collection = self._collection(collection_name, read_preference, read_concern)
+        return collection.count_documents(filter, session=session)
+
+    def start_causal_session(self, token=None):
+        """
+        Starts a causally consistent session. Reads in the session see the
+        session's earlier writes, and those of the session `token` came from,
+        even when they are served by a secondary.
+
+        Parameters:
+        -----------
+        token: dict
+            Result of causal_token() for an earlier session, optional.
+
+        Returns:
+        --------
+        ClientSession: The session; use it as a context manager.
+        """
+        session = self.mongodb_client.start_session(causal_consistency=True)
+        if token:
+            session.advance_cluster_time(token["cluster_time"])
+            session.advance_operation_time(token["operation_time"])
+        return session
+
+    def causal_token(self, session):
+        """
+        Cluster and operation time a session has reached.
+
+        Parameters:
+        -----------
+        session: ClientSession
+            The session.
+
+        Returns:
+        --------
+        dict: token for start_causal_session(), or None if the session did nothing.
+        """
+        if session.operation_time is None:
+            return None
+        return {"cluster_time": session.cluster_time, "operation_time": session.operation_time}
+
+    def _collection(self, collection_name, read_preference=None, read_concern=None):
+        """Collection with per-call read options applied."""
         collection = self.database[collection_name]
-        return list(collection.aggregate(pipeline))
+        if read_preference is None and read_concern is None:
+            return collection
+        if isinstance(read_preference, str):
+            read_preference = READ_PREFERENCES[read_preference]()
+        return collection.with_options(
+            read_preference=read_preference,
+            read_concern=ReadConcern(read_concern) if read_concern else None,
+        )
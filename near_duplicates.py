@@ -0,0 +1,123 @@
+# External imports
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+FINGERPRINT_BITS = 64
+# Words per shingle; pages sharing most 3-word sequences get close fingerprints
+SHINGLE_SIZE = 3
+# Pages with fewer words are too short to fingerprint reliably and are never collapsed
+MIN_FINGERPRINT_WORDS = 10
+# Fingerprint at most this many words, which bounds the cost for very long pages
+MAX_FINGERPRINT_WORDS = 5000
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMETERS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_hsenc", "_hsmi"}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def canonical_url(url):
+    """
+    URL without its fragment and tracking parameters (utm_*, gclid, ...), so
+    variants of one page are only fetched once.
+
+    Args:
+    url: str - absolute http(s) URL
+
+    Returns:
+    str: the canonical URL
+    """
+    parsed = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMETERS]
+    canonical = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    if query:
+        canonical += f"?{urlencode(query)}"
+    return canonical
+
+
+def simhash(text):
+    """
+    64-bit SimHash of a text's word shingles. Similar texts differ in few bits.
+
+    Args:
+    text: str - extracted page text
+
+    Returns:
+    int: the fingerprint, or None if the text is too short
+    """
+    words = _WORD.findall(text.lower())[:MAX_FINGERPRINT_WORDS]
+    if len(words) < MIN_FINGERPRINT_WORDS:
+        return None
+    weights = [0] * FINGERPRINT_BITS
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    Banded LSH index of SimHash fingerprints.
+
+    The 64 bits are split into max_distance + 1 bands. Two fingerprints at most
+    max_distance bits apart agree on at least one whole band, so only
+    fingerprints sharing a band value are compared, instead of every one seen.
+
+    Attributes:
+    -----------
+    max_distance: int
+        Largest Hamming distance still treated as a near-duplicate.
+    collapsed: int
+        Number of near-duplicates found by add().
+    """
+
+    # Unrelated pages differ in about 32 of 64 bits; pages sharing all but a few percent of
+    # their shingles differ in about 6 or fewer
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self.collapsed = 0
+        bands = max_distance + 1
+        width = -(-FINGERPRINT_BITS // bands)
+        self._bands = [(offset, (1 << min(width, FINGERPRINT_BITS - offset)) - 1)
+                       for offset in range(0, FINGERPRINT_BITS, width)]
+        self._buckets = [{} for _ in self._bands]
+
+    def _band_values(self, fingerprint):
+        return [fingerprint >> offset & mask for offset, mask in self._bands]
+
+    def find(self, fingerprint):
+        """Item of an indexed near-duplicate of a fingerprint, or None."""
+        for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+            for candidate, item in buckets.get(value, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return item
+        return None
+
+    def add(self, fingerprint, item):
+        """
+        Index a fingerprint unless a near-duplicate is already indexed.
+
+        Args:
+        fingerprint: int - from simhash(); None is never a duplicate and isn't indexed
+        item: any - returned to later near-duplicates, e.g. the page's crawl result
+
+        Returns:
+        the near-duplicate's item, or None if the fingerprint was new and indexed
+        """
+        if fingerprint is None:
+            return None
+        existing = self.find(fingerprint)
+        if existing is not None:
+            self.collapsed += 1
+            return existing
+        for buckets, value in zip(self._buckets, self._band_values(fingerprint)):
+            buckets.setdefault(value, []).append((fingerprint, item))
+        return None
@@ -0,0 +1,107 @@
+# External imports
+import io
+import logging
+import os
+
+from config import PREVIEW_FOLDER
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+PREVIEWABLE_EXTENSIONS = ('.pdf',) + IMAGE_EXTENSIONS
+
+# Longest side of a thumbnail, in pixels
+PREVIEW_MAX_SIDE = 320
+
+
+def render_preview(file_path, filename=None, max_side=PREVIEW_MAX_SIDE):
+    """
+    Render a small JPEG thumbnail of a PDF's first page or of an image.
+
+    Args:
+    file_path: str - local path of the file
+    filename: str - original file name, used to pick the renderer
+    max_side: int - longest side of the thumbnail in pixels
+
+    Returns:
+    bytes: JPEG data, or None if the file type has no preview
+    """
+    extension = os.path.splitext(filename or file_path)[1].lower()
+    if extension not in PREVIEWABLE_EXTENSIONS:
+        return None
+    # Imaging libraries are imported on first use to keep app start-up fast
+    import fitz  # PyMuPDF
+    from PIL import Image
+
+    if extension == '.pdf':
+        with fitz.open(file_path) as doc:
+            if doc.page_count == 0:
+                return None
+            page = doc[0]
+            # Render straight at thumbnail resolution instead of downscaling a full page
+            zoom = max_side / max(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    elif extension in IMAGE_EXTENSIONS:
+        image = Image.open(file_path)
+        # Let the JPEG decoder downscale while decoding
+        image.draft("RGB", (max_side, max_side))
+        image = image.convert("RGB")
+    else:
+        return None
+
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=80, optimize=True)
+    return buffer.getvalue()
+
+
+class PreviewGenerator:
+    """
+    Renders thumbnails at ingest time and stores them under the `previews/` prefix.
+
+    Previews of content-addressed files are keyed by digest, so a file that is
+    uploaded again reuses the stored render instead of rendering it twice.
+
+    Attributes:
+    -----------
+    s3_client: S3FileManager
+        Client used to store the thumbnails.
+    prefix: str
+        S3 prefix for thumbnails.
+    """
+
+    def __init__(self, s3_client, prefix=PREVIEW_FOLDER):
+        self.s3_client = s3_client
+        self.prefix = prefix
+
+    def preview_key(self, doc_id, file_info):
+        """Return the S3 key of a file's thumbnail."""
+        if file_info.get("sha256"):
+            return f"{self.prefix}{file_info['sha256']}.jpg"
+        return f"{self.prefix}{doc_id}/{file_info['filename']}.jpg"
+
+    def add_preview(self, file_path, doc_id, file_info):
+        """
+        Render and store a file's thumbnail and record it on the `files` entry.
+
+        Args:
+        file_path: str - local path of the file
+        doc_id: str - id of the document the file belongs to
+        file_info: dict - `files` entry; preview_key and preview_url are set on it
+
+        Returns:
+        bool: True if the entry has a preview, False otherwise
+        """
+        if not file_info["filename"].lower().endswith(PREVIEWABLE_EXTENSIONS):
+            return False
+        key = self.preview_key(doc_id, file_info)
+        try:
+            if not (file_info.get("sha256") and self.s3_client.object_exists(key)):
+                data = render_preview(file_path, file_info["filename"])
+                if not data or not self.s3_client.upload_file_from_bytes(data, key, "image/jpeg"):
+                    return False
+        except Exception as e:
+            logging.error(f"Preview generation failed for {file_info['filename']}: {e}")
+            return False
+        file_info["preview_key"] = key
+        file_info["preview_url"] = f"https://{self.s3_client.bucket_name}.s3.amazonaws.com/{key}"
+        return True
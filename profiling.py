@@ -0,0 +1,118 @@
+# External imports
+import cProfile
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from metrics import CallTotals
+
+# Layers whose time is attributed to a phase; the rest of the rerun is rendering
+PHASE_LAYERS = {"db": "mongo", "s3": "s3", "crawl": "app"}
+
+
+def changed_keys(previous, current):
+    """
+    Names of widget/session values that changed between two reruns, i.e. what
+    most likely triggered the rerun.
+
+    Args:
+    previous: dict - session values at the end of the last rerun
+    current: dict - session values at the start of this rerun
+
+    Returns:
+    list: changed keys
+    """
+    keys = set(previous) | set(current)
+    return sorted(k for k in keys if previous.get(k) != current.get(k))
+
+
+class RerunProfiler:
+    """
+    Measures one Streamlit rerun: wall time, DB/S3/crawl/render breakdown, and the
+    number of Mongo commands and S3 calls, with an optional cProfile or
+    pyinstrument dump. Only calls made in the rerun's own context are counted,
+    not those of other sessions or background threads running meanwhile.
+
+    Use as a context manager around `main()`; the record is available as
+    `result` afterwards and appended to `log_path` as a JSON line.
+
+    Attributes:
+    -----------
+    dump: str
+        "cprofile", "pyinstrument" or None.
+    out_dir: str
+        Directory for the JSONL log and profile dumps.
+    trigger: list
+        Session keys that changed since the last rerun.
+    result: dict
+        The rerun record, set on exit.
+    """
+
+    def __init__(self, dump=None, out_dir="profiles", trigger=None, label=None):
+        self.dump = dump
+        self.out_dir = out_dir
+        self.trigger = trigger or []
+        self.label = label
+        self.result = None
+        self._profiler = None
+
+    @property
+    def log_path(self):
+        return os.path.join(self.out_dir, "reruns.jsonl")
+
+    def __enter__(self):
+        self._calls = CallTotals().__enter__()
+        if self.dump == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                self._profiler = Profiler()
+            except ImportError:
+                logging.warning("pyinstrument is not installed, falling back to cProfile")
+                self.dump = "cprofile"
+        if self.dump == "cprofile":
+            self._profiler = cProfile.Profile()
+        if self._profiler:
+            self._profiler.enable() if self.dump == "cprofile" else self._profiler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # st.rerun()/st.stop() end a rerun with an exception; still record it
+        wall = time.perf_counter() - self._started
+        if self._profiler:
+            self._profiler.disable() if self.dump == "cprofile" else self._profiler.stop()
+        calls = self._calls
+        calls.__exit__(exc_type, exc, tb)
+
+        phases = {phase: round(calls.layer_seconds[layer], 4) for phase, layer in PHASE_LAYERS.items()}
+        phases["render"] = round(max(0.0, wall - sum(phases.values())), 4)
+
+        self.result = {
+            "at": datetime.utcnow().isoformat(),
+            "label": self.label,
+            "trigger": self.trigger,
+            "wall_s": round(wall, 4),
+            "phases_s": phases,
+            "mongo_commands": calls.mongo_commands,
+            "mongo_server_s": round(calls.mongo_seconds, 4),
+            "s3_calls": calls.layer_calls["s3"],
+            "ended_by": exc_type.__name__ if exc_type else None,
+        }
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if self._profiler:
+                stem = os.path.join(self.out_dir, f"rerun_{datetime.utcnow():%Y%m%dT%H%M%S%f}")
+                if self.dump == "cprofile":
+                    self._profiler.dump_stats(stem + ".prof")
+                    self.result["profile"] = stem + ".prof"
+                else:
+                    with open(stem + ".html", "w") as f:
+                        f.write(self._profiler.output_html())
+                    self.result["profile"] = stem + ".html"
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(self.result) + "\n")
+        except OSError as e:
+            logging.error(f"Could not write rerun profile: {e}")
+        return False
@@ -0,0 +1,304 @@
+"""
+Retries, client-side throttling, deadlines and circuit breaking for calls to
+Mongo and S3.
+
+A RetryPolicy retries transient and throttled errors with jittered exponential
+backoff, within a per-operation deadline. Throttled errors also slow down an
+AdaptiveRateLimiter shared by every call under the policy, so a burst backs off
+as a whole instead of each caller hammering the server on its own. Bulk
+operations additionally pass through a CircuitBreaker, which fails fast while
+the backend keeps failing instead of queueing more work onto it.
+"""
+# External imports
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+from metrics import REGISTRY
+
+# Error kinds returned by a policy's classifier
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+
+
+class DeadlineExceeded(TimeoutError):
+    """The operation's deadline passed before it could succeed."""
+
+
+class CircuitOpenError(RuntimeError):
+    """A circuit breaker is open and rejected the call without trying it."""
+
+
+class Deadline:
+    """Point in time an operation, retries included, must finish by; None for no deadline."""
+
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: a random delay between 0 and
+    base * 2 ** attempt, capped, so retrying clients spread out instead of
+    retrying in lockstep.
+    """
+
+    def __init__(self, base=0.1, cap=5.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class AdaptiveRateLimiter:
+    """
+    Client-side rate limit driven by throttle responses (AIMD).
+
+    Unlimited until the server throttles. Each throttle halves the allowed
+    rate (down to min_rate); each success adds `increase` calls per second back,
+    and the limit is lifted once it climbs past max_rate.
+
+    Attributes:
+    -----------
+    rate: float
+        Calls per second currently allowed, or None when unlimited.
+    """
+
+    def __init__(self, name, min_rate=1.0, max_rate=200.0, increase=1.0):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.rate = None
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+
+    def acquire(self, deadline=None):
+        """Wait for a token; raises DeadlineExceeded if the wait would outlast the deadline."""
+        while True:
+            with self._lock:
+                if self.rate is None:
+                    return
+                now = time.monotonic()
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            remaining = deadline.remaining() if deadline else None
+            if remaining is not None and wait > remaining:
+                raise DeadlineExceeded(f"{self.name}: rate limited past the deadline")
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, (self.rate or self.max_rate) / 2)
+            self._tokens = min(self._tokens, 1.0)
+        REGISTRY.inc("dms_throttled_total", limiter=self.name)
+
+    def on_success(self):
+        if self.rate is None:
+            return
+        with self._lock:
+            if self.rate is not None:
+                self.rate += self.increase
+                if self.rate > self.max_rate:
+                    self.rate = None
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after repeated failures of a backend.
+
+    Closed: calls go through. After failure_threshold consecutive failures it
+    opens and rejects calls with CircuitOpenError for reset_timeout seconds,
+    then lets one trial call through (half-open): success closes it again,
+    failure reopens it.
+
+    Attributes:
+    -----------
+    name: str
+        Label used in logs and metrics.
+    state: str
+        "closed", "open" or "half-open".
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self._trial_running = False
+            if self.state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return
+            if self.state != "closed":
+                raise CircuitOpenError(f"{self.name} circuit is open after repeated failures")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.warning(f"Opening the {self.name} circuit after {self._failures} failures")
+                    REGISTRY.inc("dms_circuit_opened_total", breaker=self.name)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class RetryPolicy:
+    """
+    How calls to one backend are retried.
+
+    Attributes:
+    -----------
+    layer: str
+        Label used in the retry metrics, e.g. "mongo".
+    classify: callable
+        exception -> TRANSIENT, THROTTLED or None (not worth retrying).
+    max_attempts: int
+        Attempts per call, the first one included.
+    timeout: float
+        Seconds each call may take, retries and backoff included; None for no deadline.
+    backoff: Backoff
+        Delays between attempts.
+    limiter: AdaptiveRateLimiter
+        Shared by every call under the policy, optional.
+    breaker: CircuitBreaker
+        Used by calls made with bulk=True, optional.
+    scope: callable
+        remaining seconds -> context manager applying the deadline to the call
+        itself (e.g. pymongo.timeout), optional.
+    """
+
+    def __init__(self, layer, classify, max_attempts=4, timeout=None, backoff=None, limiter=None, breaker=None,
+                 scope=None):
+        self.layer = layer
+        self.classify = classify
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff or Backoff()
+        self.limiter = limiter
+        self.breaker = breaker
+        self.scope = scope
+
+    def call(self, operation, func, *args, retry_if=None, bulk=False, **kwargs):
+        """
+        Call func(*args, **kwargs), retrying transient and throttled errors.
+
+        Args:
+        operation: str - name used in metrics and errors
+        func: callable - the call
+        retry_if: callable - exception -> bool; errors it rejects are never retried,
+                  e.g. writes that may already have been applied
+        bulk: bool - go through the circuit breaker
+
+        Returns:
+        the call's result; raises its last error, DeadlineExceeded or CircuitOpenError
+        """
+        deadline = Deadline(self.timeout)
+        breaker = self.breaker if bulk else None
+        attempt = 0
+        while True:
+            # Wait for the limiter first: a deadline hit while waiting must not strand a half-open trial
+            if self.limiter:
+                self.limiter.acquire(deadline)
+            if breaker:
+                breaker.before_call()
+            try:
+                remaining = deadline.remaining()
+                with self.scope(remaining) if self.scope and remaining is not None else nullcontext():
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    # The backend answered; the request itself was wrong
+                    if breaker:
+                        breaker.record_success()
+                    raise
+                if breaker:
+                    breaker.record_failure()
+                if kind == THROTTLED and self.limiter:
+                    self.limiter.on_throttle()
+                attempt += 1
+                if attempt >= self.max_attempts or (retry_if and not retry_if(e)):
+                    raise
+                delay = self.backoff.delay(attempt - 1)
+                remaining = deadline.remaining()
+                if remaining is not None and delay >= remaining:
+                    raise DeadlineExceeded(f"{operation} did not succeed within {self.timeout}s") from e
+                REGISTRY.inc("dms_retries_total", layer=self.layer, method=operation, reason=kind)
+                time.sleep(delay)
+            else:
+                if breaker:
+                    breaker.record_success()
+                if self.limiter:
+                    self.limiter.on_success()
+                return result
+
+
+def resilient_class(policy_attr="retry_policy", unsafe=(), retry_if_attr="retry_unsafe_if", bulk=(), skip=()):
+    """
+    Class decorator routing every public method through the instance's RetryPolicy.
+
+    Args:
+    policy_attr: str - instance attribute holding the RetryPolicy; None disables it
+    unsafe: tuple - methods that may not be repeated blindly (non-idempotent writes);
+            they are only retried when the instance's `retry_if_attr` predicate accepts the error
+    retry_if_attr: str - instance attribute holding that predicate
+    bulk: tuple - methods that go through the policy's circuit breaker
+    skip: tuple - methods left unwrapped, e.g. ones doing no I/O; generators are always skipped
+
+    Returns:
+    callable: the class decorator
+    """
+    def wrap(name, method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            policy = getattr(self, policy_attr, None)
+            if policy is None:
+                return method(self, *args, **kwargs)
+            retry_if = getattr(self, retry_if_attr) if name in unsafe else None
+            return policy.call(name, method, self, *args, retry_if=retry_if, bulk=name in bulk, **kwargs)
+        return wrapper
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or attr in skip or not inspect.isfunction(value) \
+                    or inspect.isgeneratorfunction(value):
+                continue
+            setattr(cls, attr, wrap(attr, value))
+        return cls
+    return decorator
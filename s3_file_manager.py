@@ -1,19 +1,181 @@
 # External imports
 from pathlib import Path
 import os
-import boto3
-import tempfile
-from botocore.exceptions import NoCredentialsError, ClientError
+from botocore.exceptions import NoCredentialsError, ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-import tempfile
 from dotenv import load_dotenv
 import os
 import time
+import functools
+import hashlib
+import shutil
+
+from metrics import instrument_class, argument
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, THROTTLED, TRANSIENT
+from content_types import detect_content_type, disposition_for, read_head, type_from_extension, SNIFF_BYTES
+from content_encoding import (ENCODINGS, ENCODING_METADATA_KEY, SIZE_METADATA_KEY, CompressingReader,
+                              CompressingWriter, compress_bytes, decompressing_reader, is_compressible,
+                              resolve_encoding)
 
 # Load the environment variables
 load_dotenv()
 
 
+def head_value(head, field):
+    """Read a field from a head_object response that may be None."""
+    return (head or {}).get(field)
+
+
+# Error codes S3 returns when a request rate is too high
+S3_THROTTLE_CODES = ("SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+                     "TooManyRequestsException", "503")
+
+
+def s3_error_kind(exc):
+    """resilience.THROTTLED or TRANSIENT for errors worth retrying later, None otherwise."""
+    if isinstance(exc, ClientError):
+        error = exc.response.get("Error", {})
+        if error.get("Code") in S3_THROTTLE_CODES:
+            return THROTTLED
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return TRANSIENT if status >= 500 or error.get("Code") in ("InternalError", "RequestTimeout") else None
+    if isinstance(exc, (BotoConnectionError, HTTPClientError, DeadlineExceeded)):
+        return TRANSIENT
+    return None
+
+
+def _start_deadline(seconds, context, **kwargs):
+    """before-call handler: start the call's deadline, shared by all its attempts."""
+    context["deadline"] = Deadline(seconds)
+
+
+def _check_deadline_before_send(request, **kwargs):
+    """
+    before-send handler, run after the adaptive rate limiter's wait: an attempt
+    starting past the deadline fails, and _stop_retrying_past_deadline ends the call.
+    """
+    deadline = (getattr(request, "context", None) or {}).get("deadline")
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("S3 operation timeout passed before the attempt was sent")
+
+
+def _stop_retrying_past_deadline(request_dict, response, caught_exception, operation, **kwargs):
+    """
+    needs-retry handler, run before botocore's own: once the call's deadline has
+    passed, a failed attempt raises DeadlineExceeded instead of being retried.
+    Successful and client-error responses are left alone.
+    """
+    deadline = request_dict.get("context", {}).get("deadline")
+    if deadline is None or not deadline.expired():
+        return None
+    if caught_exception is None:
+        status = response[0].status_code if response else 0
+        if status < 500 and status != 429:
+            return None
+    raise DeadlineExceeded(f"S3 {operation.name} did not succeed within the operation timeout") \
+        from caught_exception
+
+
+def _file_size(index, name, direction):
+    """Byte counter for methods taking a local file path."""
+    return lambda args, kwargs, result: (direction, os.path.getsize(argument(args, kwargs, index, name)))
+
+
+# Bytes moved per method, recorded by the instrumentation layer
+S3_BYTE_COUNTERS = {
+    "upload_file": _file_size(1, "file_path", "sent"),
+    "upload_video": _file_size(1, "file_path", "sent"),
+    "upload_png_image": _file_size(1, "file_path", "sent"),
+    "async_upload_file": _file_size(1, "file_path", "sent"),
+    "download_file": _file_size(2, "download_path", "received"),
+    "upload_file_from_bytes": lambda args, kwargs, result: ("sent", len(argument(args, kwargs, 1, "data"))),
+    "download_file_to_bytes": lambda args, kwargs, result: ("received", len(result or b"")),
+    "get_object": lambda args, kwargs, result: ("received", (result or {}).get("ContentLength", 0)),
+    "download_range": lambda args, kwargs, result: ("received", len(result or b"")),
+}
+
+
+class MultipartUploadWriter:
+    """
+    Write-only file object streaming to an S3 multipart upload, holding at most
+    one part in memory. Completes the upload on close() and aborts it if the
+    `with` block raises.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, part_size, extra_args):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, **extra_args)["UploadId"]
+        self.closed = False
+        self._buffer = bytearray()
+        self._parts = []
+        self._written = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self._buffer += data
+        self._written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body):
+        number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body)
+        self._parts.append({'PartNumber': number, 'ETag': response["ETag"]})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # The last part may be smaller than 5 MB (or empty if nothing was written)
+            if self._buffer or not self._parts:
+                self._upload_part(bytes(self._buffer))
+                self._buffer.clear()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self._parts})
+        except Exception:
+            self.abort()
+            raise
+        self.closed = True
+
+    def abort(self):
+        if not self.closed:
+            self.closed = True
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+# Presigned URLs are signed locally and make no request
+@instrument_class("s3", S3_BYTE_COUNTERS, skip=("content_addressed_key", "generate_presigned_url"),
+                  predicates=("object_exists",))
 class S3FileManager:
     """
     A class to interact with AWS S3.
@@ -28,29 +190,83 @@ class S3FileManager:
         The name of the bucket.
     s3_client: S3 client
         The S3 client.
+    public_objects: bool
+        Whether uploads get a public-read ACL (S3_PUBLIC_OBJECTS); when False,
+        objects are served through presigned URLs instead.
+    presign_expiry: int
+        Lifetime in seconds of presigned URLs (S3_PRESIGN_EXPIRY).
+    bulk_breaker: CircuitBreaker
+        Stops prefix-wide copies, rewrites and deletes early while S3 keeps failing.
+    operation_timeout: float
+        Seconds each S3 call may take, botocore's retries and backoff included
+        (S3_OPERATION_TIMEOUT, 0 for no limit); DeadlineExceeded is raised past it.
+    compression: str
+        "gzip" or "zstd" to store text-like uploads with that Content-Encoding
+        (S3_COMPRESSION), or None. Reads decompress them whatever the setting.
 
 
     Methods:
     --------
-    upload_file(file_path, key)
-        Upload a file to S3.
+    upload_file(file_path, key, content_type, filename)
+        Upload a file to S3 with its Content-Type and Content-Disposition.
     upload_temp_file(file, key)
         Upload a temporary file to S3.
     list_files(key)
         List all files in the S3 bucket with the given key.
+    iter_files(prefix, start_after)
+        Lazily yield the objects under a prefix.
+    list_prefixes(prefix, delimiter)
+        List one level of the hierarchy under a prefix.
+    iter_files_parallel(prefix, delimiter, max_workers)
+        Yield the objects under a prefix, listing sub-prefixes in parallel.
     download_file(key, download_path)
         Download a file from S3.
     delete_file(key)
         Delete a file from S3.
-    upload_file_from_bytes(data, key)
+    upload_file_from_bytes(data, key, content_type, filename)
         Upload a file to S3 from bytes.
+    get_object_metadata(key)
+        Get an object's metadata with a HEAD request.
     download_file_to_bytes(key)
         Download a file from S3 to bytes.
-    get_object(key)
-        Get an object from S3.
+    download_range(key, start, end)
+        Download a byte range of an object.
+    get_object(key, decompress)
+        Get an object from S3, decompressing encoded bodies.
+    copy_prefix(source_prefix, destination_prefix)
+        Server-side copy of every object under a prefix, in parallel.
+    move_prefix(source_prefix, destination_prefix)
+        Move every object under a prefix.
+    delete_files(keys)
+        Delete objects in batches.
+    rewrite_metadata_prefix(prefix, content_type, content_disposition, metadata)
+        Rewrite the metadata of every object under a prefix in place.
+    sha256_file(file_path)
+        Hash a file with SHA-256 without loading it into memory.
+    object_exists(key)
+        Check whether an object exists in S3.
+    upload_file_content_addressed(file_path, filename, content_type, digest)
+        Upload a file under a key derived from its SHA-256 digest.
+    generate_presigned_url(key, filename, expires_in)
+        Get a cached presigned GET URL for an object.
+    open_upload_stream(key, content_type, filename, part_size)
+        Open a file object streaming to a multipart upload.
 
     """
 
+    # Prefix for content-addressed objects, keyed by SHA-256 digest
+    CONTENT_ADDRESSED_PREFIX = "qu-agents/blobs/sha256/"
+
+    # Copies above this size use parallel upload_part_copy (copy_object stops at 5 GB)
+    MULTIPART_COPY_THRESHOLD = 1024 ** 3
+    MULTIPART_COPY_PART_SIZE = 256 * 1024 ** 2
+
+    # Part size of streamed uploads; also the most a stream holds in memory
+    UPLOAD_STREAM_PART_SIZE = 8 * 1024 ** 2
+
+    # Plain downloads above this size use the parallel ranged download_fileobj
+    PARALLEL_DOWNLOAD_THRESHOLD = 64 * 1024 ** 2
+
     def __init__(self):
         """
         Constructor for the S3FileManager class.
@@ -60,11 +276,50 @@ class S3FileManager:
         self.aws_access_key_id = os.getenv("AWS_ACCESS_KEY")
         self.aws_secret_access_key = os.getenv("AWS_SECRET_KEY")
         self.bucket_name = os.getenv("AWS_BUCKET_NAME")
+        # boto3 takes a noticeable share of cold start, so load it with the first client
+        import boto3
+        from botocore.config import Config
+
         self.s3_client = boto3.client(
             's3',
             aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key
+            aws_secret_access_key=self.aws_secret_access_key,
+            region_name=os.getenv("AWS_REGION"),
+            # botocore's adaptive mode retries throttling, 5xx and network errors with jittered
+            # exponential backoff and rate-limits the client on throttle responses; the timeouts
+            # bound each attempt
+            config=Config(
+                signature_version="s3v4",
+                retries={"mode": "adaptive", "total_max_attempts": int(os.getenv("S3_MAX_ATTEMPTS", "5"))},
+                connect_timeout=float(os.getenv("S3_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(os.getenv("S3_READ_TIMEOUT", "60")),
+            ),
         )
+        # The retries happen inside each botocore call, so the deadline is enforced through its events
+        self.operation_timeout = float(os.getenv("S3_OPERATION_TIMEOUT", "120")) or None
+        if self.operation_timeout:
+            events = self.s3_client.meta.events
+            events.register("before-call.s3", functools.partial(_start_deadline, self.operation_timeout))
+            events.register_last("before-send", _check_deadline_before_send)
+            events.register_first("needs-retry.s3", _stop_retrying_past_deadline)
+
+        # Public ACLs cost an extra put_object_acl per upload; presigned URLs don't
+        self.public_objects = os.getenv("S3_PUBLIC_OBJECTS", "false").lower() in ("1", "true", "yes")
+        self.presign_expiry = int(os.getenv("S3_PRESIGN_EXPIRY", "3600"))
+        # Browsers decode gzip from presigned URLs; zstd suits objects read back through this class
+        self.compression = resolve_encoding(os.getenv("S3_COMPRESSION", "off"))
+        self._url_cache = {}
+        self._url_cache_lock = threading.Lock()
+        self.bulk_breaker = CircuitBreaker("s3-bulk")
+
+    def _encoding_args(self, content_type, size=None):
+        """Content-Encoding and metadata for an upload of this type, or None if it stays uncompressed."""
+        if not self.compression or not is_compressible(content_type):
+            return None
+        metadata = {ENCODING_METADATA_KEY: self.compression}
+        if size is not None:
+            metadata[SIZE_METADATA_KEY] = str(size)
+        return {'ContentEncoding': self.compression, 'Metadata': metadata}
 
     async def upload_video(self, file_path, key):
         """
@@ -79,7 +334,8 @@ class S3FileManager:
         """
         try:
             self.s3_client.upload_file(file_path, self.bucket_name, key, ExtraArgs={'ContentType': 'video/mp4'})
-            self.make_object_public(key)
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except FileNotFoundError:
             logging.error("The file was not found")
@@ -94,7 +350,10 @@ class S3FileManager:
     def change_content_type(self,
                         key: str,
                         destination_stream: str,
-                        make_public: bool = False) -> bool:
+                        make_public: bool = False,
+                        metadata: dict = None,
+                        size: int = None,
+                        content_encoding: str = None) -> bool:
         """
         Update the Content-Type of an existing S3 object *in-place*.
 
@@ -106,6 +365,13 @@ class S3FileManager:
             New MIME type, e.g. "application/pdf".
         make_public : bool
             If True, sets ACL='public-read' after the copy.
+        metadata : dict
+            The object's user metadata, if already known.
+        size : int
+            The object's size, if already known (e.g. from a listing).
+        content_encoding : str
+            The object's Content-Encoding ("" for none), if already known; with
+            metadata, skips the HEAD request.
 
         Returns
         -------
@@ -113,24 +379,12 @@ class S3FileManager:
             True on success, False on error.
         """
         try:
-            # HEAD request to copy original metadata except ContentType
-            print(key)
-            head = self.s3_client.head_object(
-                Bucket=self.bucket_name,
-                Key=key,
-            )
-            new_meta = head.get("Metadata", {})        # preserve user metadata
-
-            # In-place copy with "REPLACE" tells S3 to overwrite metadata
-            self.s3_client.copy_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                CopySource={"Bucket": self.bucket_name, "Key": key},
-                Metadata=new_meta,
-                MetadataDirective="REPLACE",
-                ContentType=destination_stream,
-                ContentDisposition="inline"
-            )
+            # In-place copy with "REPLACE" tells S3 to overwrite metadata;
+            # user metadata is preserved (HEAD only if the caller doesn't know it)
+            self._copy_object(key, key, size=size, metadata=metadata,
+                              content_type=destination_stream,
+                              content_disposition=disposition_for(destination_stream, key.rsplit("/", 1)[-1]),
+                              content_encoding=content_encoding)
 
             if make_public:
                 self.s3_client.put_object_acl(
@@ -141,25 +395,39 @@ class S3FileManager:
             return True
 
         except (self.s3_client.exceptions.NoSuchKey, ClientError) as exc:
-            print(exc)
             logging.error("Failed to change ContentType for %s – %s", key, exc)
             return False
 
 
-    def upload_file_obj(self, file_obj, key):
+    def upload_file_obj(self, file_obj, key, content_type=None, filename=None):
         """
         Upload a file object to S3
 
         Args:
         file_obj: file object - file object to be uploaded
         key: str - key to be used in the S3 bucket
+        content_type: str - type reported by the client, refined by magic bytes if seekable
+        filename: str - original file name, defaults to the last part of the key
 
         Returns:
         bool: True if the file was uploaded successfully, False otherwise
         """
         try:
-            self.s3_client.upload_fileobj(file_obj, self.bucket_name, key)
-            self.make_object_public(key)
+            head = None
+            if hasattr(file_obj, "seekable") and file_obj.seekable():
+                position = file_obj.tell()
+                head = file_obj.read(SNIFF_BYTES)
+                file_obj.seek(position)
+            filename = filename or key.rsplit("/", 1)[-1]
+            content_type = detect_content_type(filename, head, content_type)
+            extra_args = {'ContentType': content_type, 'ContentDisposition': disposition_for(content_type, filename)}
+            encoding_args = self._encoding_args(content_type)
+            if encoding_args:
+                extra_args.update(encoding_args)
+                file_obj = CompressingReader(file_obj, self.compression)
+            self.s3_client.upload_fileobj(file_obj, self.bucket_name, key, ExtraArgs=extra_args)
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except FileNotFoundError:
             logging.error("The file was not found")
@@ -174,8 +442,12 @@ class S3FileManager:
     async def upload_file_from_frontend(self, file, key):
         try:
             file_content = await file.read()
-            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=file_content)
-            self.make_object_public(key)
+            filename = getattr(file, "filename", None) or key.rsplit("/", 1)[-1]
+            content_type = detect_content_type(filename, file_content[:SNIFF_BYTES], getattr(file, "content_type", None))
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=file_content, ContentType=content_type,
+                                      ContentDisposition=disposition_for(content_type, filename))
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except FileNotFoundError:
             logging.error("The file was not found")
@@ -188,23 +460,40 @@ class S3FileManager:
             return False
         
 
-    async def upload_file(self, file_path, key, content_type=None):
+    async def upload_file(self, file_path, key, content_type=None, filename=None, content_disposition=None):
         """
-        Upload a file to S3
+        Upload a file to S3. Content-Type and Content-Disposition are set in the
+        same request, inferred from content_type, the file's magic bytes and the
+        file name's extension.
 
         Args:
         file_path: str - path to the file to be uploaded
         key: str - key to be used in the S3 bucket
+        content_type: str - type reported by the client, e.g. Streamlit's file.type
+        filename: str - original file name, defaults to the last part of the key
+        content_disposition: str - overrides the inferred Content-Disposition
 
         Returns:
         bool: True if the file was uploaded successfully, False otherwise
         """
         try:
-            if content_type:
-                self.s3_client.upload_file(file_path, self.bucket_name, key, ExtraArgs={'ContentType': content_type})
+            filename = filename or key.rsplit("/", 1)[-1]
+            content_type = detect_content_type(filename, read_head(file_path), content_type)
+            extra_args = {
+                'ContentType': content_type,
+                'ContentDisposition': content_disposition or disposition_for(content_type, filename),
+            }
+            encoding_args = self._encoding_args(content_type, os.path.getsize(file_path))
+            if encoding_args:
+                # Compressed while streaming, so large files never sit in memory
+                extra_args.update(encoding_args)
+                with open(file_path, 'rb') as f:
+                    self.s3_client.upload_fileobj(CompressingReader(f, self.compression), self.bucket_name, key,
+                                                  ExtraArgs=extra_args)
             else:
-                self.s3_client.upload_file(file_path, self.bucket_name, key)
-            self.make_object_public(key)
+                self.s3_client.upload_file(file_path, self.bucket_name, key, ExtraArgs=extra_args)
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except FileNotFoundError:
             logging.error("The file was not found")
@@ -227,20 +516,8 @@ class S3FileManager:
         Returns:
         bool: True if the file was uploaded successfully, False otherwise
         """
-        try:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(file)
-                temp_file.close()
-                self.upload_file(temp_file.name, key)
-                os.unlink(temp_file.name)
-            return True
-        except NoCredentialsError:
-            logging.error("Credentials not available")
-            return False
-        except ClientError as e:
-            logging.error(e)
-            return False
-        
+        return self.upload_file_from_bytes(file, key)
+
     def make_object_public(self, key):
         try:
             self.s3_client.put_object_acl(
@@ -255,21 +532,22 @@ class S3FileManager:
             logging.error(f"An error occurred: make_object_public: {e}")
             return False
         
-    def copy_file(self, source_key, destination_key):
+    def copy_file(self, source_key, destination_key, size=None):
         """
         Copy a file in S3
 
         Args:
         source_key: str - key of the source file in the S3 bucket
         destination_key: str - key of the destination file in the S3 bucket
+        size: int - size of the source, if known; objects over 5 GB need a multipart copy
 
         Returns:
         bool: True if the file was copied successfully, False otherwise
         """
         try:
-            self.s3_client.copy_object(
-                Bucket=self.bucket_name, CopySource=f"{self.bucket_name}/{source_key}", Key=destination_key)
-            self.make_object_public(destination_key)
+            self._copy_object(source_key, destination_key, size=size)
+            if self.public_objects:
+                self.make_object_public(destination_key)
             return True
         except NoCredentialsError:
             logging.error("Credentials not available")
@@ -278,6 +556,262 @@ class S3FileManager:
             logging.error(e)
             return False
 
+    def _copy_object(self, source_key, destination_key, size=None, metadata=None,
+                     content_type=None, content_disposition=None, content_encoding=None):
+        """
+        Server-side copy of one object. Passing metadata, content_type or
+        content_disposition replaces the object's metadata; otherwise it is copied.
+        Objects above MULTIPART_COPY_THRESHOLD are copied in parallel parts with
+        upload_part_copy, which also lifts copy_object's 5 GB limit. A HEAD request
+        is only made when the size or metadata needed for the copy is unknown.
+        A replacing copy must also know the source's Content-Encoding, so a
+        compressed object keeps it: pass content_encoding (e.g. from a HEAD the
+        caller already made, "" for none) unless the metadata records it.
+
+        Raises ClientError on failure.
+        """
+        replace = metadata is not None or content_type is not None or content_disposition is not None
+        # A replacing copy must restate the user metadata and a multipart copy must restate
+        # everything, so fetch what the caller didn't provide
+        encoding_known = content_encoding is not None or ENCODING_METADATA_KEY in (metadata or {})
+        needs_head = (replace and (metadata is None or content_type is None or not encoding_known)) or \
+            (size is not None and size >= self.MULTIPART_COPY_THRESHOLD)
+        head = None
+        if needs_head:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=source_key)
+            size = head["ContentLength"]
+
+        if size is None or size < self.MULTIPART_COPY_THRESHOLD:
+            params = {
+                'Bucket': self.bucket_name,
+                'Key': destination_key,
+                'CopySource': {'Bucket': self.bucket_name, 'Key': source_key},
+            }
+            if replace:
+                params.update(MetadataDirective='REPLACE',
+                              **self._restated_encoding(metadata, head, content_encoding))
+                if content_type or head_value(head, "ContentType"):
+                    params['ContentType'] = content_type or head_value(head, "ContentType")
+                disposition = content_disposition or head_value(head, "ContentDisposition")
+                if disposition:
+                    params['ContentDisposition'] = disposition
+            try:
+                self.s3_client.copy_object(**params)
+                return
+            except ClientError as e:
+                # Size was unknown and the object turned out to be over 5 GB
+                if size is not None or e.response.get("Error", {}).get("Code") != "InvalidRequest":
+                    raise
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=source_key)
+            size = head["ContentLength"]
+
+        extra_args = self._restated_encoding(metadata, head, content_encoding)
+        if content_type or head_value(head, "ContentType"):
+            extra_args['ContentType'] = content_type or head_value(head, "ContentType")
+        if content_disposition or head_value(head, "ContentDisposition"):
+            extra_args['ContentDisposition'] = content_disposition or head_value(head, "ContentDisposition")
+        self._multipart_copy(source_key, destination_key, size, extra_args)
+
+    @staticmethod
+    def _restated_encoding(metadata, head, content_encoding=None):
+        """
+        Metadata and ContentEncoding arguments for a copy that restates the object's
+        metadata: the caller's metadata (else the source's), plus the source's
+        encoding and size keys when the caller's metadata leaves them out.
+        content_encoding is the source's encoding when no HEAD was made.
+        """
+        source_metadata = head_value(head, "Metadata") or {}
+        if metadata is None:
+            metadata = source_metadata
+        else:
+            metadata = {**{k: source_metadata[k] for k in (ENCODING_METADATA_KEY, SIZE_METADATA_KEY)
+                           if k in source_metadata}, **metadata}
+        encoding = metadata.get(ENCODING_METADATA_KEY) or head_value(head, "ContentEncoding") or content_encoding
+        if encoding and ENCODING_METADATA_KEY not in metadata:
+            metadata = {**metadata, ENCODING_METADATA_KEY: encoding}
+        args = {'Metadata': metadata}
+        if encoding:
+            args['ContentEncoding'] = encoding
+        return args
+
+    def _multipart_copy(self, source_key, destination_key, size, extra_args, max_workers=8):
+        """Copy an object in MULTIPART_COPY_PART_SIZE ranges, in parallel. Raises ClientError."""
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=destination_key, **extra_args)["UploadId"]
+        part_size = self.MULTIPART_COPY_PART_SIZE
+
+        def copy_part(part):
+            number, start = part
+            end = min(start + part_size, size) - 1
+            response = self.s3_client.upload_part_copy(
+                Bucket=self.bucket_name, Key=destination_key, UploadId=upload_id, PartNumber=number,
+                CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+                CopySourceRange=f"bytes={start}-{end}",
+            )
+            return {'PartNumber': number, 'ETag': response["CopyPartResult"]["ETag"]}
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = list(executor.map(copy_part, enumerate(range(0, size, part_size), start=1)))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=destination_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts})
+        except Exception:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=destination_key, UploadId=upload_id)
+            raise
+
+    def open_upload_stream(self, key, content_type=None, filename=None, part_size=None):
+        """
+        Open a write-only file object that streams to `key` with a multipart
+        upload, for output too large to build in memory or a temp file.
+
+        Args:
+        key: str - key to be used in the S3 bucket
+        content_type: str - Content-Type of the object, inferred from the key if omitted
+        filename: str - download name, defaults to the last part of the key
+        part_size: int - bytes per part (at least 5 MB), defaults to UPLOAD_STREAM_PART_SIZE
+
+        Returns:
+        MultipartUploadWriter: use as a context manager, wrapped in a CompressingWriter
+        when compression applies; raises ClientError on failure
+        """
+        filename = filename or key.rsplit("/", 1)[-1]
+        content_type = content_type or detect_content_type(filename)
+        extra_args = {'ContentType': content_type, 'ContentDisposition': disposition_for(content_type, filename)}
+        encoding_args = self._encoding_args(content_type)
+        if encoding_args:
+            extra_args.update(encoding_args)
+        writer = MultipartUploadWriter(self.s3_client, self.bucket_name, key,
+                                       part_size or self.UPLOAD_STREAM_PART_SIZE, extra_args)
+        return CompressingWriter(writer, self.compression) if encoding_args else writer
+
+    def _bulk_call(self, func, *args, **kwargs):
+        """Call func through the bulk circuit breaker; raises CircuitOpenError while it is open."""
+        self.bulk_breaker.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # Only failures of S3 itself count, not e.g. a missing key; S3 did answer those
+            if s3_error_kind(e):
+                self.bulk_breaker.record_failure()
+            else:
+                self.bulk_breaker.record_success()
+            raise
+        self.bulk_breaker.record_success()
+        return result
+
+    def _run_parallel(self, objects, action, max_workers):
+        """Apply action(obj) to listing entries in a thread pool; returns the keys that failed."""
+        failed = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._bulk_call, action, obj): obj["Key"] for obj in objects}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (ClientError, NoCredentialsError, BotoConnectionError, HTTPClientError,
+                        CircuitOpenError, DeadlineExceeded) as e:
+                    logging.error(f"{futures[future]}: {e}")
+                    failed.append(futures[future])
+        return failed
+
+    def copy_prefix(self, source_prefix, destination_prefix, max_workers=16):
+        """
+        Server-side copy of every object under a prefix, in parallel. Sizes come
+        from the listing, so no per-object HEAD is needed.
+
+        Args:
+        source_prefix: str - prefix to copy from
+        destination_prefix: str - prefix to copy to
+        max_workers: int - concurrent copies
+
+        Returns:
+        list: keys that failed to copy (empty on full success)
+        """
+        return self.copy_prefix_objects(self.iter_files(source_prefix), source_prefix,
+                                        destination_prefix, max_workers)
+
+    def move_prefix(self, source_prefix, destination_prefix, max_workers=16):
+        """
+        Move every object under a prefix: parallel server-side copies, then batched
+        deletes (1000 keys per request) of the sources that copied successfully.
+
+        Args:
+        source_prefix: str - prefix to move from
+        destination_prefix: str - prefix to move to
+        max_workers: int - concurrent copies
+
+        Returns:
+        list: keys that failed to move (empty on full success)
+        """
+        objects = list(self.iter_files(source_prefix))
+        failed = self.copy_prefix_objects(objects, source_prefix, destination_prefix, max_workers)
+        failed_set = set(failed)
+        copied = [obj["Key"] for obj in objects if obj["Key"] not in failed_set]
+        failed.extend(self.delete_files(copied))
+        return failed
+
+    def copy_prefix_objects(self, objects, source_prefix, destination_prefix, max_workers=16):
+        """Like copy_prefix, for listing entries the caller already has."""
+        def copy(obj):
+            destination_key = destination_prefix + obj["Key"][len(source_prefix):]
+            self._copy_object(obj["Key"], destination_key, size=obj["Size"])
+            if self.public_objects:
+                self.make_object_public(destination_key)
+
+        return self._run_parallel(objects, copy, max_workers)
+
+    def delete_files(self, keys):
+        """
+        Delete objects in batches of 1000 keys per request
+
+        Args:
+        keys: list - keys of the objects in the S3 bucket
+
+        Returns:
+        list: keys that failed to delete
+        """
+        failed = []
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            try:
+                response = self._bulk_call(
+                    self.s3_client.delete_objects,
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True})
+                failed.extend(error["Key"] for error in response.get("Errors", []))
+            except (ClientError, BotoConnectionError, HTTPClientError, CircuitOpenError, DeadlineExceeded) as e:
+                logging.error(e)
+                failed.extend(batch)
+        return failed
+
+    def rewrite_metadata_prefix(self, prefix, content_type=None, content_disposition=None,
+                                metadata=None, max_workers=16):
+        """
+        Rewrite the metadata of every object under a prefix in place, in parallel.
+
+        Args:
+        prefix: str - prefix whose objects are rewritten
+        content_type: str or callable - new Content-Type, or obj -> Content-Type
+                      (return None to skip an object)
+        content_disposition: str - new Content-Disposition
+        metadata: dict - user metadata to set; when given together with content_type and
+                  recording the content-encoding key, no HEAD is made per object,
+                  otherwise each object's user metadata, Content-Type and
+                  Content-Encoding are read and preserved
+        max_workers: int - concurrent copies
+
+        Returns:
+        list: keys that failed to update (empty on full success)
+        """
+        def rewrite(obj):
+            new_type = content_type(obj) if callable(content_type) else content_type
+            if callable(content_type) and new_type is None:
+                return
+            self._copy_object(obj["Key"], obj["Key"], size=obj["Size"], metadata=metadata,
+                              content_type=new_type, content_disposition=content_disposition)
+
+        return self._run_parallel(self.iter_files(prefix), rewrite, max_workers)
+
     def list_files(self, key):
         """
         List all files in the S3 bucket with the given key
@@ -289,20 +823,7 @@ class S3FileManager:
         list: List of files in the S3 bucket with the given key
         """
         try:
-            files = []
-            continuation_token = None
-            while True:
-                if continuation_token:
-                    response = self.s3_client.list_objects_v2(
-                        Bucket=self.bucket_name, Prefix=key, ContinuationToken=continuation_token)
-                else:
-                    response = self.s3_client.list_objects_v2(
-                        Bucket=self.bucket_name, Prefix=key)
-                files.extend(response.get("Contents", []))
-                continuation_token = response.get("NextContinuationToken")
-                if not continuation_token:
-                    break
-            return files
+            return list(self.iter_files(key))
         except NoCredentialsError:
             logging.error("Credentials not available")
             return False
@@ -310,6 +831,66 @@ class S3FileManager:
             logging.error(e)
             return False
 
+    def iter_files(self, prefix, start_after=None, page_size=1000):
+        """
+        Lazily yield the objects under a prefix, one listing page at a time
+
+        Args:
+        prefix: str - key prefix in the S3 bucket
+        start_after: str - only yield keys after this one
+        page_size: int - keys requested per listing call
+
+        Returns:
+        generator: object dicts with Key, Size, LastModified and ETag
+        """
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix,
+                  'PaginationConfig': {'PageSize': page_size}}
+        if start_after:
+            params['StartAfter'] = start_after
+        for page in self.s3_client.get_paginator('list_objects_v2').paginate(**params):
+            yield from page.get("Contents", [])
+
+    def list_prefixes(self, prefix, delimiter="/"):
+        """
+        List one level of the hierarchy under a prefix, like a folder listing
+
+        Args:
+        prefix: str - key prefix in the S3 bucket, usually ending with the delimiter
+        delimiter: str - hierarchy separator
+
+        Returns:
+        tuple: (sub-prefixes, objects directly under the prefix)
+        """
+        prefixes, objects = [], []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter=delimiter):
+            prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+            objects.extend(page.get("Contents", []))
+        return prefixes, objects
+
+    def iter_files_parallel(self, prefix, delimiter="/", max_workers=16, prefixes=None):
+        """
+        Yield the objects under a prefix by listing its sub-prefixes in parallel.
+        Objects arrive grouped by sub-prefix, in completion order.
+
+        Args:
+        prefix: str - key prefix in the S3 bucket
+        delimiter: str - hierarchy separator used to split the work
+        max_workers: int - concurrent listings
+        prefixes: list - sub-prefixes to list instead of discovering them
+
+        Returns:
+        generator: (sub-prefix, list of object dicts) tuples; objects directly
+                   under `prefix` come first with sub-prefix None
+        """
+        if prefixes is None:
+            prefixes, objects = self.list_prefixes(prefix, delimiter)
+            if objects:
+                yield None, objects
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(lambda p: list(self.iter_files(p)), p): p for p in prefixes}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
 
     def download_file(self, key, download_path):
         """
@@ -325,8 +906,18 @@ class S3FileManager:
         try:
             if os.path.exists(download_path):
                 os.remove(download_path)
+            # One GET tells whether the object is encoded; only large plain objects
+            # are fetched again, with the parallel ranged download
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
             with open(download_path, 'wb') as f:
-                self.s3_client.download_fileobj(self.bucket_name, key, f)
+                encoding = response.get("ContentEncoding")
+                if encoding in ENCODINGS:
+                    shutil.copyfileobj(decompressing_reader(response["Body"], encoding), f)
+                elif response.get("ContentLength", 0) <= self.PARALLEL_DOWNLOAD_THRESHOLD:
+                    shutil.copyfileobj(response["Body"], f)
+                else:
+                    response["Body"].close()
+                    self.s3_client.download_fileobj(self.bucket_name, key, f)
             return True
         except NoCredentialsError:
             logging.error("Credentials not available")
@@ -356,24 +947,30 @@ class S3FileManager:
             logging.error(e)
             return False
 
-    def upload_file_from_bytes(self, data, key):
+    def upload_file_from_bytes(self, data, key, content_type=None, filename=None):
         """
         Upload a file to S3 from bytes
 
         Args:
         data: bytes - data to be uploaded
         key: str - key to be used in the S3 bucket
+        content_type: str - type reported by the client, refined by magic bytes
+        filename: str - original file name, defaults to the last part of the key
 
         Returns:
         bool: True if the file was uploaded successfully, False otherwise
         """
         try:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(data)
-                temp_file.close()
-                print("Temp file name: ", temp_file.name)
-                self.upload_file(temp_file.name, key)
-                os.unlink(temp_file.name)
+            # Single PUT straight from memory, no temp file
+            filename = filename or key.rsplit("/", 1)[-1]
+            content_type = detect_content_type(filename, data[:SNIFF_BYTES], content_type)
+            encoding_args = self._encoding_args(content_type, len(data)) or {}
+            if encoding_args:
+                data = compress_bytes(data, self.compression)
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=data, ContentType=content_type,
+                                      ContentDisposition=disposition_for(content_type, filename), **encoding_args)
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except NoCredentialsError:
             logging.error("Credentials not available")
@@ -382,6 +979,26 @@ class S3FileManager:
             logging.error(e)
             return False
 
+    def get_object_metadata(self, key):
+        """
+        Get an object's metadata with a HEAD request
+
+        Args:
+        key: str - key of the object in the S3 bucket
+
+        Returns:
+        dict: head_object response (ContentType, ContentDisposition, Metadata, ContentLength, ...),
+              or None on error
+        """
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+        except NoCredentialsError:
+            logging.error("Credentials not available")
+            return None
+        except ClientError as e:
+            logging.error(e)
+            return None
+
     def download_file_to_bytes(self, key):
         """
         Download a file from S3 to bytes
@@ -390,16 +1007,15 @@ class S3FileManager:
         key: str - key of the file in the S3 bucket
 
         Returns:
-        bytes: data of the file
+        bytes: data of the file, decompressed if it was stored with a Content-Encoding
         """
         try:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.close()
-                self.download_file(key, temp_file.name)
-                with open(temp_file.name, 'rb') as f:
-                    data = f.read()
-                os.unlink(temp_file.name)
-            return data
+            # One GET straight into memory, no temp file
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            body = response["Body"]
+            if response.get("ContentEncoding") in ENCODINGS:
+                body = decompressing_reader(body, response["ContentEncoding"])
+            return body.read()
         except NoCredentialsError:
             logging.error("Credentials not available")
             return False
@@ -407,19 +1023,45 @@ class S3FileManager:
             logging.error(e)
             return False
 
-    def get_object(self, key):
+    def download_range(self, key, start, end):
+        """
+        Download a byte range of an object with a ranged GET
+
+        Args:
+        key: str - key of the file in the S3 bucket
+        start: int - first byte offset
+        end: int - last byte offset, inclusive
+
+        Returns:
+        bytes: data of the range as stored (not decompressed), or None on error
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{end}")
+            return response["Body"].read()
+        except NoCredentialsError:
+            logging.error("Credentials not available")
+            return None
+        except ClientError as e:
+            logging.error(e)
+            return None
+
+    def get_object(self, key, decompress=True):
         """
         Get an object from S3
 
         Args:
         key: str - key of the object in the S3 bucket
+        decompress: bool - wrap the Body of gzip/zstd-encoded objects in a streaming decompressor
 
         Returns:
-        bytes: data of the object
+        dict: get_object response; its Body yields the original data, and
+              ContentLength stays the stored (compressed) size
         """
         try:
             response = self.s3_client.get_object(
                 Bucket=self.bucket_name, Key=key)
+            if decompress and response.get("ContentEncoding") in ENCODINGS:
+                response["Body"] = decompressing_reader(response["Body"], response["ContentEncoding"])
             return response
         except NoCredentialsError:
             logging.error("Credentials not available")
@@ -439,15 +1081,13 @@ class S3FileManager:
         Returns:
         bool: True if the directory was uploaded successfully, False otherwise
         """
-        print("Uploading directory: ", directory_path)
-        print("Key: ", key)
+        logging.debug(f"Uploading directory {directory_path} to {key}")
         try:
             for root, dirs, files in os.walk(directory_path):
                 for file in files:
                     file_path = os.path.join(root, file)
                     s3_key = key + file_path[len(directory_path):]
-                    print("Uploading file: ", file_path)
-                    print("S3 key for the file: ", s3_key)
+                    logging.debug(f"Uploading file {file_path} to {s3_key}")
                     await self.upload_file(file_path, s3_key)
             return True
         except NoCredentialsError:
@@ -470,7 +1110,7 @@ class S3FileManager:
         bool: True if the directory was downloaded successfully, False otherwise
         """
         try:
-            for obj in self.list_files(key):
+            for obj in self.iter_files(key):
                 file_key = obj['Key']
                 file_path = os.path.join(download_path, file_key[len(key):])
                 self.download_file(file_key, file_path)
@@ -559,7 +1199,8 @@ class S3FileManager:
         """
         try:
             self.s3_client.upload_file(file_path, self.bucket_name, key, ExtraArgs={'ContentType': 'image/png'})
-            self.make_object_public(key)
+            if self.public_objects:
+                self.make_object_public(key)
             return True
         except FileNotFoundError:
             logging.error("The file was not found")
@@ -573,3 +1214,117 @@ class S3FileManager:
         except Exception as e:
             logging.error(f"An error occurred: {e}")
             return False
+
+    @staticmethod
+    def sha256_file(file_path, chunk_size=1024 * 1024):
+        """
+        Hash a file with SHA-256, streaming it in chunks so large files never sit in memory
+
+        Args:
+        file_path: str - path to the file to hash
+        chunk_size: int - number of bytes read per chunk
+
+        Returns:
+        str: hex digest of the file
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def content_addressed_key(self, digest, filename=""):
+        """
+        Build the key under which content with the given digest is stored
+
+        Args:
+        digest: str - SHA-256 hex digest of the content
+        filename: str - original file name, only its extension is kept
+
+        Returns:
+        str: key in the S3 bucket
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        return f"{self.CONTENT_ADDRESSED_PREFIX}{digest[:2]}/{digest}{extension}"
+
+    def object_exists(self, key):
+        """
+        Check whether an object exists in S3
+
+        Args:
+        key: str - key of the object in the S3 bucket
+
+        Returns:
+        bool: True if the object exists, False otherwise
+        """
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                logging.error(e)
+            return False
+
+    async def upload_file_content_addressed(self, file_path, filename=None, content_type=None, digest=None):
+        """
+        Upload a file under a key derived from its SHA-256 digest, skipping the
+        upload when identical content is already stored
+
+        Args:
+        file_path: str - path to the file to be uploaded
+        filename: str - original file name, defaults to the basename of file_path
+        content_type: str - optional Content-Type of the object
+        digest: str - SHA-256 hex digest if already known
+
+        Returns:
+        tuple: (key, digest, uploaded) - key is None if the upload failed
+        """
+        digest = digest or self.sha256_file(file_path)
+        key = self.content_addressed_key(digest, filename or os.path.basename(file_path))
+        if self.object_exists(key):
+            return key, digest, False
+        success = await self.upload_file(file_path, key, content_type, filename=filename or os.path.basename(file_path))
+        return (key if success else None), digest, success
+
+    def generate_presigned_url(self, key, filename=None, expires_in=None):
+        """
+        Get a presigned GET URL for an object. URLs are signed locally (no network
+        call) and cached until 80% of their lifetime has passed, so repeated reruns
+        reuse the same URL and browsers can cache the object.
+
+        Args:
+        key: str - key of the object in the S3 bucket
+        filename: str - optional download name sent as Content-Disposition
+        expires_in: int - lifetime in seconds, defaults to presign_expiry
+
+        Returns:
+        str: presigned URL, or None on error
+        """
+        expires_in = expires_in or self.presign_expiry
+        cache_key = (key, filename, expires_in)
+        now = time.time()
+        with self._url_cache_lock:
+            cached = self._url_cache.get(cache_key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        params = {'Bucket': self.bucket_name, 'Key': key}
+        if filename:
+            params['ResponseContentDisposition'] = disposition_for(type_from_extension(filename), filename)
+        try:
+            url = self.s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+        except NoCredentialsError:
+            logging.error("Credentials not available")
+            return None
+        except ClientError as e:
+            logging.error(e)
+            return None
+
+        with self._url_cache_lock:
+            if len(self._url_cache) >= 10000:
+                # Drop expired entries, then everything if still full
+                self._url_cache = {k: v for k, v in self._url_cache.items() if v[1] > now}
+                if len(self._url_cache) >= 10000:
+                    self._url_cache.clear()
+            self._url_cache[cache_key] = (url, now + expires_in * 0.8)
+        return url
@@ -0,0 +1,165 @@
+# External imports
+import json
+import logging
+import os
+import threading
+import time
+
+
+def _serializable(obj):
+    """Keep the listing fields the manifest needs, with LastModified as an ISO string."""
+    last_modified = obj.get("LastModified")
+    return {
+        "Key": obj["Key"],
+        "Size": obj.get("Size", 0),
+        "ETag": obj.get("ETag"),
+        "LastModified": last_modified.isoformat() if hasattr(last_modified, "isoformat") else last_modified,
+    }
+
+
+class PrefixManifest:
+    """
+    Cached, incrementally refreshed listing of an S3 prefix.
+
+    The prefix is split into sub-prefixes with a delimiter listing (for
+    `qu-agents/documents/` that is one sub-prefix per document). Each sub-prefix's
+    objects are cached together with their newest LastModified. S3 cannot list by
+    modification time, so a refresh re-runs only the cheap delimiter listing and
+    then lists just the sub-prefixes that are new, were invalidated by a write, or
+    are older than `max_age`, in parallel. The manifest can be persisted to a
+    JSON file so other processes reuse it.
+
+    Attributes:
+    -----------
+    s3_client: S3FileManager
+        Client used for listing.
+    prefix: str
+        The prefix covered by the manifest.
+    path: str
+        Optional JSON file the manifest is loaded from and saved to.
+    max_age: float
+        Seconds after which a sub-prefix is relisted; None means never.
+    relisted: list
+        Sub-prefixes the last refresh listed, sorted.
+    """
+
+    def __init__(self, s3_client, prefix, path=None, max_age=None, delimiter="/", max_workers=16):
+        self.s3_client = s3_client
+        self.prefix = prefix
+        self.path = path
+        self.max_age = max_age
+        self.delimiter = delimiter
+        self.max_workers = max_workers
+        self.root_objects = []
+        self.entries = {}
+        self.refreshed_at = None
+        self.relisted = []
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the manifest from `path` if it exists and covers the same prefix."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable listing manifest {self.path}: {e}")
+            return
+        if data.get("prefix") == self.prefix:
+            self.root_objects = data.get("root_objects", [])
+            self.entries = data.get("entries", {})
+            self.refreshed_at = data.get("refreshed_at")
+
+    def save(self):
+        """Write the manifest to `path` atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"prefix": self.prefix, "refreshed_at": self.refreshed_at,
+                    "root_objects": self.root_objects, "entries": self.entries}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def sub_prefix_of(self, key):
+        """Return the sub-prefix a key belongs to, or None if it sits directly under the prefix."""
+        if not key.startswith(self.prefix):
+            return None
+        rest = key[len(self.prefix):]
+        head, sep, _ = rest.partition(self.delimiter)
+        return f"{self.prefix}{head}{sep}" if sep else None
+
+    def invalidate(self, key):
+        """Mark the sub-prefix containing `key` for relisting on the next refresh."""
+        sub_prefix = self.sub_prefix_of(key)
+        with self._lock:
+            if sub_prefix in self.entries:
+                self.entries[sub_prefix]["dirty"] = True
+
+    def refresh(self, save=True):
+        """
+        Bring the manifest up to date, listing only what may have changed.
+
+        Args:
+        save: bool - write the manifest to `path` afterwards
+
+        Returns:
+        dict: number of sub-prefixes listed, reused and removed
+        """
+        now = time.time()
+        sub_prefixes, root_objects = self.s3_client.list_prefixes(self.prefix, self.delimiter)
+        current = set(sub_prefixes)
+        with self._lock:
+            stale = [
+                p for p in sub_prefixes
+                if p not in self.entries
+                or self.entries[p].get("dirty")
+                or (self.max_age is not None and now - self.entries[p]["listed_at"] > self.max_age)
+            ]
+            removed = [p for p in self.entries if p not in current]
+            for p in removed:
+                del self.entries[p]
+            self.root_objects = [_serializable(o) for o in root_objects]
+
+        for sub_prefix, objects in self.s3_client.iter_files_parallel(
+                self.prefix, self.delimiter, self.max_workers, prefixes=stale):
+            objects = [_serializable(o) for o in objects]
+            with self._lock:
+                self.entries[sub_prefix] = {
+                    "objects": objects,
+                    "last_modified": max((o["LastModified"] for o in objects if o["LastModified"]), default=None),
+                    "listed_at": now,
+                    "dirty": False,
+                }
+
+        self.refreshed_at = now
+        self.relisted = sorted(stale)
+        if save:
+            self.save()
+        return {"listed": len(stale), "reused": len(current) - len(stale), "removed": len(removed)}
+
+    def sub_prefixes(self):
+        """Sub-prefixes currently in the manifest, sorted."""
+        with self._lock:
+            return sorted(self.entries)
+
+    def iter_objects(self, sub_prefix=None):
+        """
+        Yield cached objects, for one sub-prefix or the whole prefix.
+
+        Args:
+        sub_prefix: str - restrict to one sub-prefix
+
+        Returns:
+        generator: object dicts with Key, Size, ETag and LastModified
+        """
+        with self._lock:
+            if sub_prefix is not None:
+                groups = [self.entries.get(sub_prefix, {}).get("objects", [])]
+            else:
+                groups = [self.root_objects] + [self.entries[p]["objects"] for p in sorted(self.entries)]
+        for group in groups:
+            yield from group
@@ -0,0 +1,137 @@
+# Query construction, ordering and bulk edits for search_page (also used by the benchmarks)
+from datetime import datetime, time
+
+from pymongo import UpdateMany
+
+# Characters of the description kept in a document's summary
+SUMMARY_DESCRIPTION_CHARS = 200
+
+SORT_OPTIONS = ["Newest created", "Last updated", "Name (A→Z)"]
+
+# Server-side equivalents of SORT_OPTIONS, for results streamed rather than sorted in memory
+# (names compare case-sensitively here)
+SORT_SPECS = {
+    "Newest created": [("created_at", -1)],
+    "Last updated": [("updated_at", -1)],
+    "Name (A→Z)": [("name", 1)],
+}
+
+
+def build_search_query(search_query=None, tags=None, flags=None, start_date=None, end_date=None,
+                       content_doc_ids=None):
+    """
+    Build the MongoDB filter used by the search page.
+
+    Args:
+    search_query: str - case-insensitive regex matched against name, description and notes
+    tags: list - match documents with any of these tags
+    flags: list - match documents with any of these flags
+    start_date: date - created on or after
+    end_date: date - created on or before
+    content_doc_ids: list - doc_ids whose file content matched search_query
+
+    Returns:
+    dict: the filter
+    """
+    query = {}
+
+    # text query across fields
+    if search_query:
+        search_regex = {"$regex": search_query, "$options": "i"}
+        query["$or"] = [
+            {"name": search_regex},
+            {"description": search_regex},
+            {"notes": search_regex},
+        ]
+        if content_doc_ids:
+            query["$or"].append({"doc_id": {"$in": content_doc_ids}})
+
+    # tags (any of)
+    if tags:
+        query["tags"] = {"$in": tags}
+
+    # flags (any of)
+    if flags:
+        query["flags"] = {"$in": flags}
+
+    # created_at date range, as naive datetimes at the day bounds
+    date_filter = {}
+    if start_date:
+        date_filter["$gte"] = datetime.combine(start_date, time.min)
+    if end_date:
+        date_filter["$lte"] = datetime.combine(end_date, time.max)
+    if date_filter:
+        query["created_at"] = date_filter
+
+    return query
+
+
+def document_summary(document):
+    """
+    Compact summary stored on each document, so list views can skip the
+    description and the files array.
+
+    Args:
+    document: dict - the document being written
+
+    Returns:
+    dict: file_count, total_size and a short description
+    """
+    files = document.get("files") or []
+    return {
+        "file_count": len(files),
+        "total_size": sum(f.get("size") or 0 for f in files),
+        "description": (document.get("description") or "")[:SUMMARY_DESCRIPTION_CHARS],
+    }
+
+
+# Pipeline update computing the same summary server-side, for documents written without one
+SUMMARY_PIPELINE = [{"$set": {"summary": {
+    "file_count": {"$size": {"$ifNull": ["$files", []]}},
+    "total_size": {"$sum": {"$ifNull": ["$files.size", []]}},
+    "description": {"$substrCP": [{"$ifNull": ["$description", ""]}, 0, SUMMARY_DESCRIPTION_CHARS]},
+}}}]
+
+
+def sort_documents(documents, sort_by):
+    """Sort search results in place by one of SORT_OPTIONS."""
+    if sort_by == "Newest created":
+        documents.sort(key=lambda d: d.get("created_at") or d.get("updated_at") or datetime.min, reverse=True)
+    elif sort_by == "Last updated":
+        documents.sort(key=lambda d: d.get("updated_at") or d.get("created_at") or datetime.min, reverse=True)
+    else:
+        documents.sort(key=lambda d: (d.get("name") or "").lower())
+    return documents
+
+
+def build_bulk_edit(filter, add_flags=None, remove_flags=None, add_tags=None, remove_tags=None, now=None):
+    """
+    Build the write operations that add and remove flags and tags on every
+    document matching a filter.
+
+    $addToSet and $pull can't target the same field in one update, so additions
+    and removals are separate UpdateMany operations, meant to be sent together
+    in one ordered bulk_write (removals win over additions of the same value).
+
+    Args:
+    filter: dict - documents to edit, e.g. a search query or {"doc_id": {"$in": ids}}
+    add_flags: list - flags to add
+    remove_flags: list - flags to remove
+    add_tags: list - tags to add
+    remove_tags: list - tags to remove
+    now: datetime - updated_at value, defaults to utcnow
+
+    Returns:
+    list: UpdateMany operations, empty if there is nothing to change
+    """
+    now = now or datetime.utcnow()
+    additions = {field: {"$each": list(values)}
+                 for field, values in (("flags", add_flags), ("tags", add_tags)) if values}
+    removals = {field: {"$in": list(values)}
+                for field, values in (("flags", remove_flags), ("tags", remove_tags)) if values}
+    operations = []
+    if additions:
+        operations.append(UpdateMany(filter, {"$addToSet": additions, "$set": {"updated_at": now}}))
+    if removals:
+        operations.append(UpdateMany(filter, {"$pull": removals, "$set": {"updated_at": now}}))
+    return operations
@@ -0,0 +1,104 @@
+# External imports
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+# Suggestions precomputed for one-character prefixes, whose ranges are too large to rank per keystroke
+SHORT_PREFIX_TOP = 50
+
+
+class TagVocabulary:
+    """
+    Prefix-searchable tag vocabulary for the tag inputs' suggestions.
+
+    Tags are kept in a sorted list, so the tags starting with a prefix are one
+    contiguous range found with two binary searches, and ranked by how many
+    documents use them. Counts come from the usage counters; new tags are added
+    incrementally between refreshes.
+
+    Attributes:
+    -----------
+    max_age: float
+        Seconds after which refresh_if_stale reloads the counts.
+    refreshed_at: float
+        time.monotonic() of the last full refresh, or None.
+    """
+
+    def __init__(self, counts=None, max_age=300):
+        self.max_age = max_age
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+        self._tags = []
+        self._counts = {}
+        self._top_by_initial = {}
+        if counts is not None:
+            self.refresh(counts)
+
+    def __len__(self):
+        return len(self._tags)
+
+    def __contains__(self, tag):
+        return tag in self._counts
+
+    def refresh(self, counts):
+        """
+        Replace the vocabulary.
+
+        Args:
+        counts: dict - tag -> number of documents using it
+        """
+        tags = sorted(counts)
+        counts = dict(counts)
+        top_by_initial = {}
+        for tag in tags:
+            top_by_initial.setdefault(tag[:1], []).append(tag)
+        for initial, group in top_by_initial.items():
+            top_by_initial[initial] = heapq.nlargest(SHORT_PREFIX_TOP, group, key=counts.__getitem__)
+        top_by_initial[""] = heapq.nlargest(SHORT_PREFIX_TOP, tags, key=counts.__getitem__)
+        with self._lock:
+            self._tags, self._counts, self._top_by_initial = tags, counts, top_by_initial
+            self.refreshed_at = time.monotonic()
+
+    def refresh_if_stale(self, load_counts):
+        """
+        Refresh from `load_counts()` if the vocabulary was never loaded or is older than max_age.
+
+        Returns:
+        bool: True if a refresh happened
+        """
+        if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.max_age:
+            return False
+        self.refresh(load_counts())
+        return True
+
+    def add(self, tag, count=1):
+        """Add uses of a tag, inserting it in order if it is new."""
+        with self._lock:
+            if tag not in self._counts:
+                insort(self._tags, tag)
+                self._counts[tag] = 0
+            self._counts[tag] += count
+
+    def suggest(self, prefix, limit=8):
+        """
+        Tags starting with a prefix, most used first.
+
+        Args:
+        prefix: str - what the user has typed so far
+        limit: int - maximum number of suggestions
+
+        Returns:
+        list: matching tags
+        """
+        prefix = (prefix or "").strip().lower()
+        tags, counts = self._tags, self._counts
+        if len(prefix) <= 1 and prefix in self._top_by_initial:
+            # Tags added since the last refresh are missing here until the next one
+            return self._top_by_initial[prefix][:limit]
+        start = bisect_left(tags, prefix)
+        end = bisect_left(tags, prefix + "\uffff", start)
+        if end - start <= limit:
+            matches = tags[start:end]
+            return sorted(matches, key=lambda t: (-counts.get(t, 0), t))
+        return heapq.nsmallest(limit, tags[start:end], key=lambda t: (-counts.get(t, 0), t))
@@ -0,0 +1,23 @@
+# Tests import the flat top-level modules of the repository
+import os
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3_file_manager import S3FileManager  # noqa: E402
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """An S3FileManager on bucket "bucket" with a Stubber on its client."""
+    monkeypatch.setenv("AWS_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SECRET_KEY", "test")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    manager = S3FileManager()
+    with Stubber(manager.s3_client) as stubber:
+        yield manager, stubber
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,95 @@
+from botocore.stub import ANY
+
+import backfill_content_types
+
+
+class FakeS3:
+    def __init__(self, prefixes):
+        self.prefixes = prefixes
+        self.changed = []
+        self.failing = set()
+
+    def list_prefixes(self, prefix, delimiter="/"):
+        groups = self.prefixes[prefix]
+        return [p for p in groups if p], [{"Key": key, "Size": 10} for key in groups.get(None, [])]
+
+    def iter_files_parallel(self, prefix, delimiter="/", max_workers=16, prefixes=None):
+        for sub_prefix, keys in self.prefixes[prefix].items():
+            if prefixes is None or sub_prefix in prefixes:
+                yield sub_prefix, [{"Key": key, "Size": 10} for key in keys]
+
+    def get_object_metadata(self, key):
+        content_type = "application/pdf" if key.endswith(".pdf") else "binary/octet-stream"
+        return {"ContentType": content_type, "ContentDisposition": f'inline; filename="{key.rsplit("/", 1)[-1]}"',
+                "ContentLength": 10, "Metadata": {"owner": "me"}}
+
+    def change_content_type(self, key, content_type, metadata=None, size=None, content_encoding=None):
+        self.changed.append((key, content_type, metadata, size))
+        return key not in self.failing
+
+
+def test_backfill_rewrites_mismatching_objects_across_prefixes(monkeypatch):
+    fake = FakeS3({"docs/": {"docs/a/": ["docs/a/1.pdf", "docs/a/2.txt"], "docs/b/": ["docs/b/3.csv"]},
+                   "blobs/": {None: ["blobs/4.pdf"]}})
+
+    class Manager:
+        CONTENT_ADDRESSED_PREFIX = "blobs/"
+
+        def __new__(cls):
+            return fake
+
+    monkeypatch.setattr(backfill_content_types, "S3FileManager", Manager)
+    assert backfill_content_types.main(["docs/", "blobs/", "--workers", "1"]) == 0
+    assert sorted((key, content_type) for key, content_type, _, _ in fake.changed) == \
+        [("docs/a/2.txt", "text/plain"), ("docs/b/3.csv", "text/csv")]
+    assert all(metadata == {"owner": "me"} and size == 10 for _, _, metadata, size in fake.changed)
+
+
+def test_backfill_with_manifest_rechecks_only_new_and_failed_sub_prefixes(monkeypatch, tmp_path):
+    fake = FakeS3({"docs/": {"docs/a/": ["docs/a/1.pdf", "docs/a/2.txt"], "docs/b/": ["docs/b/3.csv"],
+                             None: ["docs/4.txt"]}})
+    fake.failing.add("docs/b/3.csv")
+
+    class Manager:
+        CONTENT_ADDRESSED_PREFIX = "blobs/"
+
+        def __new__(cls):
+            return fake
+
+    monkeypatch.setattr(backfill_content_types, "S3FileManager", Manager)
+    argv = ["docs/", "--workers", "1", "--manifest-dir", str(tmp_path)]
+    assert backfill_content_types.main(argv) == 1
+    assert sorted(key for key, _, _, _ in fake.changed) == ["docs/4.txt", "docs/a/2.txt", "docs/b/3.csv"]
+
+    # A dry run leaves the manifest as it was
+    fake.changed.clear()
+    assert backfill_content_types.main(argv + ["--dry-run"]) == 0
+    assert fake.changed == []
+
+    fake.changed.clear()
+    fake.failing.clear()
+    fake.prefixes["docs/"]["docs/c/"] = ["docs/c/5.txt"]
+    assert backfill_content_types.main(argv) == 0
+    # docs/a/ is reused from the manifest; root objects are always checked
+    assert sorted(key for key, _, _, _ in fake.changed) == ["docs/4.txt", "docs/b/3.csv", "docs/c/5.txt"]
+
+    fake.changed.clear()
+    assert backfill_content_types.main(argv) == 0
+    assert [key for key, _, _, _ in fake.changed] == ["docs/4.txt"]
+
+
+def test_backfill_object_heads_each_object_once(s3):
+    manager, stubber = s3
+    for key, encoding in [("docs/a.txt", "gzip"), ("docs/b.csv", None)]:
+        head = {"ContentType": "binary/octet-stream", "ContentLength": 10, "Metadata": {"owner": "me"}}
+        if encoding:
+            head["ContentEncoding"] = encoding
+        stubber.add_response("head_object", head, {"Bucket": "bucket", "Key": key})
+        expected = {"Bucket": "bucket", "Key": key, "CopySource": {"Bucket": "bucket", "Key": key},
+                    "MetadataDirective": "REPLACE",
+                    "ContentType": ANY, "ContentDisposition": ANY,
+                    "Metadata": {"owner": "me", **({"content-encoding": encoding} if encoding else {})}}
+        if encoding:
+            expected["ContentEncoding"] = encoding
+        stubber.add_response("copy_object", {}, expected)
+        assert backfill_content_types.backfill_object(manager, {"Key": key, "Size": 10}) == "fixed"
@@ -0,0 +1,43 @@
+import json
+import uuid
+
+from bulk_import import IMPORT_NAMESPACE, BulkImporter
+
+
+class FakeMongo:
+    def __init__(self, doc_ids):
+        self.doc_ids = set(doc_ids)
+        self.inserted = []
+
+    def find(self, collection_name, filter={}, limit=0, projection=None, **kwargs):
+        wanted = filter["doc_id"]
+        wanted = wanted["$in"] if isinstance(wanted, dict) else [wanted]
+        return [{"doc_id": doc_id} for doc_id in wanted if doc_id in self.doc_ids]
+
+    def insert_many(self, collection_name, data):
+        self.inserted.extend(data)
+
+    def bulk_write(self, collection_name, operations, ordered=True):
+        pass
+
+
+class RefusingStore:
+    def store_file(self, *args):
+        raise AssertionError("stored a file of an already imported document")
+
+
+def test_resume_skips_documents_written_before_the_checkpoint(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    source = str(path)
+    # The crashed run inserted the document but never checkpointed it
+    mongo = FakeMongo([str(uuid.uuid5(IMPORT_NAMESPACE, source))])
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    importer = BulkImporter(mongo, s3_client=None, workers=1, checkpoint_path=str(checkpoint),
+                            content_store=RefusingStore())
+    item = {"source": source, "paths": [source], "name": "a", "description": "", "tags": [], "notes": "",
+            "flags": []}
+    assert importer.run([item])
+    assert mongo.inserted == []
+    assert importer.skipped == 1
+    assert [json.loads(line)["source"] for line in checkpoint.read_text().splitlines()] == [source]
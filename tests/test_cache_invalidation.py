@@ -0,0 +1,33 @@
+from cache_invalidation import ChangeWatcher, InvalidationBus
+
+
+class FakeCollection:
+    def __init__(self):
+        self.indexes = []
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+
+    def estimated_document_count(self):
+        return 0
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+
+class FakeMongo:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def test_polling_creates_descending_timestamp_indexes():
+    mongo = FakeMongo()
+    watcher = ChangeWatcher(mongo, InvalidationBus(), ["documents", "document_flags"], mode="poll")
+    watcher._stop.set()
+    watcher._poll()
+    assert watcher.active_mode == "poll"
+    for name in ("documents", "document_flags"):
+        assert mongo.collections[name].indexes == [[("updated_at", -1)], [("created_at", -1)]]
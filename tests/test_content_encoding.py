@@ -0,0 +1,102 @@
+import io
+
+import pytest
+from botocore.response import StreamingBody
+
+from content_encoding import (CompressingReader, CompressingWriter, compress_bytes, decompressing_reader,
+                              is_compressible, resolve_encoding)
+
+
+ENCODINGS = ["gzip", pytest.param("zstd", marks=pytest.mark.skipif(
+    resolve_encoding("zstd") != "zstd", reason="zstandard is not installed"))]
+# Several CHUNK_SIZE steps of compressible data
+DATA = b"".join(b"line %d of a compressible text file\n" % i for i in range(200000))
+
+
+class Target(io.BytesIO):
+    """Stands in for a MultipartUploadWriter."""
+    aborted = False
+
+    def close(self):
+        self.result = self.getvalue()
+        super().close()
+
+    def abort(self):
+        self.aborted = True
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_reader_round_trip_with_small_reads(encoding):
+    reader = CompressingReader(io.BytesIO(DATA), encoding)
+    compressed = b"".join(iter(lambda: reader.read(1000), b""))
+    assert len(compressed) < len(DATA) // 10
+    assert decompressing_reader(io.BytesIO(compressed), encoding).read() == DATA
+    assert decompressing_reader(io.BytesIO(compress_bytes(DATA, encoding)), encoding).read() == DATA
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_writer_round_trip(encoding):
+    target = Target()
+    with CompressingWriter(target, encoding) as writer:
+        for start in range(0, len(DATA), 70000):
+            writer.write(DATA[start:start + 70000])
+        assert writer.tell() == len(DATA)
+    assert decompressing_reader(io.BytesIO(target.result), encoding).read() == DATA
+
+
+def test_writer_aborts_the_target_on_error():
+    target = Target()
+    with pytest.raises(RuntimeError):
+        with CompressingWriter(target, "gzip") as writer:
+            writer.write(b"partial")
+            raise RuntimeError("export failed")
+    assert target.aborted
+
+
+def test_compressible_types_and_settings():
+    assert is_compressible("text/csv; charset=utf-8")
+    assert is_compressible("application/x-ndjson")
+    assert not is_compressible("image/png")
+    assert not is_compressible(None)
+    assert resolve_encoding("off") is None
+    assert resolve_encoding(" GZIP ") == "gzip"
+    assert resolve_encoding("brotli") is None
+
+
+def body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def test_download_file_decompresses_with_a_single_get(s3, tmp_path):
+    manager, stubber = s3
+    text = b"hello world\n" * 100
+    stored = compress_bytes(text, "gzip")
+    # No head_object is stubbed: the Stubber fails on any request besides this GET
+    stubber.add_response("get_object", {"Body": body(stored), "ContentEncoding": "gzip",
+                                        "ContentLength": len(stored)},
+                         {"Bucket": "bucket", "Key": "notes.txt"})
+    path = tmp_path / "notes.txt"
+    assert manager.download_file("notes.txt", str(path))
+    assert path.read_bytes() == text
+
+
+def test_download_file_plain_object(s3, tmp_path):
+    manager, stubber = s3
+    stubber.add_response("get_object", {"Body": body(b"plain"), "ContentLength": 5},
+                         {"Bucket": "bucket", "Key": "plain.bin"})
+    path = tmp_path / "plain.bin"
+    assert manager.download_file("plain.bin", str(path))
+    assert path.read_bytes() == b"plain"
+
+
+def test_replacing_copy_keeps_the_source_encoding(s3):
+    manager, stubber = s3
+    stubber.add_response("head_object", {"ContentLength": 10, "ContentEncoding": "gzip",
+                                         "Metadata": {"content-encoding": "gzip", "uncompressed-size": "42"}},
+                         {"Bucket": "bucket", "Key": "notes.txt"})
+    stubber.add_response("copy_object", {}, {
+        "Bucket": "bucket", "Key": "notes.txt", "CopySource": {"Bucket": "bucket", "Key": "notes.txt"},
+        "MetadataDirective": "REPLACE", "ContentType": "text/markdown",
+        "Metadata": {"content-encoding": "gzip", "uncompressed-size": "42", "owner": "me"},
+        "ContentEncoding": "gzip"})
+    manager._copy_object("notes.txt", "notes.txt", size=10, metadata={"owner": "me"}, content_type="text/markdown")
@@ -0,0 +1,12 @@
+import content_index
+from content_index import get_executor, submit_extraction
+
+
+def test_extraction_pool_does_not_fork(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("extracted in a worker")
+    assert get_executor()._mp_context.get_start_method() != "fork"
+    assert [f.result(timeout=60) for f in submit_extraction(str(path))] == ["extracted in a worker"]
+    content_index._executor.shutdown()
+    content_index._executor = None
+
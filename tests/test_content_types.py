@@ -0,0 +1,57 @@
+import pytest
+
+from content_types import detect_content_type, disposition_for, read_head, sniff_content_type
+
+PDF = b"%PDF-1.7\n" + b"\0" * 60
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 60
+ZIP = b"PK\x03\x04" + b"\0" * 60
+
+
+@pytest.mark.parametrize("head, expected", [
+    (PDF, "application/pdf"),
+    (PNG, "image/png"),
+    (b"\xff\xd8\xff\xe0" + b"\0" * 60, "image/jpeg"),
+    (b"RIFF\0\0\0\0WEBPVP8 ", "image/webp"),
+    (b"\0\0\0\x18ftypmp42", "video/mp4"),
+    (b"\0\0\0\x14ftypqt  ", "video/quicktime"),
+    (ZIP, "application/zip"),
+    (b"plain text", None),
+    (None, None),
+])
+def test_sniff(head, expected):
+    assert sniff_content_type(head) == expected
+
+
+def test_declared_type_wins_unless_generic():
+    assert detect_content_type("scan.bin", PDF, declared="image/tiff") == "image/tiff"
+    assert detect_content_type("scan.bin", PDF, declared="application/octet-stream") == "application/pdf"
+
+
+def test_magic_bytes_win_over_the_extension():
+    assert detect_content_type("photo.pdf", PNG) == "image/png"
+
+
+def test_containers_defer_to_the_extension():
+    docx = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    assert detect_content_type("report.docx", ZIP) == docx
+    assert detect_content_type("archive.unknownext", ZIP) == "application/zip"
+
+
+def test_extension_then_octet_stream():
+    assert detect_content_type("notes.md") == "text/markdown"
+    assert detect_content_type("blob") == "application/octet-stream"
+
+
+def test_disposition():
+    assert disposition_for("application/pdf", "a.pdf") == 'inline; filename="a.pdf"'
+    assert disposition_for("application/zip", "a.zip") == 'attachment; filename="a.zip"'
+    assert disposition_for("text/plain; charset=utf-8") == "inline"
+    assert disposition_for("text/plain", 'résumé "v2".txt') == \
+        """inline; filename="rsum v2.txt"; filename*=UTF-8''r%C3%A9sum%C3%A9%20%22v2%22.txt"""
+
+
+def test_read_head(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(PDF * 2)
+    assert read_head(str(path)) == (PDF * 2)[:64]
+    assert read_head(str(tmp_path / "missing")) is None
@@ -0,0 +1,51 @@
+import gzip
+import json
+
+from crawl_pack import pack_pages, read_page, unpack_pages
+
+PAGES = [
+    {"url": "https://example.com/", "title": "Home", "depth": 0, "content": "welcome", "links": ["https://a"]},
+    {"url": "https://example.com/ü", "title": "Ünïcode", "depth": 1, "content": "naïve café " * 100, "links": []},
+    {"url": "https://example.com/empty", "title": None, "depth": 2, "content": "", "links": []},
+]
+
+
+class RangeReader:
+    """Serves download_range from an in-memory pack, like S3's inclusive byte ranges."""
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def download_range(self, key, start, end):
+        self.requests.append((key, start, end))
+        return self.data[start:end + 1]
+
+
+def test_offsets_round_trip_each_page():
+    data, index = pack_pages(PAGES)
+    reader = RangeReader(data)
+    for page, entry in zip(PAGES, index):
+        assert read_page(reader, "pack", entry) == page
+        assert {k: entry[k] for k in ("url", "title", "depth")} == {k: page[k] for k in ("url", "title", "depth")}
+    # One ranged GET per page
+    assert len(reader.requests) == len(PAGES)
+
+
+def test_members_are_contiguous_and_the_pack_is_plain_gzip_jsonl():
+    data, index = pack_pages(PAGES)
+    assert index[0]["offset"] == 0
+    assert all(a["offset"] + a["length"] == b["offset"] for a, b in zip(index, index[1:]))
+    assert index[-1]["offset"] + index[-1]["length"] == len(data)
+    assert [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines()] == PAGES
+    assert unpack_pages(data) == PAGES
+
+
+def test_identical_pages_pack_identically():
+    assert pack_pages(PAGES)[0] == pack_pages(PAGES)[0]
+    assert pack_pages([]) == (b"", [])
+
+
+def test_unreadable_range_returns_none():
+    _, index = pack_pages(PAGES)
+    assert read_page(RangeReader(b""), "pack", index[0]) is None
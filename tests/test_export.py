@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import ANY
+
+from export import export_documents, export_for_download
+
+DOCUMENTS = [
+    {"doc_id": f"d{i}", "name": f"Doc {i}", "tags": ["a", "b"], "flags": [],
+     "created_at": datetime(2026, 1, i + 1),
+     "files": [{"filename": f"f{i}.pdf", "size": 10 * i}]}
+    for i in range(5)
+]
+
+
+class FakeMongo:
+    """Yields the documents in batches, noting how much was written before each batch."""
+
+    def __init__(self, documents, sink=None):
+        self.documents = documents
+        self.sink = sink
+        self.written_before_batch = []
+        self.calls = []
+
+    def iter_find(self, collection_name, filter={}, projection=None, batch_size=1000, sort=None, **read_options):
+        self.calls.append({"filter": filter, "projection": projection, "batch_size": batch_size, "sort": sort})
+        for start in range(0, len(self.documents), batch_size):
+            if self.sink is not None:
+                self.written_before_batch.append(self.sink.tell())
+            yield self.documents[start:start + batch_size]
+
+
+def test_batches_are_written_before_the_next_is_fetched():
+    sink = io.BytesIO()
+    mongo = FakeMongo(DOCUMENTS, sink)
+    assert export_documents(mongo, {"flags": "Review"}, "jsonl", sink, sort=[("name", 1)], batch_size=2) == 5
+    assert mongo.calls == [{"filter": {"flags": "Review"}, "projection": "export", "batch_size": 2,
+                            "sort": [("name", 1)]}]
+    # Three batches, each fetched only after the previous one reached the sink
+    before = mongo.written_before_batch
+    assert len(before) == 3 and before[0] == 0 and before[0] < before[1] < before[2] < len(sink.getvalue())
+
+
+def test_jsonl_keeps_nested_documents():
+    sink = io.BytesIO()
+    export_documents(FakeMongo(DOCUMENTS), {}, "jsonl", sink, batch_size=2)
+    lines = [json.loads(line) for line in sink.getvalue().decode("utf-8").splitlines()]
+    assert [line["doc_id"] for line in lines] == ["d0", "d1", "d2", "d3", "d4"]
+    assert lines[1]["created_at"] == "2026-01-02T00:00:00"
+    assert lines[1]["files"] == [{"filename": "f1.pdf", "size": 10}]
+
+
+def test_csv_flattens_documents():
+    pytest.importorskip("pyarrow")
+    sink = io.BytesIO()
+    export_documents(FakeMongo(DOCUMENTS), {}, "csv", sink, batch_size=2)
+    rows = list(csv.DictReader(io.StringIO(sink.getvalue().decode("utf-8"))))
+    assert [row["doc_id"] for row in rows] == ["d0", "d1", "d2", "d3", "d4"]
+    assert rows[1]["tags"] == "a; b"
+    assert rows[1]["flags"] == ""
+    assert rows[1]["filenames"] == "f1.pdf"
+    assert rows[1]["file_count"] == "1" and rows[1]["total_size"] == "10"
+
+
+def test_empty_csv_still_has_a_header():
+    pytest.importorskip("pyarrow")
+    sink = io.BytesIO()
+    assert export_documents(FakeMongo([]), {}, "csv", sink) == 0
+    assert sink.getvalue().decode("utf-8").startswith('"doc_id","name"')
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export_documents(FakeMongo(DOCUMENTS), {}, "xml", io.BytesIO())
+
+
+def test_small_exports_stay_in_memory():
+    # The S3 client is not touched
+    data, key, count = export_for_download(FakeMongo(DOCUMENTS), None, {}, "jsonl", total=5, inline_limit=5)
+    assert key is None and count == 5
+    assert len(data.splitlines()) == 5
+
+
+def stub_upload_start(stubber):
+    stubber.add_response("create_multipart_upload", {"UploadId": "u1"}, {
+        "Bucket": "bucket", "Key": "exports/out.jsonl", "ContentType": "application/x-ndjson",
+        "ContentDisposition": ANY})
+
+
+def stub_part(stubber, number):
+    stubber.add_response("upload_part", {"ETag": f'"e{number}"'}, {
+        "Bucket": "bucket", "Key": "exports/out.jsonl", "UploadId": "u1", "PartNumber": number, "Body": ANY})
+
+
+def test_large_exports_stream_to_a_multipart_upload(s3):
+    manager, stubber = s3
+    manager.UPLOAD_STREAM_PART_SIZE = 200
+    expected = io.BytesIO()
+    export_documents(FakeMongo(DOCUMENTS), {}, "jsonl", expected)
+    parts = -(-len(expected.getvalue()) // 200)
+    assert parts > 1
+
+    stub_upload_start(stubber)
+    for number in range(1, parts + 1):
+        stub_part(stubber, number)
+    stubber.add_response("complete_multipart_upload", {}, {
+        "Bucket": "bucket", "Key": "exports/out.jsonl", "UploadId": "u1",
+        "MultipartUpload": {"Parts": [{"PartNumber": n, "ETag": f'"e{n}"'} for n in range(1, parts + 1)]}})
+    data, key, count = export_for_download(FakeMongo(DOCUMENTS), manager, {}, "jsonl", total=5, inline_limit=4,
+                                           key="exports/out.jsonl", batch_size=2)
+    assert (data, key, count) == (None, "exports/out.jsonl", 5)
+
+
+def test_failed_part_aborts_the_export_upload(s3):
+    manager, stubber = s3
+    manager.UPLOAD_STREAM_PART_SIZE = 200
+    stub_upload_start(stubber)
+    stub_part(stubber, 1)
+    stubber.add_client_error("upload_part", "InternalError", http_status_code=500)
+    stubber.add_response("abort_multipart_upload", {}, {
+        "Bucket": "bucket", "Key": "exports/out.jsonl", "UploadId": "u1"})
+    with pytest.raises(ClientError):
+        export_for_download(FakeMongo(DOCUMENTS), manager, {}, "jsonl", total=5, inline_limit=4,
+                            key="exports/out.jsonl", batch_size=2)
@@ -0,0 +1,58 @@
+import random
+
+from near_duplicates import (FINGERPRINT_BITS, NearDuplicateIndex, canonical_url, hamming_distance,
+                             simhash)
+
+
+def page_text(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(f"word{rng.randrange(500)}" for _ in range(words))
+
+
+def flip_bits(fingerprint, bits):
+    for bit in bits:
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def test_canonical_url_drops_fragment_and_tracking_parameters():
+    assert canonical_url("https://example.com/a?utm_source=x&id=3&gclid=abc#top") == "https://example.com/a?id=3"
+    assert canonical_url("https://example.com/a?UTM_Campaign=y") == "https://example.com/a"
+    assert canonical_url("https://example.com/a?q=") == "https://example.com/a?q="
+
+
+def test_simhash_close_for_small_edits_and_none_for_short_text():
+    text = page_text(1)
+    words = text.split()
+    edited = " ".join(words[:150] + ["changed"] + words[151:])
+    assert hamming_distance(simhash(text), simhash(edited)) <= 6
+    assert hamming_distance(simhash(text), simhash(page_text(2))) > 6
+    assert simhash("too short to fingerprint") is None
+
+
+def test_bands_find_every_fingerprint_within_max_distance():
+    # Pigeonhole: max_distance flipped bits leave at least one of the max_distance + 1 bands intact
+    rng = random.Random(7)
+    for _ in range(200):
+        fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+        index = NearDuplicateIndex(max_distance=6)
+        index.add(fingerprint, "page")
+        near = flip_bits(fingerprint, rng.sample(range(FINGERPRINT_BITS), 6))
+        assert index.find(near) == "page"
+        far = flip_bits(fingerprint, rng.sample(range(FINGERPRINT_BITS), 20))
+        assert index.find(far) is None
+
+
+def test_add_collapses_duplicates_and_ignores_unfingerprinted_pages():
+    index = NearDuplicateIndex()
+    assert index.add(0b1011, "first") is None
+    assert index.add(0b1010, "second") == "first"
+    assert index.add(None, "short") is None
+    assert index.collapsed == 1
+
+
+def test_bands_cover_all_bits():
+    for max_distance in (0, 3, 6, 10):
+        index = NearDuplicateIndex(max_distance)
+        assert len(index._bands) == max_distance + 1
+        assert sum(bin(mask).count("1") for _, mask in index._bands) == FINGERPRINT_BITS
@@ -0,0 +1,36 @@
+import threading
+from types import SimpleNamespace
+
+from metrics import MongoCommandTimer, instrument
+from profiling import RerunProfiler, changed_keys
+
+
+@instrument("s3")
+def s3_call():
+    return True
+
+
+def test_rerun_counts_only_its_own_calls(tmp_path):
+    other_thread = threading.Thread(target=lambda: [s3_call() for _ in range(5)])
+    with RerunProfiler(out_dir=str(tmp_path)) as profiler:
+        s3_call()
+        s3_call()
+        # Another session's work while the rerun runs
+        other_thread.start()
+        other_thread.join()
+        MongoCommandTimer().succeeded(SimpleNamespace(duration_micros=2000, command_name="find"))
+    assert profiler.result["s3_calls"] == 2
+    assert profiler.result["mongo_commands"] == 1
+    assert profiler.result["mongo_server_s"] == 0.002
+    assert (tmp_path / "reruns.jsonl").exists()
+
+
+def test_calls_after_the_rerun_are_not_counted(tmp_path):
+    with RerunProfiler(out_dir=str(tmp_path)) as profiler:
+        pass
+    s3_call()
+    assert profiler.result["s3_calls"] == 0
+
+
+def test_changed_keys():
+    assert changed_keys({"a": 1, "b": 2}, {"a": 1, "b": 3, "c": 4}) == ["b", "c"]
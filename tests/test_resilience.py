@@ -0,0 +1,173 @@
+import time
+
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from pymongo.errors import AutoReconnect, DuplicateKeyError, OperationFailure, ServerSelectionTimeoutError
+
+import resilience
+from resilience import (AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, DeadlineExceeded, RetryPolicy,
+                        THROTTLED, TRANSIENT)
+from mongodb_client import mongo_error_kind, mongo_write_not_applied
+from s3_file_manager import S3FileManager, s3_error_kind
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+
+
+def failing(exc):
+    def call():
+        raise exc
+    return call
+
+
+def open_breaker(reset_timeout=0.0):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = open_breaker(reset_timeout=60)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_half_open_allows_one_trial():
+    breaker = open_breaker()
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = open_breaker()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_retry_policy_retries_transient_errors():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise AutoReconnect("blip")
+        return "ok"
+
+    assert RetryPolicy("test", mongo_error_kind, max_attempts=4).call("flaky", flaky) == "ok"
+    assert len(attempts) == 3
+
+
+def test_retry_policy_does_not_retry_unclassified_errors():
+    attempts = []
+
+    def bad():
+        attempts.append(1)
+        raise DuplicateKeyError("dup")
+
+    with pytest.raises(DuplicateKeyError):
+        RetryPolicy("test", mongo_error_kind).call("bad", bad)
+    assert len(attempts) == 1
+
+
+def test_retry_if_blocks_unsafe_writes():
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        raise AutoReconnect("sent, maybe applied")
+
+    with pytest.raises(AutoReconnect):
+        RetryPolicy("test", mongo_error_kind).call("write", write, retry_if=mongo_write_not_applied)
+    assert len(attempts) == 1
+
+
+def test_throttle_slows_the_limiter():
+    limiter = AdaptiveRateLimiter("test", max_rate=100)
+    policy = RetryPolicy("test", mongo_error_kind, limiter=limiter)
+    calls = []
+
+    def throttled_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationFailure("rate", code=16500)
+        return "ok"
+
+    assert policy.call("op", throttled_once) == "ok"
+    assert limiter.rate == 51.0
+
+
+def test_deadline_stops_retries():
+    policy = RetryPolicy("test", mongo_error_kind, max_attempts=100, timeout=0.001)
+    with pytest.raises(DeadlineExceeded):
+        policy.call("op", failing(AutoReconnect("down")))
+
+
+def test_limiter_deadline_does_not_strand_half_open_trial():
+    breaker = open_breaker()
+    limiter = AdaptiveRateLimiter("test", min_rate=0.001)
+    limiter.rate = 0.001
+    policy = RetryPolicy("test", mongo_error_kind, timeout=0.01, limiter=limiter, breaker=breaker)
+    with pytest.raises(DeadlineExceeded):
+        policy.call("op", lambda: "ok", bulk=True)
+    # The trial was never taken, so the next call may still run it
+    limiter.rate = None
+    assert policy.call("op", lambda: "ok", bulk=True) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_s3_bulk_call_unclassified_error_releases_trial():
+    manager = S3FileManager.__new__(S3FileManager)
+    manager.bulk_breaker = open_breaker()
+    missing = ClientError({"Error": {"Code": "NoSuchKey"}, "ResponseMetadata": {"HTTPStatusCode": 404}}, "CopyObject")
+    with pytest.raises(ClientError):
+        manager._bulk_call(failing(missing))
+    assert manager.bulk_breaker.state == "closed"
+    assert manager._bulk_call(lambda: "ok") == "ok"
+
+
+def test_error_classification():
+    slow_down = ClientError({"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}}, "PutObject")
+    internal = ClientError({"Error": {"Code": "InternalError"}, "ResponseMetadata": {"HTTPStatusCode": 500}}, "PutObject")
+    assert s3_error_kind(slow_down) == THROTTLED
+    assert s3_error_kind(internal) == TRANSIENT
+    assert mongo_error_kind(ServerSelectionTimeoutError("no primary")) == TRANSIENT
+    assert mongo_write_not_applied(ServerSelectionTimeoutError("no primary"))
+    assert not mongo_write_not_applied(AutoReconnect("connection reset"))
+    assert mongo_error_kind(ValueError()) is None
+
+
+def test_s3_deadline_stops_botocore_retries(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SECRET_KEY", "test")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setenv("S3_MAX_ATTEMPTS", "1000")
+    monkeypatch.setenv("S3_OPERATION_TIMEOUT", "0.1")
+    manager = S3FileManager()
+    attempts = []
+
+    def slow_down(request, **kwargs):
+        # Each attempt uses 0.03s of the budget and is throttled
+        attempts.append(request.url)
+        started = time.monotonic()
+        while time.monotonic() - started < 0.03:
+            pass
+        response = AWSResponse(request.url, 503, {}, None)
+        response._content = b"<Error><Code>SlowDown</Code></Error>"
+        return response
+
+    manager.s3_client.meta.events.register("before-send.s3", slow_down)
+    with pytest.raises(DeadlineExceeded):
+        manager.s3_client.head_object(Bucket="bucket", Key="key")
+    # Retried, but stopped at the deadline long before S3_MAX_ATTEMPTS
+    assert 2 <= len(attempts) < 10
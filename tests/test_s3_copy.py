@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+import s3_file_manager
+
+SOURCE = {"Bucket": "bucket", "Key": "docs/big.bin"}
+
+
+@pytest.fixture
+def small_parts(s3, monkeypatch):
+    """Multipart copies from 100 bytes in 40-byte parts, copied one at a time in order."""
+    manager, stubber = s3
+    manager.MULTIPART_COPY_THRESHOLD = 100
+    manager.MULTIPART_COPY_PART_SIZE = 40
+    monkeypatch.setattr(s3_file_manager, "ThreadPoolExecutor", lambda max_workers: ThreadPoolExecutor(1))
+    return manager, stubber
+
+
+def copy_params(**params):
+    return {"Bucket": "bucket", "Key": "docs/big.bin", "CopySource": SOURCE, **params}
+
+
+def test_replacing_copy_skips_head_when_everything_is_known(s3):
+    manager, stubber = s3
+    stubber.add_response("copy_object", {}, copy_params(
+        MetadataDirective="REPLACE", Metadata={"owner": "me"}, ContentType="text/plain",
+        ContentDisposition="inline"))
+    manager._copy_object("docs/big.bin", "docs/big.bin", size=10, metadata={"owner": "me"},
+                         content_type="text/plain", content_disposition="inline", content_encoding="")
+
+
+def test_replacing_copy_heads_when_the_encoding_is_unknown(s3):
+    manager, stubber = s3
+    stubber.add_response("head_object", {"ContentLength": 10, "ContentEncoding": "gzip"}, SOURCE)
+    stubber.add_response("copy_object", {}, copy_params(
+        MetadataDirective="REPLACE", Metadata={"owner": "me", "content-encoding": "gzip"},
+        ContentEncoding="gzip", ContentType="text/plain"))
+    manager._copy_object("docs/big.bin", "docs/big.bin", size=10, metadata={"owner": "me"},
+                         content_type="text/plain")
+
+
+def test_plain_copy_needs_no_head(s3):
+    manager, stubber = s3
+    stubber.add_response("copy_object", {}, copy_params(Key="docs/copy.bin"))
+    manager._copy_object("docs/big.bin", "docs/copy.bin")
+
+
+def stub_multipart_start(stubber, size):
+    stubber.add_response("head_object", {"ContentLength": size, "ContentType": "application/pdf",
+                                         "Metadata": {"owner": "me"}}, SOURCE)
+    stubber.add_response("create_multipart_upload", {"UploadId": "u1"}, {
+        "Bucket": "bucket", "Key": "docs/copy.bin", "Metadata": {"owner": "me"},
+        "ContentType": "application/pdf"})
+
+
+def stub_part(stubber, number, byte_range):
+    stubber.add_response("upload_part_copy", {"CopyPartResult": {"ETag": f'"e{number}"'}}, {
+        "Bucket": "bucket", "Key": "docs/copy.bin", "UploadId": "u1", "PartNumber": number,
+        "CopySource": SOURCE, "CopySourceRange": byte_range})
+
+
+def test_multipart_copy_at_the_threshold_copies_ranges(small_parts):
+    manager, stubber = small_parts
+    stub_multipart_start(stubber, 100)
+    # The last part is the remainder; ranges are inclusive
+    for number, byte_range in [(1, "bytes=0-39"), (2, "bytes=40-79"), (3, "bytes=80-99")]:
+        stub_part(stubber, number, byte_range)
+    stubber.add_response("complete_multipart_upload", {}, {
+        "Bucket": "bucket", "Key": "docs/copy.bin", "UploadId": "u1",
+        "MultipartUpload": {"Parts": [{"PartNumber": n, "ETag": f'"e{n}"'} for n in (1, 2, 3)]}})
+    manager._copy_object("docs/big.bin", "docs/copy.bin", size=100)
+
+
+def test_multipart_copy_below_the_threshold_is_a_single_copy(small_parts):
+    manager, stubber = small_parts
+    stubber.add_response("copy_object", {}, copy_params(Key="docs/copy.bin"))
+    manager._copy_object("docs/big.bin", "docs/copy.bin", size=99)
+
+
+def test_failed_part_aborts_the_multipart_copy(small_parts):
+    manager, stubber = small_parts
+    stub_multipart_start(stubber, 120)
+    stub_part(stubber, 1, "bytes=0-39")
+    stub_part(stubber, 2, "bytes=40-79")
+    stubber.add_client_error("upload_part_copy", "InternalError", http_status_code=500)
+    stubber.add_response("abort_multipart_upload", {}, {
+        "Bucket": "bucket", "Key": "docs/copy.bin", "UploadId": "u1"})
+    with pytest.raises(ClientError):
+        manager._copy_object("docs/big.bin", "docs/copy.bin", size=120)
+
+
+def test_oversized_copy_of_unknown_size_falls_back_to_multipart(small_parts):
+    manager, stubber = small_parts
+    stubber.add_client_error("copy_object", "InvalidRequest", http_status_code=400,
+                             expected_params=copy_params(Key="docs/copy.bin"))
+    stub_multipart_start(stubber, 150)
+    for number, byte_range in [(1, "bytes=0-39"), (2, "bytes=40-79"), (3, "bytes=80-119"), (4, "bytes=120-149")]:
+        stub_part(stubber, number, byte_range)
+    stubber.add_response("complete_multipart_upload", {}, {
+        "Bucket": "bucket", "Key": "docs/copy.bin", "UploadId": "u1",
+        "MultipartUpload": {"Parts": [{"PartNumber": n, "ETag": f'"e{n}"'} for n in (1, 2, 3, 4)]}})
+    manager._copy_object("docs/big.bin", "docs/copy.bin")
@@ -0,0 +1,89 @@
+import json
+
+from s3_listing import PrefixManifest
+
+
+class FakeS3:
+    def __init__(self, keys):
+        self.keys = keys
+        self.listed = []
+
+    def list_prefixes(self, prefix, delimiter="/"):
+        sub_prefixes = sorted({prefix + key[len(prefix):].split(delimiter)[0] + delimiter
+                               for key in self.keys if delimiter in key[len(prefix):]})
+        return sub_prefixes, [self._object(key) for key in self.keys if delimiter not in key[len(prefix):]]
+
+    def iter_files_parallel(self, prefix, delimiter="/", max_workers=16, prefixes=None):
+        for sub_prefix in prefixes:
+            self.listed.append(sub_prefix)
+            yield sub_prefix, [self._object(key) for key in self.keys if key.startswith(sub_prefix)]
+
+    @staticmethod
+    def _object(key):
+        return {"Key": key, "Size": 1, "ETag": "e", "LastModified": "2026-01-01T00:00:00"}
+
+
+def test_refresh_lists_only_new_sub_prefixes():
+    s3 = FakeS3(["docs/index.json", "docs/a/1.pdf", "docs/b/2.pdf"])
+    manifest = PrefixManifest(s3, "docs/")
+    assert manifest.refresh() == {"listed": 2, "reused": 0, "removed": 0}
+    assert [o["Key"] for o in manifest.iter_objects()] == ["docs/index.json", "docs/a/1.pdf", "docs/b/2.pdf"]
+
+    s3.keys.append("docs/c/3.pdf")
+    s3.listed.clear()
+    assert manifest.refresh() == {"listed": 1, "reused": 2, "removed": 0}
+    assert s3.listed == manifest.relisted == ["docs/c/"]
+
+
+def test_invalidate_marks_the_sub_prefix_dirty():
+    s3 = FakeS3(["docs/a/1.pdf", "docs/b/2.pdf"])
+    manifest = PrefixManifest(s3, "docs/")
+    manifest.refresh()
+    s3.keys.append("docs/a/3.pdf")
+    manifest.invalidate("docs/a/3.pdf")
+    # Keys outside the prefix or directly under it are ignored
+    manifest.invalidate("other/a/1.pdf")
+    manifest.invalidate("docs/root.pdf")
+
+    s3.listed.clear()
+    assert manifest.refresh()["listed"] == 1
+    assert s3.listed == ["docs/a/"]
+    assert [o["Key"] for o in manifest.iter_objects("docs/a/")] == ["docs/a/1.pdf", "docs/a/3.pdf"]
+    assert not manifest.entries["docs/a/"]["dirty"]
+
+
+def test_max_age_relists_expired_sub_prefixes():
+    s3 = FakeS3(["docs/a/1.pdf", "docs/b/2.pdf"])
+    manifest = PrefixManifest(s3, "docs/", max_age=60)
+    manifest.refresh()
+    manifest.entries["docs/a/"]["listed_at"] -= 61
+
+    s3.listed.clear()
+    assert manifest.refresh() == {"listed": 1, "reused": 1, "removed": 0}
+    assert s3.listed == ["docs/a/"]
+
+
+def test_removed_sub_prefixes_are_dropped():
+    s3 = FakeS3(["docs/a/1.pdf", "docs/b/2.pdf"])
+    manifest = PrefixManifest(s3, "docs/")
+    manifest.refresh()
+    s3.keys.remove("docs/b/2.pdf")
+
+    assert manifest.refresh() == {"listed": 0, "reused": 1, "removed": 1}
+    assert manifest.sub_prefixes() == ["docs/a/"]
+    assert [o["Key"] for o in manifest.iter_objects()] == ["docs/a/1.pdf"]
+
+
+def test_manifest_persists_between_instances(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    s3 = FakeS3(["docs/a/1.pdf"])
+    PrefixManifest(s3, "docs/", path=path).refresh()
+    with open(path) as f:
+        assert json.load(f)["prefix"] == "docs/"
+
+    s3.listed.clear()
+    manifest = PrefixManifest(s3, "docs/", path=path)
+    assert manifest.refresh() == {"listed": 0, "reused": 1, "removed": 0}
+    assert s3.listed == []
+    # A manifest of another prefix is not reused
+    assert PrefixManifest(s3, "blobs/", path=path).entries == {}
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from pymongo import UpdateMany
+
+from search import build_bulk_edit
+
+NOW = datetime(2026, 1, 1)
+FILTER = {"doc_id": {"$in": ["a", "b"]}}
+
+
+def test_additions_then_removals_as_separate_updates():
+    operations = build_bulk_edit(FILTER, add_flags=["Review"], remove_flags=["Ignore"], add_tags=["x", "y"],
+                                 remove_tags=["z"], now=NOW)
+    assert operations == [
+        UpdateMany(FILTER, {"$addToSet": {"flags": {"$each": ["Review"]}, "tags": {"$each": ["x", "y"]}},
+                            "$set": {"updated_at": NOW}}),
+        UpdateMany(FILTER, {"$pull": {"flags": {"$in": ["Ignore"]}, "tags": {"$in": ["z"]}},
+                            "$set": {"updated_at": NOW}}),
+    ]
+
+
+def test_only_the_needed_operations():
+    assert build_bulk_edit(FILTER, add_tags=["x"], now=NOW) == [
+        UpdateMany(FILTER, {"$addToSet": {"tags": {"$each": ["x"]}}, "$set": {"updated_at": NOW}})]
+    assert build_bulk_edit(FILTER, remove_flags=["Use"], now=NOW) == [
+        UpdateMany(FILTER, {"$pull": {"flags": {"$in": ["Use"]}}, "$set": {"updated_at": NOW}})]
+
+
+def test_nothing_to_change():
+    assert build_bulk_edit(FILTER) == []
+    assert build_bulk_edit(FILTER, add_flags=[], remove_tags=[]) == []
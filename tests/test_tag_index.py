@@ -0,0 +1,38 @@
+from tag_index import SHORT_PREFIX_TOP, TagVocabulary
+
+COUNTS = {"invoice": 40, "invoices": 3, "internal": 12, "interview": 12, "legal": 7, "intern": 1}
+
+
+def test_suggest_ranks_prefix_matches_by_use_then_name():
+    vocabulary = TagVocabulary(COUNTS)
+    assert vocabulary.suggest("int") == ["internal", "interview", "intern"]
+    assert vocabulary.suggest("inv", limit=1) == ["invoice"]
+    assert vocabulary.suggest(" INV ") == ["invoice", "invoices"]
+    assert vocabulary.suggest("x") == []
+    assert vocabulary.suggest("zzz") == []
+
+
+def test_short_prefixes_use_the_precomputed_top_tags():
+    vocabulary = TagVocabulary(COUNTS)
+    assert vocabulary.suggest("i", limit=3) == ["invoice", "internal", "interview"]
+    assert vocabulary.suggest("", limit=2) == ["invoice", "internal"]
+
+
+def test_large_ranges_keep_the_most_used():
+    counts = {f"t{i:03d}": i for i in range(SHORT_PREFIX_TOP * 3)}
+    vocabulary = TagVocabulary(counts)
+    assert vocabulary.suggest("t1", limit=3) == ["t149", "t148", "t147"]
+
+
+def test_added_tags_are_suggested_before_the_next_refresh():
+    vocabulary = TagVocabulary(COUNTS)
+    vocabulary.add("inventory", 100)
+    assert vocabulary.suggest("inv") == ["inventory", "invoice", "invoices"]
+    assert "inventory" in vocabulary and len(vocabulary) == len(COUNTS) + 1
+
+
+def test_refresh_if_stale():
+    vocabulary = TagVocabulary(max_age=300)
+    assert vocabulary.refresh_if_stale(lambda: COUNTS)
+    assert not vocabulary.refresh_if_stale(lambda: {})
+    assert len(vocabulary) == len(COUNTS)
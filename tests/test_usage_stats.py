@@ -0,0 +1,48 @@
+from collections import Counter
+
+from usage_stats import UsageStats, document_counts
+
+
+class FakeMongo:
+    """Runs the $match/$group pipeline of bulk_edit_deltas over in-memory documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.pipelines = []
+
+    def aggregate(self, collection_name, pipeline, session=None):
+        self.pipelines.append(pipeline)
+        group = pipeline[1]["$group"]
+        row = {name: 0 for name in group if name != "_id"}
+        for document in self.documents:
+            for name in row:
+                test, when_present, when_absent = group[name]["$sum"]["$cond"]
+                value, array = test["$in"]
+                field = array["$ifNull"][0][1:]
+                row[name] += when_present if value in (document.get(field) or []) else when_absent
+        return [row] if self.documents else []
+
+
+def test_bulk_edit_deltas_counts_only_changed_documents():
+    mongo = FakeMongo([{"flags": ["Review"], "tags": ["a.b"]}, {"flags": [], "tags": []}, {}])
+    deltas = UsageStats(mongo).bulk_edit_deltas({}, add_flags=["Review"], remove_tags=["a.b"], add_tags=["new"])
+    assert deltas == Counter({("flag", "Review"): 2, ("tag", "new"): 3, ("tag", "a.b"): -1})
+    # One aggregation, whatever the number of values
+    assert len(mongo.pipelines) == 1
+
+
+def test_bulk_edit_deltas_removal_wins():
+    mongo = FakeMongo([{"tags": ["x"]}, {"tags": []}])
+    deltas = UsageStats(mongo).bulk_edit_deltas({}, add_tags=["x"], remove_tags=["x"])
+    assert deltas == Counter({("tag", "x"): -1})
+
+
+def test_bulk_edit_deltas_without_changes_skips_the_query():
+    mongo = FakeMongo([{}])
+    assert UsageStats(mongo).bulk_edit_deltas({}) == Counter()
+    assert mongo.pipelines == []
+
+
+def test_document_counts_count_each_value_once():
+    assert document_counts([{"tags": ["a", "a"], "flags": ["F"]}], sign=-1) == \
+        Counter({("tag", "a"): -1, ("flag", "F"): -1})
@@ -0,0 +1,229 @@
+"""
+Flag and tag usage counters, kept next to `documents` so dashboards and tag
+suggestions read one small collection instead of scanning every document.
+
+Counters are adjusted with $inc by the code paths that write documents and can
+drift (concurrent edits, failed writes, manual changes in Mongo). Run the full
+recompute periodically to repair them:
+
+    python usage_stats.py                 # recompute once
+    python usage_stats.py --every 3600    # recompute every hour
+"""
+# External imports
+import argparse
+import logging
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from pymongo import DeleteMany, UpdateOne
+
+from mongodb_client import AtlasClient
+from config import COLLECTION_NAME, COUNTERS_COLLECTION
+
+# Document fields that are counted, and the counter kind each maps to
+COUNTED_FIELDS = {"flags": "flag", "tags": "tag"}
+
+
+def counter_id(kind, value):
+    return f"{kind}:{value}"
+
+
+def document_counts(documents, sign=1):
+    """
+    Count the flags and tags of some documents.
+
+    Args:
+    documents: list - documents with `flags` and `tags` arrays
+    sign: int - 1 for inserted documents, -1 for deleted ones
+
+    Returns:
+    Counter: (kind, value) -> delta
+    """
+    deltas = Counter()
+    for document in documents:
+        for field, kind in COUNTED_FIELDS.items():
+            for value in set(document.get(field) or []):
+                deltas[(kind, value)] += sign
+    return deltas
+
+
+def _contains(field, value):
+    """Aggregation expression: whether a document's array field holds a value."""
+    return {"$in": [value, {"$ifNull": [f"${field}", []]}]}
+
+
+class UsageStats:
+    """
+    Per-flag and per-tag document counts in COUNTERS_COLLECTION, one counter
+    document per value: {_id: "tag:invoice", kind: "tag", value: "invoice", count: 12}.
+
+    Attributes:
+    -----------
+    mongo_client: AtlasClient
+        Client holding the counters.
+    collection_name: str
+        The counters collection.
+    on_change: callable
+        Called after counters were written, e.g. to invalidate local caches.
+
+    Methods:
+    --------
+    record_insert(documents)
+        Count newly inserted documents.
+    record_delete(documents)
+        Uncount deleted documents.
+    record_change(before, after)
+        Apply the difference between two versions of a document.
+    bulk_edit_deltas(filter, add_flags, remove_flags, add_tags, remove_tags, session)
+        Count the effect of a bulk edit, to apply once it is written.
+    counts(kind)
+        Values of a kind with their counts, most used first.
+    recompute()
+        Rebuild every counter from `documents`.
+    """
+
+    def __init__(self, mongo_client, collection_name=COUNTERS_COLLECTION, on_change=None):
+        self.mongo_client = mongo_client
+        self.collection_name = collection_name
+        self.on_change = on_change
+
+    def apply(self, deltas):
+        """
+        Write counter deltas with one bulk $inc.
+
+        Args:
+        deltas: Counter - (kind, value) -> delta
+
+        Returns:
+        bool: True if successful, False otherwise
+        """
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": counter_id(kind, value)},
+                {"$inc": {"count": delta}, "$set": {"kind": kind, "value": value, "updated_at": now}},
+                upsert=True,
+            )
+            for (kind, value), delta in deltas.items() if delta
+        ]
+        if not operations:
+            return True
+        try:
+            self.mongo_client.bulk_write(self.collection_name, operations, ordered=False)
+            if self.on_change:
+                self.on_change()
+            return True
+        except Exception as e:
+            # The document write already happened; the next recompute repairs the counters
+            logging.error(f"Failed to update usage counters: {e}")
+            return False
+
+    def record_insert(self, documents):
+        return self.apply(document_counts(documents))
+
+    def record_delete(self, documents):
+        return self.apply(document_counts(documents, sign=-1))
+
+    def record_change(self, before, after):
+        """Apply the flag/tag difference between two versions of one document."""
+        deltas = document_counts([after])
+        deltas.subtract(document_counts([before]))
+        return self.apply(deltas)
+
+    def bulk_edit_deltas(self, filter, add_flags=None, remove_flags=None, add_tags=None, remove_tags=None,
+                         session=None):
+        """
+        Count, with one aggregation, how many matching documents a bulk edit
+        changes per value. Call it just before the bulk write, with the same
+        arguments as search.build_bulk_edit and in the same session, and pass the
+        result to apply() once the write succeeded. A value that is both added and
+        removed ends up removed, matching the order of the bulk write.
+
+        Returns:
+        Counter: (kind, value) -> delta
+        """
+        changes = []
+        for field, kind, added, removed in (("flags", "flag", add_flags, remove_flags),
+                                            ("tags", "tag", add_tags, remove_tags)):
+            removed = set(removed or [])
+            for value in set(added or []) - removed:
+                changes.append((kind, value, 1, {"$cond": [_contains(field, value), 0, 1]}))
+            for value in removed:
+                changes.append((kind, value, -1, {"$cond": [_contains(field, value), 1, 0]}))
+        if not changes:
+            return Counter()
+        # Values may contain dots, so the group fields are numbered
+        rows = self.mongo_client.aggregate(COLLECTION_NAME, [
+            {"$match": filter},
+            {"$group": {"_id": None, **{f"c{i}": {"$sum": change[3]} for i, change in enumerate(changes)}}},
+        ], session=session)
+        deltas = Counter()
+        for i, (kind, value, sign, _) in enumerate(changes):
+            deltas[(kind, value)] += sign * (rows[0][f"c{i}"] if rows else 0)
+        return deltas
+
+    def counts(self, kind):
+        """
+        Values of a kind with their document counts, most used first.
+
+        Args:
+        kind: str - "flag" or "tag"
+
+        Returns:
+        dict: value -> count, for values used by at least one document
+        """
+        counters = self.mongo_client.aggregate(self.collection_name, [
+            {"$match": {"kind": kind, "count": {"$gt": 0}}},
+            {"$sort": {"count": -1, "value": 1}},
+            {"$project": {"_id": 0, "value": 1, "count": 1}},
+        ])
+        return {c["value"]: c["count"] for c in counters}
+
+    def recompute(self):
+        """
+        Rebuild every counter from `documents` and drop counters of unused values.
+
+        Returns:
+        int: number of counters written
+        """
+        started = datetime.utcnow()
+        operations = []
+        for field, kind in COUNTED_FIELDS.items():
+            for row in self.mongo_client.aggregate(COLLECTION_NAME, [
+                {"$project": {field: 1}},
+                {"$unwind": f"${field}"},
+                # A value listed twice in one document counts once, like document_counts
+                {"$group": {"_id": {"doc": "$_id", "value": f"${field}"}}},
+                {"$group": {"_id": "$_id.value", "count": {"$sum": 1}}},
+            ]):
+                operations.append(UpdateOne(
+                    {"_id": counter_id(kind, row["_id"])},
+                    {"$set": {"kind": kind, "value": row["_id"], "count": row["count"], "updated_at": started}},
+                    upsert=True,
+                ))
+        # Counters not refreshed above belong to values no document uses any more
+        operations.append(DeleteMany({"updated_at": {"$lt": started}}))
+        self.mongo_client.bulk_write(self.collection_name, operations)
+        return len(operations) - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--every", type=float, help="Recompute every N seconds instead of once.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stats = UsageStats(AtlasClient())
+    while True:
+        started = time.perf_counter()
+        written = stats.recompute()
+        logging.info(f"Recomputed {written} usage counters in {time.perf_counter() - started:.1f}s")
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())